@@ -13,7 +13,10 @@ Notes
 
 #------------- IMPORTS -------------#
 import os 
+import re
 import cv2
+import shutil
+import traceback
 import glob
 import matplotlib
 import numpy as np
@@ -23,6 +26,10 @@ from PIL import Image
 from tkinter import filedialog
 import matplotlib.pyplot as plt
 from PIL import ImageTk, Image
+from PIL.JpegImagePlugin import get_sampling
+import file_io
+import streaming
+from route_index import RouteIndex
 
 
 #------------- CLASSES -------------#
@@ -57,22 +64,290 @@ class _window_management_helper:
         plt.draw()
 
 
+class SunTracker:
+    """
+    Follows the sun through a sequence of frames. The next position is
+    predicted from the previous frames and only a region of interest
+    around it is searched; when the result is not trustworthy (the peak
+    sits on the edge of the region, the maximum is flat, or the peak
+    dims sharply as with an obstruction) the whole frame is searched.
+    Positions are kept as fractions of the frame size.
+    """
+
+    def __init__(self, window: float = None, min_contrast: float = None):
+        self.window = window or SUN_TRACK_WINDOW
+        """Side of the region of interest as a fraction of the frame width."""
+        self.min_contrast = min_contrast if min_contrast is not None else SUN_TRACK_MIN_CONTRAST
+        """Lowest peak contrast accepted inside the region of interest."""
+        self.positions = []
+        """Recent positions as (x, y) fractions of the frame size."""
+        self.contrast = None
+        """Peak contrast of the last tracked frame."""
+        self.tracked = 0
+        """Frames located inside the region of interest."""
+        self.searched = 0
+        """Frames that needed a full search."""
+
+    def reset(self):
+        """
+            Forget the motion history and the contrast reference, e.g. before an unrelated frame.
+        """
+
+        self.positions = []
+        self.contrast = None
+
+    def observe(self, x: float, y: float):
+        """
+            Record a position found elsewhere (e.g. from a cache) as the latest frame.
+        """
+
+        self.positions = self.positions[-1:] + [(x % 1.0, y)]
+
+    def predict(self):
+        """
+            Predicted (x, y) fractions of the next frame, or None without history.
+        """
+
+        if not self.positions:
+            return None
+        x, y = self.positions[-1]
+        if len(self.positions) > 1:
+            px, py = self.positions[-2]
+            # the frame wraps horizontally, so take the short way round
+            x += (x - px + 0.5) % 1.0 - 0.5
+            y += y - py
+        return x % 1.0, min(max(y, 0.0), 1.0)
+
+    def _search_window(self, image, prediction, radius, method, coarse_width, refine_scale):
+        """
+            Search the region of interest around a prediction.
+
+            **Returns**:
+
+            * maxLoc (tuple): location in image coordinates, or None if not trustworthy.
+
+        """
+
+        height, width = image.shape[:2]
+        half, pad = max(int(self.window * width / 2), 1), radius // 2
+        cx, cy = int(prediction[0] * width), int(prediction[1] * height)
+
+        cols = np.arange(cx - half - pad, cx + half + pad + 1) % width
+        y0, y1 = max(cy - half - pad, 0), min(cy + half + pad + 1, height)
+        crop = image[y0:y1][:, cols]
+
+        factor = max(1, width // (coarse_width or SUN_COARSE_WIDTH))
+        (lx, ly), contrast = _sun_peak(crop, radius, method, refine_scale=refine_scale, factor=factor)
+
+        # a peak in the padding means the sun left the window
+        inside_x = pad <= lx <= pad + 2 * half
+        inside_y = (y0 == 0 or ly >= cy - half - y0) and (y1 == height or ly <= cy + half - y0)
+        dimmed = self.contrast is not None and contrast < 0.5 * self.contrast
+        if not (inside_x and inside_y) or contrast < self.min_contrast or dimmed:
+            return None
+
+        self.contrast = contrast
+        return int(cols[lx]), y0 + ly
+
+    def locate(self, image, radius=701, method=None, coarse_width=None, refine_scale=None):
+        """
+            Locate the sun in the next frame of the sequence.
+
+            **Args**:
+
+            * image (numpy.array): BGR or grayscale pixel array.
+            * radius (int): size of blurring kernel.
+            * method (str): 'pyramid' or 'full', defaults to `SUN_LOCATE_METHOD`.
+            * coarse_width (int): see `locate_sun`.
+            * refine_scale (int): see `locate_sun`.
+
+            **Returns**:
+
+            * maxLoc (tuple): estimated location of Sun.
+
+        """
+
+        method = method or SUN_LOCATE_METHOD
+        height, width = image.shape[:2]
+
+        prediction = self.predict()
+        maxLoc = None
+        if prediction is not None:
+            maxLoc = self._search_window(image, prediction, radius, method, coarse_width, refine_scale)
+
+        if maxLoc is None:
+            maxLoc, _ = _sun_peak(image, radius, method, coarse_width, refine_scale)
+            # a jump breaks the motion model, so start the history afresh
+            self.positions = []
+            # re-base the contrast reference on a region of interest around the
+            # sun found, so a lasting change of brightness (cloud cover, a new
+            # exposure) does not keep failing the dimming check
+            self.contrast = None
+            self._search_window(image, (maxLoc[0] / width, maxLoc[1] / height), radius, method, coarse_width, refine_scale)
+            self.searched += 1
+        else:
+            self.tracked += 1
+
+        self.observe(maxLoc[0] / width, maxLoc[1] / height)
+        return maxLoc
+
+
 #------------- GLOBALS -------------#
+SUN_LOCATE_METHOD = 'pyramid'
+"""'pyramid' for the coarse-to-fine search, 'full' to blur the whole frame at full resolution."""
+SUN_COARSE_WIDTH = 480
+"""Width in pixels of the downsampled image searched first by the pyramid method."""
+SUN_REFINE_SCALE = 4
+"""Downsampling of the refinement window; 1 refines at full resolution."""
+SUN_DECODE_REDUCTION = 4
+"""JPGs are decoded at 1/2, 1/4 or 1/8 resolution (or 1, full) for sun detection."""
+ROLL_WORKERS = os.cpu_count() or 1
+"""Number of processes rolling images in parallel."""
+ROLL_MEMORY_BUDGET = None
+"""Bytes of full-resolution frames allowed in flight; None uses half of physical memory."""
+ROLL_JPEG_QUALITY = 'keep'
+"""JPEG quality of rolled images (1-95), or 'keep' to reuse the source's quantization tables."""
+ROLL_JPEG_FALLBACK_QUALITY = 95
+"""Quality used for 'keep' when the source is not a JPEG."""
+ROLL_JPEG_SUBSAMPLING = 'keep'
+"""Chroma subsampling of rolled images ('4:4:4', '4:2:2', '4:2:0') or 'keep' to match the source."""
+ROLL_JPEG_OPTIMIZE = False
+"""Optimize the Huffman tables of rolled images; smaller files for a slower encode."""
+ROLL_STRIP_ROWS = 256
+"""Rows moved at a time when rolling a frame in place."""
+SUN_TRACKING = True
+"""Roll images in sequence order, searching only around the sun's predicted position."""
+SUN_TRACK_WINDOW = 0.1
+"""Side of the tracking region of interest as a fraction of the frame width."""
+SUN_TRACK_MIN_CONTRAST = 0.05
+"""Lowest peak contrast trusted inside the tracking window before falling back to a full search."""
+SUN_CACHE = True
+"""Reuse sun positions cached in the roll directory for images that have not changed."""
+_STREAM_TRACKER = None
+"""`SunTracker` of a worker process of a streamed roll."""
+_OUTPUT_NAME = re.compile(r'^\d+_(?P<tag>.*)_new-time=')
+"""Name of a JPG written by `file_io.write_points`, capturing its source tag."""
 
 
 
 
 #------------- FUNCTIONS -------------#
-def locate_sun(image, radius=701, show=False):
+def _blur_sigma(ksize):
+    """
+        Standard deviation OpenCV derives for a Gaussian kernel of size
+        `ksize` when none is given.
+    """
+
+    return 0.3 * ((ksize - 1) * 0.5 - 1) + 0.8
+
+
+def _odd(value):
+    """
+        Nearest odd integer to `value`, at least 3.
+    """
+
+    return max(3, int(round(value)) // 2 * 2 + 1)
+
+
+def _gray(image):
+    """
+        Grayscale version of an image, accepting 2D arrays as they are.
+    """
+
+    return image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+
+def _sun_peak(image, radius, method, coarse_width=None, refine_scale=None, factor=None):
+    """
+        Brightest spot of an image after blurring, see `locate_sun`.
+
+        **Args**:
+
+        * image (numpy.array): BGR or grayscale pixel array.
+        * radius (int): size of blurring kernel.
+        * method (str): 'pyramid' or 'full'.
+        * coarse_width (int): width of the coarse search image.
+        * refine_scale (int): downsampling of the refinement window.
+        * factor (int): coarse downsampling; derived from `coarse_width` if None.
+
+        **Returns**:
+
+        * maxLoc (tuple): location of the brightest spot.
+        * contrast (float): how far the blurred peak stands above the median
+          of the blurred image, as a fraction of the peak; near 0 for a flat maximum.
+
+    """
+
+    height, width = image.shape[:2]
+    sigma = _blur_sigma(radius)
+    if factor is None:
+        factor = max(1, width // (coarse_width or SUN_COARSE_WIDTH))
+
+    def _contrast(blurred, peak):
+        return float(peak - np.median(blurred)) / max(float(peak), 1.0)
+
+    if method == 'full' or factor == 1:
+        # perform a naive attempt to find the (x, y) coordinates of
+        # the area of the image with the largest intensity value
+        # apply a Gaussian blur to the image then find the brightest
+        # region
+        blurred = cv2.GaussianBlur(_gray(image), (radius, radius), 0)
+        (minVal, maxVal, minLoc, maxLoc) = cv2.minMaxLoc(blurred)
+        return maxLoc, _contrast(blurred[::8, ::8], maxVal)
+
+    ## coarse: area-averaged copy with a proportionally scaled kernel ##
+    small = cv2.resize(image, (max(width // factor, 1), max(height // factor, 1)), interpolation=cv2.INTER_AREA)
+    coarse = cv2.GaussianBlur(_gray(small), (_odd(radius / factor), _odd(radius / factor)), sigma / factor)
+    (_, maxVal, _, (x, y)) = cv2.minMaxLoc(coarse)
+    contrast = _contrast(coarse, maxVal)
+    x, y = int((x + 0.5) * factor), int((y + 0.5) * factor)
+
+    ## fine: blur a window around the coarse peak, padded by the kernel ##
+    search, pad = 2 * factor, radius // 2
+    x0, x1 = max(x - search - pad, 0), min(x + search + pad + 1, width)
+    y0, y1 = max(y - search - pad, 0), min(y + search + pad + 1, height)
+    crop = _gray(image[y0:y1, x0:x1])
+
+    scale = max(1, refine_scale or SUN_REFINE_SCALE)
+    if scale > 1:
+        crop = cv2.resize(crop, (max((x1 - x0) // scale, 1), max((y1 - y0) // scale, 1)), interpolation=cv2.INTER_AREA)
+        blurred = cv2.GaussianBlur(crop, (_odd(radius / scale), _odd(radius / scale)), sigma / scale)
+    else:
+        blurred = cv2.GaussianBlur(crop, (radius, radius), 0)
+
+    # only the search window is trusted; the padding just feeds the kernel
+    wx0, wy0 = (max(x - search, 0) - x0) // scale, (max(y - search, 0) - y0) // scale
+    wx1, wy1 = (min(x + search + 1, width) - x0) // scale, (min(y + search + 1, height) - y0) // scale
+    window = blurred[wy0:max(wy1, wy0 + 1), wx0:max(wx1, wx0 + 1)]
+    (_, _, _, (wx, wy)) = cv2.minMaxLoc(window)
+    maxLoc = (
+        min(x0 + int((wx0 + wx + 0.5) * scale), width - 1),
+        min(y0 + int((wy0 + wy + 0.5) * scale), height - 1),
+    )
+    return maxLoc, contrast
+
+
+def locate_sun(image, radius=701, show=False, method=None, coarse_width=None, refine_scale=None):
     """
         Locate sun in image by blurring image and finding brightest spot.
         Physical obstructions in image may cause incorrect recovery.
+
+        With `method='pyramid'` the brightest spot is first found on a copy
+        downsampled to `coarse_width` pixels, blurred with a proportionally
+        scaled kernel, and then refined in a small window around it. The
+        window is blurred with the full kernel after downsampling by
+        `refine_scale`; with `refine_scale=1` it is refined at full
+        resolution and matches `method='full'` whenever the coarse search
+        lands on the same peak.
     
         **Args**:
     
         * image (PIL.Image/cv2.Image/numpy.array): image object or pixel array
         * radius (int): size of blurring kernel
         * show (bool): show the extraction location on the image
+        * method (str): 'pyramid' or 'full', defaults to `SUN_LOCATE_METHOD`
+        * coarse_width (int): width of the coarse search image, defaults to `SUN_COARSE_WIDTH`
+        * refine_scale (int): downsampling of the refinement window, defaults to `SUN_REFINE_SCALE`
     
         **Returns**:
     
@@ -84,18 +359,15 @@ def locate_sun(image, radius=701, show=False):
     
 
     print(f"Locating sun in image.")
-    orig = image.copy()
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    method = method or SUN_LOCATE_METHOD
+    if method not in ('pyramid', 'full'):
+        raise ValueError(f"Unknown sun locating method {method!r}, expected 'pyramid' or 'full'")
 
-    # perform a naive attempt to find the (x, y) coordinates of
-    # the area of the image with the largest intensity value
-    # apply a Gaussian blur to the image then find the brightest
-    # region
-    gray = cv2.GaussianBlur(gray, (radius, radius), 0)
-    (minVal, maxVal, minLoc, maxLoc) = cv2.minMaxLoc(gray)
+    image = np.asarray(image)
+    maxLoc, _ = _sun_peak(image, radius, method, coarse_width, refine_scale)
 
     if show:
-        plt.imshow(orig[:,:,::-1])
+        plt.imshow(image[:,:,::-1])
         circle1 = plt.Circle(maxLoc, radius, color='r', fill=False)
         plt.gca().add_patch(circle1)
         plt.show()
@@ -103,37 +375,560 @@ def locate_sun(image, radius=701, show=False):
     return maxLoc, radius
         
 
-def roll_folder_manual(directory: str=None):
+def read_reduced(path: str, reduction: int = None):
     """
-        Roll list of images to have brightest spot at center
+        Decode a JPG at reduced resolution using libjpeg's DCT scaling, so
+        only a fraction of the pixels is ever reconstructed.
+
+        **Args**:
+
+        * path (str): path to the image.
+        * reduction (int): 1, 2, 4 or 8, defaults to `SUN_DECODE_REDUCTION`.
+
+        **Returns**:
+
+        * image (numpy.array): BGR pixel array.
+        * scale (float): full-resolution width divided by the decoded width.
+
+    """
+
+    reduction = reduction or SUN_DECODE_REDUCTION
+    flags = {1: cv2.IMREAD_COLOR, 2: cv2.IMREAD_REDUCED_COLOR_2, 4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}
+    if reduction not in flags:
+        raise ValueError(f"Unsupported decode reduction {reduction}, expected one of {tuple(flags)}")
+
+    with Image.open(path) as im:
+        width = im.size[0]
+        image = cv2.imread(path, flags[reduction])
+        if image is None:
+            # OpenCV could not read it (e.g. unusual path encoding); PIL's draft mode uses the same DCT scaling
+            im.draft('RGB', (im.size[0] // reduction, im.size[1] // reduction))
+            image = np.asarray(im.convert('RGB'))[:, :, ::-1]
+
+    return image, width / image.shape[1]
+
+
+def sun_offset(path: str, reduction: int = None, tracker: SunTracker = None, **kwargs):
+    """
+        Horizontal roll that centres the sun in an image, detected on a
+        reduced decode. Keyword arguments are passed to `locate_sun`; the
+        kernel radius and coarse width are scaled with the reduction.
+
+        **Args**:
+
+        * path (str): path to the image.
+        * reduction (int): decode reduction, see `read_reduced`.
+        * tracker (SunTracker): if given, the sun is tracked from the previous frame it saw.
+
+        **Returns**:
+
+        * shift (int): columns to roll the full-resolution image by.
+        * sun (tuple): `(x, y, width, height)`, the sun's position and the
+          frame size in full-resolution pixels.
+
+    """
+
+    image, scale = read_reduced(path, reduction)
+    radius = kwargs.pop('radius', 701)
+    coarse_width = kwargs.pop('coarse_width', None) or SUN_COARSE_WIDTH
+    kwargs.update(radius=_odd(radius / scale), coarse_width=max(1, int(coarse_width / scale)))
+    if tracker is not None:
+        x, y = tracker.locate(image, **kwargs)
+    else:
+        (x, y), _ = locate_sun(image, **kwargs)
+
+    width, height = (int(round(n * scale)) for n in image.shape[1::-1])
+    x, y = int((x + 0.5) * scale), int((y + 0.5) * scale)
+    shift = (-x + width // 2) % width
+    return shift, (x, y, width, height)
+
+
+def _jpeg_options(im: Image.Image) -> dict:
+    """
+        Encoder settings for a rolled image, from `ROLL_JPEG_QUALITY`,
+        `ROLL_JPEG_SUBSAMPLING` and `ROLL_JPEG_OPTIMIZE`, with the source's
+        EXIF and ICC profile carried over. 'keep' reuses the source's
+        quantization tables or subsampling where the source is a JPEG. The
+        settings are resolved here, so they also apply to a copy of the
+        pixels (see `_stream_write`).
+    """
+
+    is_jpeg = im.format == 'JPEG'
+    options = {'optimize': ROLL_JPEG_OPTIMIZE}
+    if ROLL_JPEG_QUALITY == 'keep':
+        if is_jpeg:
+            options['qtables'] = im.quantization
+        else:
+            options['quality'] = ROLL_JPEG_FALLBACK_QUALITY
+    else:
+        options['quality'] = ROLL_JPEG_QUALITY
+    if ROLL_JPEG_SUBSAMPLING != 'keep':
+        options['subsampling'] = ROLL_JPEG_SUBSAMPLING
+    elif is_jpeg:
+        options['subsampling'] = get_sampling(im)
+    for key in ('exif', 'icc_profile'):
+        if im.info.get(key):
+            options[key] = im.info[key]
+    return options
+
+
+def _roll_in_place(im: Image.Image, shift: int):
+    """
+        Roll a decoded image horizontally by `shift` columns without a
+        second full frame. Each band of `ROLL_STRIP_ROWS` rows is copied
+        out once and pasted back as its two horizontal slices, swapped.
+    """
+
+    width, height = im.size
+    for top in range(0, height, ROLL_STRIP_ROWS):
+        bottom = min(top + ROLL_STRIP_ROWS, height)
+        strip = im.crop((0, top, width, bottom))
+        im.paste(strip.crop((width - shift, 0, width, bottom - top)), (0, top))
+        im.paste(strip.crop((0, 0, width - shift, bottom - top)), (shift, top))
+
+
+def roll_image(src: str, dst: str, shift: int):
+    """
+        Write `src` rolled horizontally by `shift` columns to `dst`. A
+        zero shift copies the file without decoding it. The image is
+        rolled in its decode buffer (see `_roll_in_place`) and encoded
+        with `_jpeg_options`, which keeps the source's quality and EXIF
+        by default.
+
+        **Args**:
+
+        * src (str): path to the image.
+        * dst (str): path to write the rolled image to.
+        * shift (int): columns to roll by.
+
+        **Returns**:
+
+        * None
+
+    """
+
+    if shift == 0:
+        shutil.copy2(src, dst)
+        return
+
+    with Image.open(src) as im:
+        im.load()
+        _roll_in_place(im, shift % im.size[0])
+        im.save(dst, 'JPEG', **_jpeg_options(im))
+
+
+def _frame_size(path: str) -> int:
+    """
+        Bytes of an image decoded at full resolution, as PIL stores it (RGB
+        with four bytes per pixel), from its header; 0 if it cannot be read.
+    """
+
+    try:
+        with Image.open(path) as im:
+            width, height = im.size
+            return width * height * (4 if im.mode == 'RGB' else len(im.getbands()))
+    except OSError:
+        return 0
+
+
+def _memory_budget() -> int:
+    """
+        Default memory budget for frames in flight: half of physical memory,
+        or 4 GB where it cannot be determined.
+    """
+
+    try:
+        return os.sysconf('SC_PHYS_PAGES') * os.sysconf('SC_PAGE_SIZE') // 2
+    except (ValueError, OSError, AttributeError):
+        return 4 * 2**30
+
+
+def _init_worker():
+    """
+        Keep OpenCV single-threaded inside pool workers; the pool already
+        occupies every core.
+    """
+
+    cv2.setNumThreads(1)
+
+
+def _job_offset(job: tuple, reduction: int = None, tracker: SunTracker = None):
+    """
+        Roll offset of a job `(src, dst, cached)`: the cached `(shift, sun)`
+        if there is one, otherwise measured with `sun_offset`. The tracker
+        is reset if the image cannot be read.
+
+        **Returns**:
+
+        * result (tuple): `(shift, sun, how)`, see `sun_offset`, with `how`
+          one of 'cached', 'tracked' or 'searched'.
+
+    """
+
+    src, _, cached = job
+    if cached is not None:
+        shift, sun = cached
+        if tracker is not None:
+            tracker.observe(sun[0] / sun[2], sun[1] / sun[3])
+        return shift, sun, 'cached'
+
+    searched = tracker.searched if tracker is not None else 0
+    try:
+        shift, sun = sun_offset(src, reduction, tracker=tracker)
+    except Exception:
+        if tracker is not None:
+            tracker.reset()
+        raise
+    return shift, sun, 'searched' if tracker is None or tracker.searched > searched else 'tracked'
+
+
+def _roll_array_in_place(frame: np.ndarray, shift: int):
+    """
+        `_roll_in_place` for a frame held in a numpy array (e.g. a
+        `streaming.FrameRing` slot).
+    """
+
+    width = frame.shape[1]
+    for top in range(0, frame.shape[0], ROLL_STRIP_ROWS):
+        rows = slice(top, top + ROLL_STRIP_ROWS)
+        strip = frame[rows].copy()
+        frame[rows, shift:] = strip[:, :width - shift]
+        frame[rows, :shift] = strip[:, width - shift:]
+
+
+def _stream_read(task: tuple, allocate):
+    """
+        Reader stage of a streamed roll: decode the full-resolution frame
+        straight into its slot, unless the image is only measured or is
+        known not to move. Modes PIL stores with one or four bytes per
+        pixel are decoded in place; others are converted to an array.
+
+        **Returns**:
+
+        * frame (numpy.array): decoded pixels, or None.
+        * meta (tuple): PIL mode, raw mode of `frame` and `_jpeg_options`.
+
+    """
+
+    src, dst, cached, _, _ = task
+    if dst is None or (cached is not None and cached[0] == 0):
+        return None, None
+    with Image.open(src) as im:
+        options = _jpeg_options(im)
+        width, height = im.size
+        rawmode = {'RGB': 'RGBX', 'RGBA': 'RGBA', 'CMYK': 'CMYK', 'L': 'L'}.get(im.mode)
+        if rawmode is None:
+            return np.asarray(im), (im.mode, im.mode, options)
+
+        frame = allocate((height, width, len(rawmode)) if len(rawmode) > 1 else (height, width), np.uint8)
+        # the decoder writes into whatever image memory is already attached
+        slot = Image.frombuffer(im.mode, im.size, frame, 'raw', rawmode, 0, 1).im
+        im.im = slot
+        im.load()
+        if im.im is not slot:
+            # the plugin replaced the image memory while loading, so copy the pixels over
+            slot.paste(im.im, (0, 0, width, height))
+        return frame, (im.mode, rawmode, options)
+
+
+def _stream_process(frame, task: tuple):
+    """
+        Worker stage of a streamed roll: locate the sun and roll the frame
+        in its slot. Each worker tracks the sun along its own run of
+        consecutive images.
+    """
+
+    global _STREAM_TRACKER
+    src, dst, cached, reduction, track = task
+    if track and _STREAM_TRACKER is None:
+        _STREAM_TRACKER = SunTracker()
+    shift, sun, how = _job_offset((src, dst, cached), reduction, _STREAM_TRACKER if track else None)
+    if frame is not None and shift:
+        _roll_array_in_place(frame, shift)
+    return shift, sun, how
+
+
+def _stream_write(frame, task: tuple, meta, result):
+    """
+        Writer stage of a streamed roll: encode the rolled frame, or copy
+        an image that does not move.
+    """
+
+    src, dst = task[:2]
+    shift = result[0]
+    if dst is None:
+        return result
+    if shift == 0:
+        shutil.copy2(src, dst)
+    else:
+        mode, rawmode, options = meta
+        height, width = frame.shape[:2]
+        Image.frombuffer(mode, (width, height), frame, 'raw', rawmode, 0, 1).save(dst, 'JPEG', **options)
+    return result
+
+
+def _sequence_key(path: str):
+    """
+        Sort key putting written outputs (`<index>_<tag>...`) in sequence order.
+    """
+
+    name = os.path.basename(path)
+    index = name.split('_', 1)[0]
+    return (int(index), name) if index.isdigit() else (float('inf'), name)
+
+
+def _source_name(path: str) -> str:
+    """
+        Name identifying the source of an image across re-sorts: the tag of
+        a written output, or the file name otherwise.
+    """
+
+    name = os.path.basename(path)
+    match = _OUTPUT_NAME.match(name)
+    return match['tag'] if match else name
+
+
+def _stat_key(path: str):
+    """
+        `(size, mtime_ns)` of a file, or None if it does not exist.
+    """
+
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+def roll_folder_manual(directory: str=None, reduction: int=None, workers: int=None, memory_budget: int=None,
+                       track: bool=None, cache: bool=None):
+    """
+        Roll list of images to have brightest spot at center.
+        Every JPG in `directory` is written to `directory/rolled` by
+        `roll_images`, in sequence order.
     
         **Args**:
     
         * directory (str): path to JPGs that need to be centered.   
+        * reduction (int): decode reduction for sun detection, defaults to `SUN_DECODE_REDUCTION`.
+        * workers (int): number of processes, defaults to `ROLL_WORKERS`; 1 rolls in this process.
+        * memory_budget (int): bytes of frames in flight, defaults to half of physical memory.
+        * track (bool): track the sun across the sequence, defaults to `SUN_TRACKING`.
+        * cache (bool): reuse cached sun positions, defaults to `SUN_CACHE`.
     
         **Returns**:
     
-        * None
+        * failures (list[tuple]): `(path, traceback)` of every image that failed.
     
     """
      
     
 
     ## select image
-    os.system(f"mkdir {directory}/rolled/")
-    for _im_fpath in tqdm(glob.glob(directory + "/*.jpg")):
-    # _im_fpath = filedialog.askopenfilename()
-        print(_im_fpath)
+    os.makedirs(f"{directory}/rolled/", exist_ok=True)
+    paths = sorted(glob.glob(directory + "/*.jpg"), key=_sequence_key)
+    pairs = [(path, f"{directory}/rolled/{os.path.basename(path)}") for path in paths]
+    failures = roll_images(pairs, directory, reduction, workers, memory_budget, track, cache)
+    print("Images aligned.")
+    return failures
+
+
+def export_rolled(points, output_path: str, reduction: int=None, workers: int=None, memory_budget: int=None,
+                  track: bool=None, cache: bool=None, copy_jpgs: bool=False):
+    """
+        Export a sequence with its JPGs rolled in one pass: each source JPG
+        is read once and written rolled under its output name in
+        `output_path/jpgs/rolled`, without the plain copy in `jpgs` that
+        `roll_folder_manual` would read back. DNGs are written as by
+        `file_io.write_points`. Takes the same arguments as `write_points`
+        followed by those of `roll_images`, so it can stand in for it.
+
+        Offsets recorded earlier (see `record_offsets`) are applied without
+        detection, so this is also the final export of a deferred roll.
+
+        **Args**:
+
+        * points (PointTable/list): points in output order.
+        * output_path (str): path to output directory.
+        * reduction, workers, memory_budget, track, cache: see `roll_folder_manual`.
+        * copy_jpgs (bool): also keep plain JPG copies in `jpgs`.
+
+        **Returns**:
+
+        * failures (list[tuple]): `(path, traceback)` of every image that failed.
+
+    """
+
+    ## dngs, and renames of rolled output already in place ##
+    file_io.write_points(points, output_path, copy_jpgs=copy_jpgs)
+
+    jpg_dir = os.path.join(output_path, 'jpgs')
+    os.makedirs(os.path.join(jpg_dir, 'rolled'), exist_ok=True)
+    pairs = [
+        (point.fpath, os.path.join(jpg_dir, 'rolled', file_io.output_filename(i, point, 'jpg')))
+        for i, point in enumerate(points)
+    ]
+    failures = roll_images(pairs, jpg_dir, reduction, workers, memory_budget, track, cache)
+    print("Rolled images exported.")
+    return failures
+
+
+def record_offsets(directory: str=None, reduction: int=None, workers: int=None, memory_budget: int=None,
+                   track: bool=None):
+    """
+        Measure and cache the roll offset of every JPG in `directory`
+        without writing any pixels, for a deferred roll: the sequence can
+        be re-sorted freely and `export_rolled` applies the recorded
+        offsets once, at the end. Only new or modified images are measured.
+
+        **Args**:
+
+        * directory (str): path to JPGs written by `file_io.write_points`.
+        * reduction, workers, memory_budget, track: see `roll_folder_manual`.
+
+        **Returns**:
+
+        * failures (list[tuple]): `(path, traceback)` of every image that failed.
+
+    """
+
+    paths = sorted(glob.glob(directory + "/*.jpg"), key=_sequence_key)
+    pairs = [(path, f"{directory}/rolled/{os.path.basename(path)}") for path in paths]
+    failures = roll_images(pairs, directory, reduction, workers, memory_budget, track, cache=True, write=False)
+    print("Sun offsets recorded.")
+    return failures
+
+
+def roll_images(pairs: list, index_dir: str, reduction: int=None, workers: int=None, memory_budget: int=None,
+                track: bool=None, cache: bool=None, write: bool=True):
+    """
+        Write images rolled so the sun is centred.
+        The sun is located on a reduced decode (see `sun_offset`); only
+        images that actually move are decoded at full resolution, and
+        images that are already centred are copied as they are.
+
+        With `track`, images are taken in sequence order and the sun is
+        followed from frame to frame (see `SunTracker`), so most frames
+        are only searched in a small window around its predicted position.
+        In parallel, each worker tracks its own run of consecutive images
+        (see `streaming.stream`).
+
+        With `cache`, sun positions and offsets are kept in a
+        `route_index.RouteIndex` inside `index_dir`, keyed by source image
+        and its size and mtime. Only new or modified images are searched;
+        the others are rolled with their cached offset, or skipped outright
+        if their rolled output is still in place (e.g. after a re-sort,
+        which renames it along with the image).
+
+        In parallel, images go through a `streaming.stream`: reader threads
+        decode frames into shared memory, worker processes locate the sun
+        and roll the frames in place, and writer threads encode them, so
+        disk and CPU work overlap and frames are never pickled. The number
+        of frames in flight is sized to keep them within `memory_budget`,
+        however many workers there are. An image that fails is reported
+        and the rest of the batch carries on.
+    
+        **Args**:
+    
+        * pairs (list[tuple]): `(src, dst)` paths in sequence order; the
+          source is identified by the tag in the name of `dst`.
+        * index_dir (str): directory holding the cache.
+        * reduction, workers, memory_budget, track, cache: see `roll_folder_manual`.
+        * write (bool): if False, only measure and cache the offsets (requires `cache`).
+    
+        **Returns**:
+    
+        * failures (list[tuple]): `(path, traceback)` of every image that failed.
+    
+    """
+
+    workers = workers or ROLL_WORKERS
+    budget = memory_budget or ROLL_MEMORY_BUDGET or _memory_budget()
+    track = SUN_TRACKING if track is None else track
+    cache = SUN_CACHE if cache is None else cache
+
+    ## reuse offsets of images unchanged since they were last rolled ##
+    params = f"{SUN_LOCATE_METHOD}/{reduction or SUN_DECODE_REDUCTION}/{SUN_COARSE_WIDTH}/{SUN_REFINE_SCALE}"
+    targets = dict(pairs)
+    sources = {src: _source_name(dst) for src, dst in pairs}
+    keys = {sources[src]: _stat_key(src) for src, _ in pairs}
+    index = RouteIndex.for_route(index_dir) if cache else None
+    cached = index.fresh_sun(keys, params) if cache else {}
+
+    jobs, rows, reused = [], {}, 0
+    for path, dst in pairs:
+        row = cached.get(sources[path])
+        if row is not None:
+            rows[path] = dict(row)
+            if not write or _stat_key(dst) == (row['rolled_size'], row['rolled_mtime_ns']):
+                reused += 1
+                continue
+            jobs.append((path, dst, (row['shift'], (row['x'], row['y'], row['width'], row['height']))))
+        else:
+            jobs.append((path, dst if write else None, None))
 
-        im = plt.imread(_im_fpath)
+    failures = []
+    counts = {'cached': 0, 'tracked': 0, 'searched': 0}
+    progress = tqdm(total=len(jobs))
 
-        sun_coord, _ = locate_sun(im)
+    def _collect(src, result, error):
+        progress.update()
+        if error is not None:
+            failures.append((src, error))
+            print(f"Failed to roll {src}:")
+            print(error)
+            return
+        shift, sun, how = result
+        counts[how] += 1
+        if cache:
+            x, y, width, height = sun
+            rolled_size, rolled_mtime_ns = _stat_key(targets[src]) if write else (None, None)
+            rows[src] = {
+                'source': sources[src], 'size': keys[sources[src]][0], 'mtime_ns': keys[sources[src]][1],
+                'params': params, 'x': x, 'y': y, 'width': width, 'height': height, 'shift': shift,
+                'rolled_size': rolled_size, 'rolled_mtime_ns': rolled_mtime_ns,
+            }
 
-        rolled_im = np.roll(im, (0, -int(sun_coord[0])+int(7680/2), 0), axis=(0, 1, 2))
-        print(rolled_im.shape)
-        tag = _im_fpath.split('/')[-1]
-        Image.fromarray(rolled_im).save(f"{directory}/rolled/{tag}")
-        print("Images aligned.")
-        del im
+    if workers > 1:
+        # every frame in flight holds a slot, plus transient decode/encode copies per thread
+        slot_bytes = max((_frame_size(src) for src, dst, _ in jobs if dst is not None), default=0)
+        threads = streaming.STREAM_READERS + streaming.STREAM_WRITERS
+        slots = max(2, min(2 * workers + threads, budget // max(slot_bytes, 1) - 3 * threads))
+        # the slots must fit in free shared memory, or touching them raises SIGBUS
+        free = streaming.shared_memory_free()
+        if slot_bytes and free is not None and free // slot_bytes < slots:
+            slots = free // slot_bytes
+            if slots < 2:
+                print(f"Only {free / 2**20:.0f} MB of shared memory free; rolling images one at a time.")
+                workers = 1
 
+    if workers == 1:
+        tracker = SunTracker() if track else None
+        for job in jobs:
+            try:
+                shift, sun, how = _job_offset(job, reduction, tracker)
+                if job[1] is not None:
+                    roll_image(job[0], job[1], shift)
+                _collect(job[0], (shift, sun, how), None)
+            except Exception:
+                _collect(job[0], None, traceback.format_exc())
+    else:
+        ## stream: readers decode, workers detect and roll in shared memory, writers encode ##
+        tasks = [(src, dst, cached_, reduction, track) for src, dst, cached_ in jobs]
+        for task, result, error in streaming.stream(
+            tasks, _stream_read, _stream_write, _stream_process, workers=workers,
+            slots=slots, slot_bytes=slot_bytes, initializer=_init_worker,
+        ):
+            _collect(task[0], result, error)
 
+    progress.close()
+    if cache:
+        index.update_sun(list(rows.values()), keys)
+        index.close()
+        if cached:
+            print(f"Sun positions reused for {len(cached)} image(s)" + (f", {reused} of them already rolled." if write else "."))
+    if track and (counts['tracked'] or counts['searched']):
+        print(f"Sun tracked in {counts['tracked']} image(s), searched in full in {counts['searched']}.")
+    if failures:
+        print(f"{len(failures)} of {len(jobs)} image(s) could not be rolled.")
+    return failures
@@ -0,0 +1,532 @@
+"""
+====================================
+Filename:         bench_io.py
+Author:           Joseph Farah
+Description:      Throughput benchmark of the I/O stages on synthetic image trees.
+====================================
+Notes
+    - Builds a temporary route of synthetic equirectangular JPGs with a
+      bright sun and minimal grayscale TIFF "DNGs" carrying ModifyDate,
+      at a configurable count and resolution (PandoRoll assumes frames
+      7680 pixels wide).
+    - Runs `file_io.load_points` (cold and cached), `file_io.write_points`,
+      `PandoRoll.roll_folder_manual` and the fused `PandoRoll.export_rolled`
+      headlessly, each in a fresh process so its peak RSS can be measured
+      on its own. `write` + `roll` and `export` produce the same rolled JPGs.
+    - Worker processes and the shared-memory frame ring of a stage are
+      sampled while it runs: `children_peak_rss_mb` is the peak RSS of its
+      child processes together, without shared memory, `ring_mb` the peak
+      size of the shared memory it maps, and `total_peak_mb` the peak of
+      all three counted once.
+    - `roll` and `export` also report `sun_misses`, the images whose sun
+      was found away from where it was drawn.
+    - MB/sec counts the size of the files a stage handles, whether or not
+      it reads all of their bytes (loading only reads DNG headers).
+    - Usage: `python bench_io.py --count 50 --width 7680 --output bench_io.json`
+"""
+
+#------------- IMPORTS -------------#
+import os
+import io
+import re
+import sys
+import json
+import time
+import struct
+import shutil
+import argparse
+import platform
+import threading
+import tempfile
+import contextlib
+import numpy as np
+import datetime as dt
+from PIL import Image
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+try:
+    import resource
+except ImportError:
+    # not available on Windows; peak RSS is then reported as None
+    resource = None
+
+
+#------------- GLOBAL SETTINGS -------------#
+DEFAULT_OUTPUT = 'bench_io.json'
+"""File the results are written to."""
+DEFAULT_WIDTH = 7680
+"""Width of the synthetic frames; equirectangular, so the height is half of it."""
+JPEG_VARIANTS = 8
+"""Number of distinct JPGs encoded; files reuse them to keep tree creation fast."""
+DNG_WIDTH = 1024
+"""Row length of the synthetic DNG payload in bytes."""
+STAGES = ('load', 'load_cached', 'write', 'roll', 'export')
+"""Benchmarked stages, in the order they run."""
+RSS_SAMPLE_INTERVAL = 0.05
+"""Seconds between samples of the memory of a stage's processes."""
+SUN_GLOW = 100
+"""Brightness the glow around the synthetic sun adds to the sky at its centre."""
+SUN_GLOW_WIDTH = 1 / 30
+"""Standard deviation of the glow as a fraction of the frame width; a sun found further away is a miss."""
+
+
+#------------- CLASSES -------------#
+class MemorySampler(threading.Thread):
+    """
+    Background thread sampling the resident memory of the current process,
+    its descendants and the shared memory it maps, from `/proc`. Shared
+    memory is counted once rather than in every process that maps it.
+    Peaks are in kB and stay 0 where `/proc` is not available.
+    """
+
+    def __init__(self, interval: float = RSS_SAMPLE_INTERVAL):
+        super().__init__(daemon=True)
+        self.interval = interval
+        """Seconds between samples."""
+        self.children_kb = 0
+        """Peak RSS of all descendants together, without shared memory."""
+        self.ring_kb = 0
+        """Peak size of the shared memory mapped by this process."""
+        self.total_kb = 0
+        """Peak of this process, its descendants and its shared memory together."""
+        self._done = threading.Event()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._done.set()
+        self.join()
+        self.sample()
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            self.sample()
+
+    def sample(self):
+        own = _proc_status('self')
+        children = sum(
+            status.get('VmRSS', 0) - status.get('RssShmem', 0)
+            for status in map(_proc_status, _descendants(os.getpid()))
+        )
+        ring = _shared_memory_kb()
+        self.children_kb = max(self.children_kb, children)
+        self.ring_kb = max(self.ring_kb, ring)
+        self.total_kb = max(self.total_kb, own.get('VmRSS', 0) - own.get('RssShmem', 0) + children + ring)
+
+
+#------------- FUNCTIONS -------------#
+def minimal_tiff(timestamp: dt.datetime, size: int) -> bytes:
+    """
+        Encode a minimal 8-bit grayscale TIFF with `ModifyDate` set and an
+        image payload of roughly `size` bytes, enough for the native reader,
+        exiftool and the size-based caches to treat it like a DNG.
+
+        **Args**:
+
+        * timestamp (datetime): value written to `ModifyDate` (0x0132).
+        * size (int): approximate file size in bytes.
+
+        **Returns**:
+
+        * data (bytes): encoded file.
+
+    """
+
+    height = max(size // DNG_WIDTH, 1)
+    date = timestamp.strftime('%Y:%m:%d %H:%M:%S').encode() + b'\x00'
+
+    entries = [
+        (0x0100, 4, 1, DNG_WIDTH),       # ImageWidth
+        (0x0101, 4, 1, height),          # ImageLength
+        (0x0102, 3, 1, 8),               # BitsPerSample
+        (0x0103, 3, 1, 1),               # Compression: none
+        (0x0106, 3, 1, 1),               # PhotometricInterpretation: BlackIsZero
+        (0x0111, 4, 1, None),            # StripOffsets, filled in below
+        (0x0115, 3, 1, 1),               # SamplesPerPixel
+        (0x0116, 4, 1, height),          # RowsPerStrip
+        (0x0117, 4, 1, DNG_WIDTH * height),  # StripByteCounts
+        (0x0132, 2, len(date), None),    # ModifyDate, stored after the IFD
+    ]
+    ifd_size = 2 + 12 * len(entries) + 4
+    date_offset = 8 + ifd_size
+    strip_offset = date_offset + len(date)
+
+    ifd = struct.pack('<H', len(entries))
+    for tag, kind, count, value in entries:
+        if tag == 0x0111:
+            value = strip_offset
+        elif tag == 0x0132:
+            value = date_offset
+        packed = struct.pack('<H', value) + b'\x00\x00' if kind == 3 else struct.pack('<I', value)
+        ifd += struct.pack('<HHI', tag, kind, count) + packed
+    ifd += struct.pack('<I', 0)
+
+    return b'II' + struct.pack('<HI', 42, 8) + ifd + date + bytes(DNG_WIDTH * height)
+
+
+def synthetic_frame(width: int, sun_x: int, quality: int = 90) -> bytes:
+    """
+        Encode an equirectangular sky with a horizon and a bright sun. The
+        sky is nearly flat and the sun has a wide glow, so the blurred
+        brightest spot `PandoRoll` looks for is the sun and not the sky.
+
+        **Args**:
+
+        * width (int): frame width; the height is half of it.
+        * sun_x (int): horizontal position of the sun.
+        * quality (int): JPEG quality.
+
+        **Returns**:
+
+        * data (bytes): encoded JPG.
+
+    """
+
+    height = width // 2
+    sky = np.linspace(110, 80, height, dtype=np.float32)[:, None]
+    frame = np.repeat(sky, width, axis=1)
+    frame[int(height * 0.6):] = 40
+
+    # distance to the sun, wrapping around the seam like the panorama does
+    y, x = np.ogrid[:height, :width]
+    dx = np.minimum(np.abs(x - sun_x), width - np.abs(x - sun_x)).astype(np.float32)
+    distance = dx ** 2 + (y - height // 3) ** 2
+    frame += SUN_GLOW * np.exp(-distance / (2 * (SUN_GLOW_WIDTH * width) ** 2))
+    frame[distance <= max(width // 150, 2) ** 2] = 255
+
+    frame = np.clip(frame, 0, 255)
+    rgb = np.stack([frame, frame * 0.95, frame * 0.9], axis=-1).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(rgb).save(buffer, format='JPEG', quality=quality)
+    return buffer.getvalue()
+
+
+def build_tree(root: str, count: int, width: int = DEFAULT_WIDTH, dng_bytes: int = 1 << 20, seed: int = 0) -> dict:
+    """
+        Create a synthetic route under `root` with `jpg/` and `dng/`
+        directories. Capture times follow `bench_sequencing.synthetic_route`,
+        so the route has a clock reset and open/end slates.
+
+        **Args**:
+
+        * root (str): directory to create the route in.
+        * count (int): number of JPG/DNG pairs.
+        * width (int): JPG width in pixels.
+        * dng_bytes (int): approximate size of each DNG.
+        * seed (int): random seed.
+
+        **Returns**:
+
+        * tree (dict): `jpg_dir`, `dng_dir`, file `count`, total `jpg_bytes`/`dng_bytes`,
+          `width` and the `sun_x` of every file, by index in its name.
+
+    """
+
+    from bench_sequencing import synthetic_route
+
+    jpg_dir, dng_dir = os.path.join(root, 'jpg'), os.path.join(root, 'dng')
+    os.makedirs(jpg_dir, exist_ok=True)
+    os.makedirs(dng_dir, exist_ok=True)
+
+    rng = np.random.default_rng(seed)
+    sun_xs = [int(x) for x in rng.integers(0, width, JPEG_VARIANTS)]
+    frames = [synthetic_frame(width, x) for x in sun_xs]
+    points = synthetic_route(count, dropout=0.0, seed=seed)['points']
+
+    jpg_total = dng_total = 0
+    for i, point in enumerate(points):
+        stem = f"IMG_{i:06d}" + {'open': ' open', 'end': ' end'}.get(point.slate, '')
+        frame = frames[i % len(frames)]
+        dng = minimal_tiff(point.timestamp, dng_bytes)
+        with open(os.path.join(jpg_dir, stem + '.JPG'), 'wb') as f:
+            f.write(frame)
+        with open(os.path.join(dng_dir, stem + '.DNG'), 'wb') as f:
+            f.write(dng)
+        jpg_total += len(frame)
+        dng_total += len(dng)
+
+    return {
+        'jpg_dir': jpg_dir, 'dng_dir': dng_dir, 'count': len(points), 'jpg_bytes': jpg_total, 'dng_bytes': dng_total,
+        'width': width, 'sun_x': [sun_xs[i % len(sun_xs)] for i in range(len(points))],
+    }
+
+
+def _peak_rss_mb():
+    """
+        Peak resident set size of the current process in MB, or None.
+    """
+
+    # ru_maxrss survives exec on Linux, so a freshly spawned process would
+    # report its parent's peak; the kernel's high-water mark does not
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 2**10
+    except OSError:
+        pass
+
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes elsewhere
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10
+
+
+def _proc_status(pid) -> dict:
+    """
+        Sizes in kB from `/proc/<pid>/status`, empty if unavailable.
+    """
+
+    fields = {}
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                if value.strip().endswith('kB'):
+                    fields[key] = int(value.split()[0])
+    except OSError:
+        pass
+    return fields
+
+
+def _descendants(pid: int) -> list:
+    """
+        Process ids of all descendants of `pid`, empty if unavailable.
+    """
+
+    children = []
+    try:
+        for task in os.listdir(f'/proc/{pid}/task'):
+            with open(f'/proc/{pid}/task/{task}/children') as f:
+                children.extend(int(child) for child in f.read().split())
+    except OSError:
+        return children
+    return children + [grandchild for child in children for grandchild in _descendants(child)]
+
+
+def _shared_memory_kb() -> float:
+    """
+        Size in kB of the `/dev/shm` blocks mapped by the current process.
+    """
+
+    sizes = {}
+    try:
+        with open('/proc/self/maps') as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) >= 6 and fields[5].startswith('/dev/shm/'):
+                    start, end = (int(address, 16) for address in fields[0].split('-'))
+                    sizes[fields[5]] = sizes.get(fields[5], 0) + end - start
+    except OSError:
+        pass
+    return sum(sizes.values()) / 2**10
+
+
+def _children_peak_rss_kb():
+    """
+        Largest peak RSS of any finished child process in kB, or None.
+    """
+
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    # bytes on macOS, kilobytes elsewhere
+    return peak / 2**10 if sys.platform == 'darwin' else peak
+
+
+def _sun_misses(tree: dict, jpg_dir: str) -> int:
+    """
+        Number of images whose sun, as cached by `PandoRoll` in the index of
+        `jpg_dir`, is further from the synthetic sun than the width of its
+        glow (`SUN_GLOW_WIDTH`).
+    """
+
+    from route_index import RouteIndex
+
+    width = tree['width']
+    misses = 0
+    with RouteIndex.for_route(jpg_dir) as index:
+        for row in index.conn.execute("SELECT source, x FROM sun"):
+            # source names keep the IMG_<index> stem of the synthetic file
+            match = re.search(r'IMG_(\d+)', row['source'])
+            distance = abs(row['x'] - tree['sun_x'][int(match[1])])
+            misses += min(distance, width - distance) > SUN_GLOW_WIDTH * width
+    return misses
+
+
+def _run_stage(stage: str, tree: dict, output_dir: str, mode: str) -> dict:
+    """
+        Run one stage in the current (fresh) process and time it.
+
+        **Args**:
+
+        * stage (str): one of `STAGES`.
+        * tree (dict): tree from `build_tree`.
+        * output_dir (str): output directory of the write and roll stages; `export` writes next to it.
+        * mode (str): materialization mode of the write stage.
+
+        **Returns**:
+
+        * record (dict): `seconds`, `files`, `bytes`, `peak_rss_mb`,
+          `children_peak_rss_mb`, `ring_mb` and `total_peak_mb` of the stage,
+          and for `roll` and `export` the `sun_misses` of `_sun_misses`.
+
+    """
+
+    # headless: no windows from matplotlib
+    os.environ.setdefault('MPLBACKEND', 'Agg')
+    import file_io
+    import orientation
+    import PandoRoll
+    from route_index import INDEX_FILENAME
+
+    index_path = os.path.join(tree['jpg_dir'], INDEX_FILENAME)
+    sampler = MemorySampler()
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()), sampler:
+        if stage == 'load' and os.path.exists(index_path):
+            os.remove(index_path)
+
+        if stage in ('load', 'load_cached'):
+            t0 = time.perf_counter()
+            file_io.load_points(tree['jpg_dir'], tree['dng_dir'])
+            seconds = time.perf_counter() - t0
+            files, size = 2 * tree['count'], tree['jpg_bytes'] + tree['dng_bytes']
+
+        elif stage in ('write', 'export'):
+            loaded = file_io.load_points(tree['jpg_dir'], tree['dng_dir'])
+            _, _, new_points, _ = orientation.sequence(loaded['points'], loaded['start'], loaded['end'])
+            t0 = time.perf_counter()
+            if stage == 'write':
+                file_io.write_points(new_points, output_dir, mode=mode)
+            else:
+                PandoRoll.export_rolled(new_points, output_dir + '_export')
+            seconds = time.perf_counter() - t0
+            files, size = 2 * tree['count'], tree['jpg_bytes'] + tree['dng_bytes']
+
+        elif stage == 'roll':
+            t0 = time.perf_counter()
+            PandoRoll.roll_folder_manual(directory=os.path.join(output_dir, 'jpgs'))
+            seconds = time.perf_counter() - t0
+            files, size = tree['count'], tree['jpg_bytes']
+
+        else:
+            raise ValueError(f"Unknown stage {stage!r}, expected one of {STAGES}")
+
+    # without /proc only the largest finished child is known
+    children = sampler.children_kb or _children_peak_rss_kb()
+    record = {
+        'seconds': seconds, 'files': files, 'bytes': size, 'peak_rss_mb': _peak_rss_mb(),
+        'children_peak_rss_mb': children / 2**10 if children is not None else None,
+        'ring_mb': sampler.ring_kb / 2**10,
+        'total_peak_mb': sampler.total_kb / 2**10 if sampler.total_kb else None,
+        'sun_misses': None,
+    }
+
+    ## check the sun was found where it was drawn, outside the timing ##
+    if stage == 'roll':
+        record['sun_misses'] = _sun_misses(tree, os.path.join(output_dir, 'jpgs'))
+    elif stage == 'export':
+        record['sun_misses'] = _sun_misses(tree, os.path.join(output_dir + '_export', 'jpgs'))
+    return record
+
+
+def bench(count: int, width: int = DEFAULT_WIDTH, dng_bytes: int = 1 << 20, mode: str = 'copy',
+          stages=STAGES, root: str = None, seed: int = 0) -> list:
+    """
+        Build a synthetic tree and benchmark each stage in its own process.
+
+        **Args**:
+
+        * count (int): number of JPG/DNG pairs.
+        * width (int): JPG width in pixels.
+        * dng_bytes (int): approximate size of each DNG.
+        * mode (str): materialization mode of the write stage.
+        * stages (tuple): stages to run, in order; `roll` needs `write`.
+        * root (str): directory to build the tree in; a temporary one is used and removed if None.
+        * seed (int): random seed.
+
+        **Returns**:
+
+        * results (list[dict]): one record per stage.
+
+    """
+
+    workdir = root or tempfile.mkdtemp(prefix='pando_bench_io_')
+    try:
+        t0 = time.perf_counter()
+        tree = build_tree(os.path.join(workdir, 'route'), count, width, dng_bytes, seed)
+        print(f"Built {tree['count']} pairs ({(tree['jpg_bytes'] + tree['dng_bytes']) / 2**20:.1f} MB) "
+              f"in {time.perf_counter() - t0:.1f}s")
+
+        output_dir = os.path.join(workdir, 'output')
+        config = {'count': tree['count'], 'width': width, 'dng_bytes': dng_bytes, 'mode': mode}
+        results = []
+        context = multiprocessing.get_context('spawn')
+        for stage in stages:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                record = pool.submit(_run_stage, stage, tree, output_dir, mode).result()
+            record.update(config, stage=stage,
+                          files_per_sec=record['files'] / record['seconds'],
+                          mb_per_sec=record['bytes'] / 2**20 / record['seconds'])
+            results.append(record)
+            rss, children = (
+                f"{record[key]:.0f} MB" if record[key] is not None else "n/a"
+                for key in ('peak_rss_mb', 'children_peak_rss_mb')
+            )
+            print(f"{stage:>12}: {record['seconds']:8.3f}s  {record['files_per_sec']:9.1f} files/s  "
+                  f"{record['mb_per_sec']:8.2f} MB/s  peak RSS {rss} + workers {children} "
+                  f"+ ring {record['ring_mb']:.0f} MB")
+            if record['sun_misses']:
+                print(f"{stage:>12}: sun missed in {record['sun_misses']} of {tree['count']} image(s)")
+        return results
+    finally:
+        if root is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    """
+    Main function execution.
+
+    **Args**:
+        None
+
+     **Returns**:
+        None
+
+    """
+
+    import file_io
+
+    parser = argparse.ArgumentParser(description="Benchmark load/write/roll throughput on a synthetic route.")
+    parser.add_argument('--count', type=int, default=50, help="number of JPG/DNG pairs")
+    parser.add_argument('--width', type=int, default=DEFAULT_WIDTH, help="JPG width in pixels")
+    parser.add_argument('--dng-mb', type=float, default=1.0, help="approximate size of each DNG in MB")
+    parser.add_argument('--mode', default='copy', choices=file_io.MATERIALIZE_MODES)
+    parser.add_argument('--stages', nargs='+', default=list(STAGES), choices=STAGES)
+    parser.add_argument('--root', help="keep the tree in this directory instead of a temporary one")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=DEFAULT_OUTPUT)
+    args = parser.parse_args()
+
+    results = bench(args.count, args.width, int(args.dng_mb * 2**20), args.mode, tuple(args.stages), args.root, args.seed)
+
+    report = {
+        'created': dt.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'cpus': os.cpu_count(),
+        'args': vars(args),
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
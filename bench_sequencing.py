@@ -0,0 +1,365 @@
+"""
+====================================
+Filename:         bench_sequencing.py
+Author:           Joseph Farah
+Description:      Benchmark of the sequencing engines on synthetic routes.
+====================================
+Notes
+    - Routes are generated in memory as `Point` lists whose true order
+      is known: captures on a jittered cadence, split into interleaved
+      clock segments, with random dropouts and open/end slates.
+    - Every mode in `orientation.SEQUENCE_MODES` is timed and scored
+      against the true order; results are written as JSON.
+    - 'Mark bad images' is timed on the images each engine misplaced, both
+      through `orientation.retime_moves` (`reorder`) and with a full retime
+      (`reorder_full`).
+    - Usage: `python bench_sequencing.py --sizes 100 1000 10000 --output bench.json`
+      and `--baseline old.json` to flag slowdowns against an earlier run.
+"""
+
+#------------- IMPORTS -------------#
+import sys
+import json
+import time
+import argparse
+import platform
+import warnings
+import contextlib
+import io
+import numpy as np
+import datetime as dt
+import orientation
+from point import Point, PointTable, from_seconds, to_seconds
+from file_io import output_changes
+
+
+#------------- GLOBAL SETTINGS -------------#
+DEFAULT_SIZES = (100, 1000, 10000, 100000, 1000000)
+"""Route lengths benchmarked when none are given."""
+DEFAULT_OUTPUT = 'bench_sequencing.json'
+"""File the results are written to."""
+CADENCE = 180
+"""Seconds between captures of the synthetic routes."""
+ROUTE_START = dt.datetime(2023, 7, 1, 6, 0, 0)
+"""Wall-clock time of the first synthetic capture."""
+REORDER_MOVES = 10
+"""Number of images marked bad in the reorder benchmarks."""
+REGRESSION_TOLERANCE = 0.25
+"""Relative slowdown against a baseline that is reported as a regression."""
+
+
+#------------- FUNCTIONS -------------#
+def synthetic_route(n, jitter=10.0, dropout=0.02, segments=2, cadence=CADENCE, seed=0):
+    """
+        Generate a route of `n` captures in true order. The route is split
+        into `segments` equal parts; every part after the first has its
+        clock set back so its timestamps interleave with the earlier
+        parts, with the phases spread over the cadence. The first capture
+        is the open slate and the last the end slate.
+
+        **Args**:
+
+        * n (int): number of captures before dropouts.
+        * jitter (float): standard deviation of the capture time in seconds.
+        * dropout (float): probability that a capture (other than a slate) is missing.
+        * segments (int): number of clock segments.
+        * cadence (int): seconds between captures.
+        * seed (int): random seed.
+
+        **Returns**:
+
+        * route (dict): `points` (list[Point]) in load order, `start` and
+          `end` slate indices, and `segment` (np.ndarray), the true segment
+          of each point. Load order is the true order.
+
+    """
+
+    rng = np.random.default_rng(seed)
+    seconds = to_seconds(ROUTE_START) + cadence * np.arange(n) + rng.normal(0, jitter, n).round().astype(np.int64)
+
+    segment = np.arange(n) * segments // n
+    length = n // segments
+    shifts = np.array([0] + [
+        int(cadence * length * (j + 0.5)) // cadence * cadence + j * cadence // segments + 17
+        for j in range(1, segments)
+    ])
+    seconds = seconds - shifts[segment]
+
+    keep = rng.random(n) >= dropout
+    keep[[0, -1]] = True
+    seconds, segment = seconds[keep], segment[keep]
+
+    points = [
+        Point(from_seconds(s), f"/route/jpg/IMG_{i:07d}.JPG", f"/route/dng/IMG_{i:07d}.DNG",
+              'open' if i == 0 else 'end' if i == len(seconds) - 1 else None)
+        for i, s in enumerate(seconds.tolist())
+    ]
+    return {'points': points, 'start': 0, 'end': len(points) - 1, 'segment': segment}
+
+
+def _timed(function, *args, repeats=1, **kwargs):
+    """
+        Call a function `repeats` times and keep the fastest run.
+
+        **Returns**:
+
+        * result: return value of the last call.
+        * seconds (float): fastest wall-clock time.
+
+    """
+
+    best = float('inf')
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()), warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            result = function(*args, **kwargs)
+        best = min(best, time.perf_counter() - t0)
+    return result, best
+
+
+def score(route, table, first_half_bin, new_points):
+    """
+        Compare a sequencing result with the true order.
+
+        **Args**:
+
+        * route (dict): route from `synthetic_route`.
+        * table (PointTable): the route's points in load order.
+        * first_half_bin (PointTable): first half found by the engine.
+        * new_points (PointTable): merged, retimed sequence.
+
+        **Returns**:
+
+        * scores (dict): `bin_errors`, points placed in the wrong half
+          (every segment after the first counts as the second half);
+          `order_errors`, adjacent output pairs in the wrong true order;
+          and `exact`, whether the output is the true order.
+
+    """
+
+    # load order is the true order, so a point's load row is its true rank
+    rank_of_path = np.zeros(len(table.paths), dtype=np.int64)
+    rank_of_path[table.jpg_idx] = np.arange(len(table))
+    rank = rank_of_path[new_points.jpg_idx]
+    in_first_half = np.zeros(len(table), dtype=bool)
+    in_first_half[rank_of_path[first_half_bin.jpg_idx]] = True
+
+    return {
+        'bin_errors': int(np.count_nonzero(in_first_half != (route['segment'] == 0))),
+        'order_errors': int(np.count_nonzero(np.diff(rank) < 0)),
+        'exact': bool(np.array_equal(rank, np.arange(len(rank)))),
+    }
+
+
+def _bad_images(route, table, bins, count, seed=0):
+    """
+        Positions a user would mark bad in each bin: the points the engine
+        put in the wrong segment, topped up with random points away from
+        the ends of the bins, `count` in all.
+
+        **Args**:
+
+        * route (dict): route from `synthetic_route`.
+        * table (PointTable): the route's points in load order.
+        * bins (list[PointTable]): the two halves, or the segments, found by the engine.
+        * count (int): number of positions.
+        * seed (int): random seed.
+
+        **Returns**:
+
+        * moves (list[np.ndarray]): sorted positions in each bin.
+
+    """
+
+    rng = np.random.default_rng(seed)
+    rank_of_path = np.zeros(len(table.paths), dtype=np.int64)
+    rank_of_path[table.jpg_idx] = np.arange(len(table))
+    # with two bins every segment after the first belongs to the second, as in `score`
+    truth = route['segment'] if len(bins) > 2 else np.minimum(route['segment'], 1)
+
+    lengths = np.array([len(b) for b in bins])
+    bin_of = np.repeat(np.arange(len(bins)), lengths)
+    position = np.concatenate([np.arange(n) for n in lengths])
+    found = np.concatenate([truth[rank_of_path[b.jpg_idx]] for b in bins])
+
+    wrong = rng.permutation(np.flatnonzero(found != bin_of))[:count]
+    interior = np.flatnonzero((found == bin_of) & (position > 0) & (position < lengths[bin_of] - 1))
+    chosen = np.concatenate([wrong, rng.choice(interior, size=min(count - len(wrong), len(interior)), replace=False)])
+    return [np.sort(position[chosen[bin_of[chosen] == j]]) for j in range(len(bins))]
+
+
+def bench_route(n, modes, jitter, dropout, segments, repeats=1, seed=0):
+    """
+        Benchmark every mode on one synthetic route, plus the reorder path
+        used by 'Mark bad images': `reorder` retimes only the moved images,
+        falling back to the full retime only where `retime_moves` does, and
+        `reorder_full` always retimes the whole route.
+
+        **Args**:
+
+        * n (int): route length before dropouts.
+        * modes (list[str]): modes from `orientation.SEQUENCE_MODES`.
+        * jitter (float): capture jitter in seconds.
+        * dropout (float): dropout probability.
+        * segments (int): number of clock segments.
+        * repeats (int): timed repetitions, the fastest is kept.
+        * seed (int): random seed.
+
+        **Returns**:
+
+        * results (list[dict]): one record per benchmark.
+
+    """
+
+    route = synthetic_route(n, jitter, dropout, segments, seed=seed)
+    config = {'n': len(route['points']), 'jitter': jitter, 'dropout': dropout, 'segments': segments, 'seed': seed}
+
+    table, seconds = _timed(PointTable.from_points, route['points'], repeats=repeats)
+    results = [{**config, 'benchmark': 'from_points', 'seconds': seconds}]
+
+    for mode in modes:
+        (first_half_bin, second_half_bin, new_points, model), seconds = _timed(
+            orientation.sequence, table, route['start'], route['end'], mode=mode, repeats=repeats,
+        )
+        results.append({
+            **config, 'benchmark': 'sequence', 'mode': mode, 'seconds': seconds,
+            'points_per_sec': config['n'] / seconds,
+            **score(route, table, first_half_bin, new_points),
+        })
+
+        ## mark a few images bad and rebuild the output, incrementally as 'Mark bad images' does and in full ##
+        bins = [table.take(rows) for rows in model['segments']] if 'segments' in model else [first_half_bin, second_half_bin]
+        moves = _bad_images(route, table, bins, min(REORDER_MOVES, config['n']), seed)
+        open_timestamp, mean = table.timestamps[route['start']], model['combined_mean']
+
+        def _move():
+            if 'segments' in model:
+                return orientation.move_between_segments(bins, moves, mean)
+            return list(orientation.move_between_bins(*bins, *moves)), None
+
+        def _reorder():
+            new_bins, targets = _move()
+            retimed, windows = orientation.retime_moves(new_points, bins, new_bins, moves, open_timestamp, mean, targets=targets)
+            incremental = retimed is not None
+            if not incremental:
+                retimed = orientation.retime_segments(new_bins, open_timestamp, mean)
+            changes = {'rename': [], 'write': [], 'remove': []}
+            for window in windows:
+                for key, value in output_changes(new_points[window], retimed[window], start=window.start).items():
+                    changes[key] += value
+            return retimed, changes, incremental
+
+        def _reorder_full():
+            new_bins, _ = _move()
+            retimed = orientation.retime_segments(new_bins, open_timestamp, mean)
+            return retimed, output_changes(new_points, retimed)
+
+        (retimed, changes, incremental), seconds = _timed(_reorder, repeats=repeats)
+        (full, full_changes), full_seconds = _timed(_reorder_full, repeats=repeats)
+        record = {**config, 'mode': mode, 'moves': sum(len(positions) for positions in moves)}
+        results.append({
+            **record, 'benchmark': 'reorder', 'seconds': seconds, 'renamed': len(changes['rename']),
+            'incremental': incremental,
+            'matches_full': [p.fpath for p in retimed] == [p.fpath for p in full]
+                            and np.array_equal(retimed.timestamps, full.timestamps),
+        })
+        results.append({**record, 'benchmark': 'reorder_full', 'seconds': full_seconds, 'renamed': len(full_changes['rename'])})
+
+    return results
+
+
+def compare(results, baseline, tolerance=REGRESSION_TOLERANCE):
+    """
+        Find benchmarks that got slower than in a baseline run.
+
+        **Args**:
+
+        * results (list[dict]): current results.
+        * baseline (list[dict]): results of an earlier run.
+        * tolerance (float): relative slowdown that is reported.
+
+        **Returns**:
+
+        * regressions (list[str]): one description per slower benchmark.
+
+    """
+
+    def _key(record):
+        return tuple(record.get(k) for k in ('benchmark', 'mode', 'n', 'jitter', 'dropout', 'segments'))
+
+    before = {_key(record): record for record in baseline}
+    regressions = []
+    for record in results:
+        old = before.get(_key(record))
+        if old is None:
+            continue
+        if record['seconds'] > old['seconds'] * (1 + tolerance):
+            regressions.append(
+                f"{record['benchmark']} {record.get('mode', '')} n={record['n']}: "
+                f"{old['seconds']:.4f}s -> {record['seconds']:.4f}s"
+            )
+        if record.get('bin_errors', 0) > old.get('bin_errors', 0):
+            regressions.append(
+                f"{record['benchmark']} {record.get('mode', '')} n={record['n']}: "
+                f"bin errors {old['bin_errors']} -> {record['bin_errors']}"
+            )
+    return regressions
+
+
+def main():
+    """
+    Main function execution.
+
+    **Args**:
+        None
+
+     **Returns**:
+        None
+
+    """
+
+    parser = argparse.ArgumentParser(description="Benchmark the sequencing engines on synthetic routes.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES))
+    parser.add_argument('--modes', nargs='+', default=list(orientation.SEQUENCE_MODES), choices=orientation.SEQUENCE_MODES)
+    parser.add_argument('--jitter', type=float, default=10.0)
+    parser.add_argument('--dropout', type=float, default=0.02)
+    parser.add_argument('--segments', type=int, default=2)
+    parser.add_argument('--repeats', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=DEFAULT_OUTPUT)
+    parser.add_argument('--baseline', help="earlier results file to compare against")
+    args = parser.parse_args()
+
+    results = []
+    for n in args.sizes:
+        for record in bench_route(n, args.modes, args.jitter, args.dropout, args.segments, args.repeats, args.seed):
+            print(f"{record['benchmark']:>12} {record.get('mode', ''):>9} n={record['n']:<8} {record['seconds']:9.4f}s"
+                  + (f"  bin errors {record['bin_errors']}, order errors {record['order_errors']}" if 'bin_errors' in record else '')
+                  + (f"  {'incremental' if record['incremental'] else 'full retime'}, {record['moves']} moves" if 'incremental' in record else ''))
+            results.append(record)
+
+    report = {
+        'created': dt.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'args': vars(args),
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f)['results'])
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
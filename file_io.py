@@ -10,24 +10,48 @@ Notes
  
 #------------- IMPORTS -------------#
 import os
+import sys
+import ctypes
 import exiftool
-import glob
 import shutil
 import tkinter as tk
-import traceback
 import matplotlib.pyplot as plt
 import re
-from typing import List
+import struct
+import threading
+from typing import Dict, List
 from tqdm import tqdm
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from tkinter import filedialog
 from pathlib import Path
-from point import Point
+from point import Point, PointTable
+from route_index import RouteIndex, INDEX_FILENAME
+import streaming
 
 
 
 #------------- GLOBAL SETTINGS -------------#
-
+TIMESTAMP_TAG = 'EXIF:ModifyDate'
+"""Metadata tag holding the (corrupted) capture time of each DNG."""
+EXIFTOOL_WORKERS = 4
+"""Number of persistent `exiftool -stay_open` processes used to read metadata."""
+EXIFTOOL_BATCH_SIZE = 64
+"""Number of files handed to a single exiftool `get_tags` call."""
+NATIVE_READ_WORKERS = 8
+"""Number of threads used by the native TIFF/DNG timestamp reader."""
+LOAD_CHUNK_SIZE = 256
+"""Number of points handed to the `on_points` callback of `load_points` at a time."""
+MATERIALIZE_MODE = 'copy'
+"""How `write_points` places files in the output dir; one of `MATERIALIZE_MODES`."""
+MATERIALIZE_MODES = ('copy', 'hardlink', 'reflink', 'symlink')
+"""Supported ways of materializing output files."""
+COPY_WORKERS = 8
+"""Number of threads used to materialize output files."""
+_FICLONE = 0x40049409
+"""Linux ioctl request for cloning a file's extents (reflink)."""
+_OUTPUT_NAME = re.compile(r'^\d+_(?P<tag>.*)_new-time=')
+"""Pattern recovering the source tag from an output filename."""
 
 #------------- CLASSES -------------#
 class bcolors:
@@ -128,40 +152,332 @@ def sanitize_filename(filepath: Path) -> Path:
     return Path(drive) / parent / sanitized_filename
 
 
-def write_points(points: List[Point], output_path: str):
+def _reflink(src: str, dst: str):
+    """
+    Creates `dst` as a copy-on-write clone of `src`. Raises OSError
+    if the platform or filesystem does not support cloning.
+    """
+
+    if sys.platform == 'darwin':
+        libc = ctypes.CDLL(None, use_errno=True)
+        if libc.clonefile(os.fsencode(src), os.fsencode(dst), 0) != 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), dst)
+        return
+
+    try:
+        import fcntl
+    except ImportError:
+        raise OSError(f"Reflinks are not supported on {sys.platform}")
+
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+    shutil.copystat(src, dst)
+
+def materialize(src: str, dst: str, mode: str = 'copy') -> str:
+    """
+    Places a copy of `src` at `dst`. Link-based modes fall back to a
+    plain copy when the filesystem does not support them (e.g. across
+    devices, or reflinks on ext4).
+
+    **Args**:
+        src (str): source file
+        dst (str): destination file; replaced if it exists
+        mode (str): one of `MATERIALIZE_MODES`
+
+    **Returns**:
+        mode (str): the mode that was actually used
+    """
+
+    if os.path.lexists(dst):
+        os.remove(dst)
+
+    try:
+        if mode == 'hardlink':
+            os.link(src, dst)
+            return mode
+        elif mode == 'symlink':
+            os.symlink(os.path.abspath(src), dst)
+            return mode
+        elif mode == 'reflink':
+            _reflink(src, dst)
+            return mode
+    except OSError:
+        if os.path.lexists(dst):
+            os.remove(dst)
+
+    shutil.copy2(src, dst)
+    return 'copy'
+
+def output_filename(index: int, point: Point, extension: str) -> str:
     """
-    Writes points to output directory.
+    Builds the sanitized output filename of a point.
+
+    **Args**:
+        index (int): position of the point in the sequence
+        point (Point): point being written
+        extension (str): 'jpg' or 'dng'
+
+    **Returns**:
+        filename (str): e.g. `12_IMG_0012_new-time=2000-01-01_06_37_00.jpg`
+    """
+
+    return sanitize_filename(Path(f"{index}_{normalize_name(point.tag)}_new-time={str(point.timestamp).replace(' ', '_')}.{extension}")).name
+
+def _is_current(dst: Path, src: str | None) -> bool:
+    """
+    Checks whether an existing output file still mirrors its source.
+    Size and mtime are compared, with slack for coarse filesystems.
+    """
+
+    if src is None:
+        return True
+    try:
+        st_dst, st_src = os.stat(dst), os.stat(src)
+    except OSError:
+        return False
+    return st_dst.st_size == st_src.st_size and abs(st_dst.st_mtime - st_src.st_mtime) < 2
+
+def _sync_output_subdir(directory: Path, desired: dict) -> list:
+    """
+    Brings one output subdirectory in line with the desired file set.
+    Files that are already correct are kept, files of the same source
+    under an outdated name are renamed in place, and everything else
+    is removed, except a `route_index.RouteIndex` left by the roll stage.
+
+    **Args**:
+        directory (Path): output subdirectory, e.g. `output_dir/jpgs`
+        desired (dict): maps filename to source path, or to None if the
+        file is derived output that can only be renamed (e.g. rolled JPGs)
+
+    **Returns**:
+        missing (list[tuple]): `(src, dst)` pairs that still need materializing
+        renamed (int): number of files renamed
+        removed (int): number of files removed
+    """
+
+    existing = [
+        entry.name for entry in os.scandir(directory)
+        if not entry.is_dir(follow_symlinks=False) and not entry.name.startswith(INDEX_FILENAME)
+    ]
+    by_tag = {}
+    for name in existing:
+        match = _OUTPUT_NAME.match(name)
+        if match:
+            by_tag.setdefault(match['tag'], []).append(name)
+
+    existing = set(existing)
+    moved = set()
+    missing = []
+    renamed = 0
+    for name, src in desired.items():
+        if name in existing and _is_current(directory / name, src):
+            continue
+
+        tag = _OUTPUT_NAME.match(name)['tag']
+        candidates = [
+            old for old in by_tag.get(tag, [])
+            if old != name and old not in moved and _is_current(directory / old, src)
+        ]
+        if candidates:
+            os.replace(directory / candidates[0], directory / name)
+            moved.add(candidates[0])
+            renamed += 1
+        elif src is not None:
+            missing.append((src, str(directory / name)))
+
+    removed = 0
+    for name in existing - moved - set(desired):
+        os.remove(directory / name)
+        removed += 1
+
+    return missing, renamed, removed
+
+def write_points(points: List[Point], output_path: str, mode: str = None, workers: int = None,
+                 copy_jpgs: bool = True):
+    """
+    Writes points to output directory. The directory is updated in place:
+    files that already match are kept, files whose index or timestamp
+    changed are renamed, and only new files are materialized, through a
+    bounded thread pool. Rolled JPGs in `jpgs/rolled` follow the renames.
 
     **Args**:
         points (list[Point]): list of Point objects
         output_path (str): path to output directory
+        mode (str): one of `MATERIALIZE_MODES`, defaults to `MATERIALIZE_MODE`
+        workers (int): number of copy threads, defaults to `COPY_WORKERS`
+        copy_jpgs (bool): if False, `jpgs` only holds rolled output (see
+        `PandoRoll.export_rolled`) and plain JPG copies are removed
 
     **Returns**:
         None
     """
-    
-    reset_output_dir(output_path)
 
-    for p, point in enumerate(tqdm(points)):
-        # dst_jpg and dst_dng are being converted to strings because shutil.copy2 requires string paths
-        dst_jpg = str(sanitize_filename(Path(output_path) / 'jpgs' / f"{p}_{point.tag}_new-time={str(point.timestamp).replace(' ', '_')}.jpg"))
-        dst_dng = str(sanitize_filename(Path(output_path) / 'dngs' / f"{p}_{point.tag}_new-time={str(point.timestamp).replace(' ', '_')}.dng"))
-      
-        try:
-            shutil.copy2(point.fpath, dst_jpg)  
-            shutil.copy2(point.dng, dst_dng)
-        except Exception as e:
-            print("An error occurred during file copy:")
-            print(f"Error type: {type(e).__name__}")
-            print(f"Error message: {e}")
+    mode = mode or MATERIALIZE_MODE
+    if mode not in MATERIALIZE_MODES:
+        raise ValueError(f"Unknown materialization mode {mode!r}, expected one of {MATERIALIZE_MODES}")
+
+    prepare_output_dir(output_path)
+
+    desired_jpgs, desired_dngs = {}, {}
+    for p, point in enumerate(points):
+        desired_jpgs[output_filename(p, point, 'jpg')] = point.fpath
+        desired_dngs[output_filename(p, point, 'dng')] = point.dng
+
+    jobs, renamed, removed = [], 0, 0
+    for subdir, desired in (('jpgs', desired_jpgs if copy_jpgs else {}), ('dngs', desired_dngs)):
+        missing, n_renamed, n_removed = _sync_output_subdir(Path(output_path) / subdir, desired)
+        jobs.extend(missing)
+        renamed += n_renamed
+        removed += n_removed
+
+    rolled_dir = Path(output_path) / 'jpgs' / 'rolled'
+    if rolled_dir.is_dir():
+        _sync_output_subdir(rolled_dir, dict.fromkeys(desired_jpgs))
+
+    _materialize_jobs(jobs, mode, workers)
+    written = len(desired_dngs) + (len(desired_jpgs) if copy_jpgs else 0)
+    bcolors.success(f"Output updated: {len(jobs)} written, {renamed} renamed, {removed} removed, "
+                    f"{written - len(jobs) - renamed} unchanged.")
+
+def _materialize_jobs(jobs: list, mode: str, workers: int = None):
+    """
+    Materializes `(src, dst)` pairs through a `streaming` pipeline whose
+    readers ask the OS to prefetch the sources of upcoming copies while
+    the writers copy, reporting failures and fallbacks to plain copies.
+    """
+
+    def _prefetch(job, allocate):
+        if mode == 'copy' and hasattr(os, 'posix_fadvise'):
+            with open(job[0], 'rb') as f:
+                os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+        return None, None
+
+    def _materialize(frame, job, meta, result):
+        return materialize(*job, mode=mode)
+
+    fallbacks = 0
+    workers = workers or COPY_WORKERS
+    for (src, dst), result, error in tqdm(streaming.stream(jobs, _prefetch, _materialize, writers=workers), total=len(jobs)):
+        if error is not None:
+            print(f"An error occurred while writing {dst}:")
             print("Detailed traceback:")
-            print(traceback.format_exc())
+            print(error)
+        elif result != mode:
+            fallbacks += 1
+
+    if fallbacks:
+        bcolors.warning(f"{fallbacks} file(s) could not be written as {mode} and were copied instead")
+
+def output_changes(old_points, new_points, start: int = 0) -> dict:
+    """
+    Computes the minimal set of output changes between two sequences of
+    the same route, without touching the disk. Points are matched by
+    their JPG; a point whose index and timestamp are unchanged keeps its
+    output files as they are. Both sequences may be the same slice of
+    longer sequences, starting at output index `start`.
+
+    **Args**:
+        old_points (list[Point]): sequence currently in the output directory
+        new_points (list[Point]): sequence to write
+        start (int): output index of the first point of both sequences
+
+    **Returns**:
+        changes (dict): `rename` holds `(old_index, old_point, new_index, new_point)`
+        tuples, `write` holds `(index, point)` tuples for points not in the
+        old sequence, and `remove` holds `(index, point)` tuples for points
+        no longer in the new sequence
+    """
+
+    old_rows = {point.fpath: i for i, point in enumerate(old_points, start)}
+    changes = {'rename': [], 'write': [], 'remove': []}
+    for i, point in enumerate(new_points, start):
+        j = old_rows.pop(point.fpath, None)
+        if j is None:
+            changes['write'].append((i, point))
+            continue
+        old_point = old_points[j - start]
+        if j != i or old_point.timestamp != point.timestamp:
+            changes['rename'].append((j, old_point, i, point))
+    changes['remove'] = [(j, old_points[j - start]) for j in old_rows.values()]
+    return changes
+
+def apply_changes(changes: dict, output_path: str, mode: str = None, workers: int = None):
+    """
+    Applies a change set from `output_changes` to an output directory
+    written by `write_points`. Only the listed files are touched: renamed
+    points are moved in place (rolled JPGs included), new points are
+    materialized, and dropped points are deleted. A renamed file that is
+    missing on disk is materialized again.
+
+    **Args**:
+        changes (dict): change set from `output_changes`
+        output_path (str): path to output directory
+        mode (str): one of `MATERIALIZE_MODES`, defaults to `MATERIALIZE_MODE`
+        workers (int): number of copy threads, defaults to `COPY_WORKERS`
+
+    **Returns**:
+        None
+    """
+
+    mode = mode or MATERIALIZE_MODE
+    if mode not in MATERIALIZE_MODES:
+        raise ValueError(f"Unknown materialization mode {mode!r}, expected one of {MATERIALIZE_MODES}")
+
+    prepare_output_dir(output_path)
+    output_path = Path(output_path)
+    subdirs = (
+        (output_path / 'jpgs', 'jpg', 'fpath'),
+        (output_path / 'dngs', 'dng', 'dng'),
+        (output_path / 'jpgs' / 'rolled', 'jpg', None),
+    )
+
+    jobs = [
+        (getattr(point, source), str(directory / output_filename(i, point, extension)))
+        for i, point in changes['write']
+        for directory, extension, source in subdirs if source
+    ]
+
+    for j, old_point, i, point in changes['rename']:
+        for directory, extension, source in subdirs:
+            src = directory / output_filename(j, old_point, extension)
+            dst = directory / output_filename(i, point, extension)
+            try:
+                os.replace(src, dst)
+            except FileNotFoundError:
+                if source:
+                    jobs.append((getattr(point, source), str(dst)))
+
+    for j, old_point in changes['remove']:
+        for directory, extension, _ in subdirs:
+            try:
+                os.remove(directory / output_filename(j, old_point, extension))
+            except FileNotFoundError:
+                pass
+
+    _materialize_jobs(jobs, mode, workers)
+    bcolors.success(f"Output updated: {len(jobs)} written, {len(changes['rename'])} point(s) renamed, "
+                    f"{len(changes['remove'])} removed.")
 
 def reset_output_dir(output_dir: str):
     output_path = Path(output_dir)
     if output_path.exists():
         shutil.rmtree(output_path)
 
+    prepare_output_dir(output_dir)
+
+def prepare_output_dir(output_dir: str):
+    """
+    Creates the output directory layout without touching existing files.
+
+    **Args**:
+        output_dir (str): path to output directory
+
+    **Returns**:
+        None
+    """
+
+    output_path = Path(output_dir)
     output_path.mkdir(parents=True, exist_ok=True)
     (output_path / "jpgs").mkdir(parents=True, exist_ok=True)
     (output_path / "dngs").mkdir(parents=True, exist_ok=True)
@@ -169,51 +485,337 @@ def reset_output_dir(output_dir: str):
 def get_config_filepath():
     return _window_management_helper.pick_file()
 
-def fix_file_names(dir_names: List[str]):
+def normalize_name(name: str) -> str:
     """
-    Iterates through files in directories and replaces whitespace with underscores.
+    Normalizes a filename: drops characters that are invalid on some
+    platforms and replaces whitespace with single underscores.
 
     **Args**:
-        dir_names (list[str]): List of paths to directories containing files to rename
+        name (str): filename or stem
 
     **Returns**:
-        None
+        normalized (str): normalized name
     """
-    for dir_name in dir_names:
-        try:
-            dir_path = Path(dir_name).resolve()  # Get absolute path
-            if not dir_path.exists():
-                bcolors.warning(f"Directory does not exist: {dir_name}")
+
+    # Remove invalid characters for all platforms
+    new_name = ''.join(c for c in name if c.isalnum() or c in '._- ')
+    new_name = '_'.join(new_name.split())
+    while '__' in new_name:
+        new_name = new_name.replace('__', '_')
+    return new_name
+
+def _scan_dir(directory: str, extension: str) -> dict:
+    """
+    Lists files with a given extension in a single `os.scandir` pass.
+
+    **Args**:
+        directory (str): directory to scan
+        extension (str): lowercase extension including the dot, e.g. '.jpg'
+
+    **Returns**:
+        files (dict): maps lowercased normalized stem to `(path, normalized_name, (size, mtime_ns))`
+    """
+
+    files = {}
+    if not os.path.isdir(directory):
+        # a missing directory holds no files, as it did for the glob this replaced
+        bcolors.warning(f"{directory} is not a directory; no {extension} files found")
+        return files
+    with os.scandir(directory) as it:
+        for entry in it:
+            stem, ext = os.path.splitext(entry.name)
+            if ext.lower() != extension or not entry.is_file():
+                continue
+            key = normalize_name(stem).lower()
+            if key in files:
+                bcolors.warning(f"Ignoring {entry.path}: same name as {files[key][0]} after normalization")
                 continue
+            st = entry.stat()
+            files[key] = (entry.path, normalize_name(entry.name), (st.st_size, st.st_mtime_ns))
+    return files
 
-            for file_path in dir_path.glob('*.[dDjJ][nNpP][gG]'):
-                if file_path.is_file():
+def scan_route(jpg_dir: str, dng_dir: str) -> dict:
+    """
+    Scans the JPG and DNG directories of a route once each and pairs
+    files by normalized stem. Names are normalized in memory only; the
+    source files are never renamed.
+
+    **Args**:
+        jpg_dir (str): folderpath to directory containing JPGs
+        dng_dir (str): folderpath to directory containing DNGs
+
+    **Returns**:
+        scan (dict): `pairs` (list of `(jpg, dng)` paths sorted by
+        normalized JPG name), `unmatched_jpgs` and `unmatched_dngs`
+        (lists of paths), and `stats` (maps path to `(size, mtime_ns)`)
+    """
+
+    jpgs = _scan_dir(jpg_dir, '.jpg')
+    dngs = _scan_dir(dng_dir, '.dng')
+
+    pairs, stats = [], {}
+    for key in sorted(jpgs.keys() & dngs.keys(), key=lambda k: jpgs[k][1]):
+        (jpg, _, jpg_stat), (dng, _, dng_stat) = jpgs[key], dngs[key]
+        pairs.append((jpg, dng))
+        stats[jpg] = jpg_stat
+        stats[dng] = dng_stat
+
+    return {
+        'pairs': pairs,
+        'unmatched_jpgs': sorted(jpgs[key][0] for key in jpgs.keys() - dngs.keys()),
+        'unmatched_dngs': sorted(dngs[key][0] for key in dngs.keys() - jpgs.keys()),
+        'stats': stats,
+    }
+
+def _parse_modify_date(value: str) -> datetime:
+    """
+    Converts an exiftool `ModifyDate` string into the time-of-day
+    datetime used throughout the pipeline.
+
+    **Args**:
+        value (str): date string, e.g. `2023:07:01 06:01:00`
+
+    **Returns**:
+        timestamp (datetime): parsed time of day
+    """
+
+    modify_date_hms = value.split()[-1]
+    return datetime.strptime(modify_date_hms,  '%H:%M:%S')
+
+def _read_ifd(f, endian: str, offset: int) -> dict:
+    """
+    Reads the entry table of a single TIFF image file directory.
+
+    **Args**:
+        f (file): binary file handle positioned anywhere
+        endian (str): struct byte order character, `<` or `>`
+        offset (int): absolute offset of the IFD
+
+    **Returns**:
+        entries (dict): maps tag id to `(type, count, value_bytes)`
+    """
+
+    f.seek(offset)
+    (count,) = struct.unpack(endian + 'H', f.read(2))
+    raw = f.read(12 * count)
+    if len(raw) != 12 * count:
+        raise ValueError("Truncated IFD")
+
+    entries = {}
+    for i in range(count):
+        tag, typ, n = struct.unpack(endian + 'HHI', raw[12*i:12*i + 8])
+        entries[tag] = (typ, n, raw[12*i + 8:12*i + 12])
+    return entries
+
+def _read_ascii_tag(f, endian: str, entry) -> str | None:
+    """
+    Reads the string value of an ASCII IFD entry.
+    """
+
+    if entry is None or entry[0] != 2:
+        return None
+    typ, n, value = entry
+    if n <= 4:
+        raw = value[:n]
+    else:
+        (offset,) = struct.unpack(endian + 'I', value)
+        f.seek(offset)
+        raw = f.read(n)
+    return raw.split(b'\x00', 1)[0].decode('ascii')
+
+def read_tiff_timestamp(file: str) -> datetime | None:
+    """
+    Reads the timestamp of a DNG/TIFF file without spawning exiftool.
+    Only the header and the directories on the way to the tag are read,
+    so this touches a few KB per file and is safe to call from threads.
+    `ModifyDate` (0x0132) in IFD0 is preferred, which is what exiftool
+    reports as `EXIF:ModifyDate`; `DateTimeOriginal` (0x9003) in the
+    EXIF IFD is used if it is missing.
+
+    **Args**:
+        file (str): path to DNG or TIFF file
+
+    **Returns**:
+        timestamp (datetime): parsed time of day, or None if the file
+        could not be parsed
+    """
+
+    try:
+        with open(file, 'rb') as f:
+            header = f.read(8)
+            if header[:2] == b'II':
+                endian = '<'
+            elif header[:2] == b'MM':
+                endian = '>'
+            else:
+                return None
+            magic, ifd0_offset = struct.unpack(endian + 'HI', header[2:8])
+            if magic != 42:
+                return None
+
+            ifd0 = _read_ifd(f, endian, ifd0_offset)
+            value = _read_ascii_tag(f, endian, ifd0.get(0x0132))
+
+            if not value and 0x8769 in ifd0:
+                (exif_offset,) = struct.unpack(endian + 'I', ifd0[0x8769][2])
+                exif_ifd = _read_ifd(f, endian, exif_offset)
+                value = _read_ascii_tag(f, endian, exif_ifd.get(0x9003))
+
+            return _parse_modify_date(value) if value else None
+    except (OSError, struct.error, ValueError, UnicodeDecodeError):
+        return None
+
+def get_timestamp(file: str) -> datetime:
+    """
+    Reads the timestamp of a single file with `read_tiff_timestamp`,
+    falling back to exiftool. Reading many files is faster with
+    `get_timestamps`.
+
+    **Args**:
+        file (str): path to DNG or TIFF file
+
+    **Returns**:
+        timestamp (datetime): parsed time of day; KeyError is raised
+        if no timestamp could be read
+    """
+
+    timestamp = read_tiff_timestamp(file)
+    if timestamp is None:
+        timestamp = _get_timestamps_exiftool([file], workers=1)[file]
+    return timestamp
+
+def get_timestamps(files: List[str], workers: int = None, batch_size: int = None) -> Dict[str, datetime]:
+    """
+    Reads timestamps for many files at once. Files are first parsed
+    natively with `read_tiff_timestamp` on a thread pool; only those it
+    cannot parse are handed to exiftool.
+
+    **Args**:
+        files (list[str]): paths to files (usually DNGs) to read
+        workers (int): number of exiftool processes, defaults to `EXIFTOOL_WORKERS`
+        batch_size (int): files per exiftool call, defaults to `EXIFTOOL_BATCH_SIZE`
+
+    **Returns**:
+        timestamps (dict): maps each readable file path to its timestamp
+    """
+
+    return dict(tqdm(iter_timestamps(files, workers, batch_size), total=len(files)))
+
+def iter_timestamps(files: List[str], workers: int = None, batch_size: int = None):
+    """
+    Lazily reads timestamps, see `get_timestamps`. Natively parsed files
+    are yielded in input order as soon as they are read; files that need
+    exiftool follow once every native read has finished.
+
+    **Args**:
+        files (list[str]): paths to files (usually DNGs) to read
+        workers (int): number of exiftool processes, defaults to `EXIFTOOL_WORKERS`
+        batch_size (int): files per exiftool call, defaults to `EXIFTOOL_BATCH_SIZE`
+
+    **Yields**:
+        (file, timestamp) (tuple): path and timestamp of each readable file
+    """
+
+    remaining = []
+    with ThreadPoolExecutor(max_workers=NATIVE_READ_WORKERS) as pool:
+        for file, timestamp in zip(files, pool.map(read_tiff_timestamp, files)):
+            if timestamp is not None:
+                yield file, timestamp
+            else:
+                remaining.append(file)
+
+    if remaining:
+        bcolors.warning(f"Falling back to exiftool for {len(remaining)} file(s)")
+        yield from _get_timestamps_exiftool(remaining, workers, batch_size).items()
+
+def _get_timestamps_exiftool(files: List[str], workers: int = None, batch_size: int = None) -> Dict[str, datetime]:
+    """
+    Reads timestamps for many files at once through a pool of long-lived
+    exiftool processes. Each worker thread owns one `-stay_open` process
+    and feeds it batches of files, requesting only `TIMESTAMP_TAG`.
+    Files that cannot be read are reported individually and left out
+    of the result.
+
+    **Args**:
+        files (list[str]): paths to files (usually DNGs) to read
+        workers (int): number of exiftool processes, defaults to `EXIFTOOL_WORKERS`
+        batch_size (int): files per exiftool call, defaults to `EXIFTOOL_BATCH_SIZE`
+
+    **Returns**:
+        timestamps (dict): maps each readable file path to its timestamp
+    """
+
+    workers = workers or EXIFTOOL_WORKERS
+    batch_size = batch_size or EXIFTOOL_BATCH_SIZE
+    batches = [files[i:i + batch_size] for i in range(0, len(files), batch_size)]
+
+    local = threading.local()
+    helpers = []
+    helpers_lock = threading.Lock()
+
+    def _helper():
+        if not hasattr(local, 'et'):
+            local.et = exiftool.ExifToolHelper()
+            local.et.run()
+            with helpers_lock:
+                helpers.append(local.et)
+        return local.et
+
+    def _read_batch(batch):
+        et = _helper()
+        try:
+            results = et.get_tags(batch, tags=[TIMESTAMP_TAG])
+            if len(results) == len(batch):
+                return list(zip(batch, results))
+        except exiftool.exceptions.ExifToolException:
+            pass
+
+        # a single unreadable file spoils the whole call; retry one by one to isolate it
+        pairs = []
+        for file in batch:
+            try:
+                pairs.append((file, et.get_tags(file, tags=[TIMESTAMP_TAG])[0]))
+            except (exiftool.exceptions.ExifToolException, IndexError) as e:
+                pairs.append((file, e))
+        return pairs
+
+    timestamps = {}
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(batches)))) as pool:
+            for pairs in tqdm(pool.map(_read_batch, batches), total=len(batches)):
+                for file, result in pairs:
+                    if isinstance(result, Exception):
+                        bcolors.failure(f"Failed to read metadata from {file}: {result}")
+                        continue
                     try:
-                        old_name = file_path.name
-                        # Remove invalid characters for all platforms
-                        new_name = ''.join(c for c in old_name if c.isalnum() or c in '._- ')
-                        new_name = '_'.join(new_name.split())
-                        while '__' in new_name:
-                            new_name = new_name.replace('__', '_')
-
-                        if old_name != new_name:
-                            new_path = dir_path / new_name
-                            if len(str(new_path)) < 260:  # Windows MAX_PATH
-                                file_path.rename(new_path)
-                            else:
-                                bcolors.warning(f"Path too long for: {new_path}")
-                    except OSError as e:
-                        bcolors.failure(f"Failed to rename {file_path}: {e}")
-        except Exception as e:
-            bcolors.failure(f"Error processing directory {dir_name}: {e}")
-
-def get_timestamp(file: str):
-    with exiftool.ExifToolHelper() as et:
-        metadata = et.get_metadata(file)
-        modify_date_hms = metadata[0]['EXIF:ModifyDate'].split()[-1]
-        return datetime.strptime(modify_date_hms,  '%H:%M:%S')
-
-def load_points(jpg_dir, dng_dir):
+                        timestamps[file] = _parse_modify_date(result[TIMESTAMP_TAG])
+                    except (KeyError, ValueError) as e:
+                        bcolors.failure(f"No usable {TIMESTAMP_TAG} in {file}: {e!r}")
+    finally:
+        for et in helpers:
+            et.terminate()
+
+    return timestamps
+
+def classify_slate(stem: str) -> str | None:
+    """
+    Classifies an image as the open slate, end slate, or neither
+    based on its filename.
+
+    **Args**:
+        stem (str): filename without extension
+
+    **Returns**:
+        slate (str): 'open', 'end' or None
+    """
+
+    if 'open' in stem.lower():
+        return 'open'
+    elif 'end' in stem.lower():
+        return 'end'
+    return None
+
+def load_points(jpg_dir, dng_dir, on_points=None):
     """
         Loads JPGs from a directory, converts to points,
         and links to DNGs. 
@@ -221,10 +823,18 @@ def load_points(jpg_dir, dng_dir):
         **Args**:
             jpg_dir (str): folderpath to directory containing JPGs
             dng_dir (str): folderpath to directory containing DNGs
+            on_points (callable): optional; called with each `LOAD_CHUNK_SIZE`
+            points, as a `point.PointTable` in load order, as soon as their
+            timestamps are read (e.g. `orientation.OnlineSequencer.add`)
 
          **Returns**:
             loaded_obj (dict): dictionary containing start/end 
-            index and orientation.Point objects
+            index and a `point.PointTable` of the route
+
+        JPGs and DNGs are paired by normalized filename stem; files
+        without a partner are reported and skipped. Metadata is cached
+        in a `route_index.RouteIndex` next to the JPGs, so reloading an
+        unchanged route does not re-read EXIF.
 
     """
     if jpg_dir is None or dng_dir is None: 
@@ -232,43 +842,86 @@ def load_points(jpg_dir, dng_dir):
         input("\n\n>>>Press enter to return to the main menu.")
         return
 
-    points = []
+    records = []
     start_index = end_index = 0
 
-    fix_file_names([jpg_dir, dng_dir])
-
-    dngs = sorted(glob.glob(str(Path(dng_dir)/"*.[dD][nN][gG]")))
-    jpgs = sorted(glob.glob(str(Path(jpg_dir)/"*.[jJ][pP][gG]")))
+    scan = scan_route(jpg_dir, dng_dir)
+    for jpg_path in scan['unmatched_jpgs']:
+        bcolors.warning(f"No matching DNG for {jpg_path}, skipping.")
+    for dng_path in scan['unmatched_dngs']:
+        bcolors.warning(f"No matching JPG for {dng_path}, skipping.")
 
-    if len(jpgs) != len(dngs):
-        bcolors.failure(f"Mismatch in number of files: {len(jpgs)} JPGs vs {len(dngs)} DNGs")
+    if not scan['pairs']:
+        bcolors.failure(f"No JPG/DNG pairs found in {jpg_dir} and {dng_dir}")
         input("\n\n>>>Press enter to return to the main menu.")
         return
 
-    # need to pass total to fix rendering bug when using tqdm with zip
-    for i, (jpg_path, dng_path) in enumerate(tqdm(zip(jpgs, dngs), total=len(jpgs))):
-        path_obj = Path(jpg_path)
-        try:
-            ## get corrupted timestamp ##
-            timestamp = get_timestamp(dngs[i])
-
-            ## check for open slate ##
-            if 'open' in path_obj.stem.lower():
-                print(f"Found open slate at {timestamp}.")
-                points.append(Point(timestamp, jpg_path, dng_path, 'open'))
-                start_index = i
-            ## check for end slate ##
-            elif 'end' in path_obj.stem.lower():
-                print(f"Found end slate at {timestamp}.")
-                points.append(Point(timestamp, jpg_path, dng_path, 'end'))
-                end_index = i
-            else:
-                points.append(Point(timestamp, jpg_path, dng_path, None))
+    jpgs, dngs = (list(paths) for paths in zip(*scan['pairs']))
+
+    with RouteIndex.for_route(jpg_dir) as index:
+        ## reuse metadata cached for files unchanged since the last load ##
+        keys = scan['stats']
+        cached = index.fresh_entries(keys)
+
+        timestamps = {
+            dng: RouteIndex.timestamp(cached[dng]) for dng in dngs
+            if dng in cached and cached[dng]['timestamp'] is not None
+        }
+        stale_dngs = [dng for dng in dngs if dng not in timestamps]
+
+        ## get corrupted timestamps for new or modified files, read lazily in load order ##
+        new_rows = []
+        fresh_timestamps = iter_timestamps(stale_dngs)
+        emitted = 0
+
+        # need to pass total to fix rendering bug when using tqdm with zip
+        for i, (jpg_path, dng_path) in enumerate(tqdm(zip(jpgs, dngs), total=len(jpgs))):
+            path_obj = Path(jpg_path)
+            while dng_path not in timestamps:
+                fresh = next(fresh_timestamps, None)
+                if fresh is None:
+                    break
+                timestamps[fresh[0]] = fresh[1]
+                new_rows.append({'path': fresh[0], 'timestamp': fresh[1]})
+
+            if on_points is not None and len(records) - emitted >= LOAD_CHUNK_SIZE:
+                on_points(PointTable.from_records(records[emitted:]))
+                emitted = len(records)
+
+            try:
+                ## get corrupted timestamp ##
+                timestamp = timestamps[dng_path]
+
+                row = cached.get(jpg_path)
+                if row is not None and row['pair'] == dng_path:
+                    slate = row['slate']
+                else:
+                    slate = classify_slate(normalize_name(path_obj.stem))
+                    new_rows.append({'path': jpg_path, 'slate': slate, 'pair': dng_path})
+
+                ## check for open slate ##
+                if slate == 'open':
+                    print(f"Found open slate at {timestamp}.")
+                    start_index = len(records)
+                ## check for end slate ##
+                elif slate == 'end':
+                    print(f"Found end slate at {timestamp}.")
+                    end_index = len(records)
+                records.append((timestamp, jpg_path, dng_path, slate))
+
+            except IndexError:
+                bcolors.failure(f"Failed to process file pair {i}: JPG exists but no matching DNG")
+                continue
+            except KeyError:
+                bcolors.failure(f"Skipping file pair {i}: no timestamp could be read from {dng_path}")
+                continue
 
-        except IndexError:
-            bcolors.failure(f"Failed to process file pair {i}: JPG exists but no matching DNG")
-            continue
+        index.update(new_rows, keys)
+
+    if on_points is not None and len(records) > emitted:
+        on_points(PointTable.from_records(records[emitted:]))
 
+    points = PointTable.from_records(records)
     return {'points': points, 'start': start_index, 'end': end_index}
 
 
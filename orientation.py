@@ -10,299 +10,1530 @@ Notes
 """
 #------------- imports -------------#
 import os
-import copy
+import heapq
+import itertools
+import warnings
 import numpy as np
 import datetime as dt
 import shutil
-from file_io import reset_output_dir, write_points
+from file_io import reset_output_dir, write_points, output_changes, apply_changes
 from pathlib import Path
+from point import Point, PointTable, SLATES, to_seconds
 from tqdm import tqdm
 
 
+#------------- globals -------------#
+SEQUENCE_MODES = ('legacy', 'viterbi', 'segments')
+"""Available sequencing engines for `statistical_sequence`."""
+DEFAULT_CADENCE = (180, 45)
+"""Fallback capture cadence (mean, std) in seconds when it cannot be estimated."""
+VITERBI_MAX_RUN = 12
+"""Longest run of consecutive captures from one half the `viterbi` mode allows between the slates."""
+VITERBI_MAX_MISSED = 3
+"""Number of consecutive missed captures a single gap may span in the `viterbi` mode."""
+VITERBI_MISSED_PENALTY = 4.0
+"""Cost (negative log-likelihood) of each missed capture in the `viterbi` mode."""
+SEGMENT_TOLERANCE = 0.3
+"""Largest fraction of the cadence a gap may deviate from whole captures and still be fitted as one run in the `segments` mode."""
+SEGMENT_SMOOTHING = 0.25
+"""Width of the kernel smoothing the phase density in the `segments` mode, as a fraction of the capture jitter."""
+SEGMENT_PEAK_SIGNIFICANCE = 2.5
+"""Standard deviations of counting noise a valley must lie below two phase peaks to keep them as separate segments."""
+SEGMENT_ACTIVE_WINDOW = 5
+"""Capture intervals on either side over which the `segments` mode decides whether a segment is running."""
+SEGMENT_SPLIT_GAP = 20
+"""Captures a phase group may miss in a row before the `segments` mode splits it into two segments."""
+SEGMENT_MIN_POINTS = 3
+"""Smaller segments are treated as jittered frames and folded into a neighbouring segment."""
+SEGMENT_MERGED_SHARE = 0.1
+"""Share of a phase group's intervals holding two captures above which it is split in two."""
+RETIME_START = dt.time(6, 1, 0)
+"""Time assigned to the open slate when retiming a route."""
+RETIME_END = dt.time(7, 6, 0)
+"""Expected time of the end slate, reported after retiming."""
+
+
 #------------- functions -------------#
-def statistical_sequence(points, start_index, end_index, output_path):
+def _legacy_cadence_model(ts, first_half_rows, second_half_rows):
+    """
+        Estimate capture cadence of each half exactly as the original
+        sequencer did, including its fallback to `DEFAULT_CADENCE`
+        whenever a half holds a single point.
+
+        **Args**:
+
+        * ts (np.ndarray): int64 timestamps in seconds.
+        * first_half_rows (np.ndarray): rows known to lie in the first half, excluding the open slate.
+        * second_half_rows (np.ndarray): rows known to lie in the second half.
+
+        **Returns**:
+
+        * model (dict): `fh_mean`, `fh_std`, `sh_mean`, `sh_std`, `combined_mean`, `combined_std`
 
     """
-        Perform statistical sequencing sort of Point objects.
-    
+
+    if len(first_half_rows) == 1 or len(second_half_rows) == 1:
+        mean, std = DEFAULT_CADENCE
+        return dict(fh_mean=mean, fh_std=std, sh_mean=mean, sh_std=std, combined_mean=mean, combined_std=std)
+
+    # `Point.__sub__` returns `timedelta.seconds`, i.e. the difference modulo one day
+    diffs_fh = (np.diff(ts[first_half_rows]) % 86400).astype(np.float64)
+    diffs_sh = (np.diff(ts[second_half_rows]) % 86400).astype(np.float64)
+    diffs_combined = np.concatenate([diffs_sh, diffs_fh])
+
+    with np.errstate(all='ignore'), warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        return dict(
+            fh_mean=np.mean(diffs_fh), fh_std=np.std(diffs_fh),
+            sh_mean=np.mean(diffs_sh), sh_std=np.std(diffs_sh),
+            combined_mean=np.mean(diffs_combined), combined_std=np.std(diffs_combined),
+        )
+
+
+def _legacy_second_half_order(ts, second_half_rows, pairs_fh, pairs_sh, open_row, model):
+    """
+        Reproduce the order in which the original greedy loop inserted
+        points into the second half bin. Only needed to break ties
+        between identical timestamps the same way it did.
+
         **Args**:
-    
-        * points (list): list of Point objects to be sorted.
+
+        * ts (np.ndarray): int64 timestamps in seconds.
+        * second_half_rows (np.ndarray): initial second half rows.
+        * pairs_fh (np.ndarray): rows the loop placed in the first half.
+        * pairs_sh (np.ndarray): rows the loop placed in the second half.
+        * open_row (int): row of the open slate.
+        * model (dict): cadence model from `_legacy_cadence_model`.
+
+        **Returns**:
+
+        * order (list): second half rows in insertion order.
+
+    """
+
+    order = list(second_half_rows)
+    with np.errstate(all='ignore'):
+        prev_fh = np.concatenate([[ts[open_row]], ts[pairs_fh[:-1]]])
+        sigma_fh = ((ts[pairs_fh] - prev_fh) % 86400 - model['fh_mean']) / model['fh_std']
+
+        for j, row in enumerate(pairs_sh):
+            if not order:
+                order.append(row)
+                continue
+            sigma_sh = ((ts[pairs_fh[j]] - ts[order[-1]]) % 86400 - model['sh_mean']) / model['sh_std']
+            if sigma_fh[j] < sigma_sh:
+                order.insert(-1, row)
+            else:
+                order.append(row)
+    return order
+
+
+def _definitive_split(ts, start_index, end_index):
+    """
+        Assign the points whose half follows directly from the slates:
+        points earlier than the open slate belong to the second half,
+        points later than the end slate to the first half. Everything
+        in between is left for the sequencing engine.
+
+        **Args**:
+
+        * ts (np.ndarray): int64 timestamps in seconds, in load order.
         * start_index (int): index of open slate.
         * end_index (int): index of end slate.
-        * output_path (str): directory to save sorted images.
-    
+
         **Returns**:
-    
-        * first_half_bin (list): first half of Point objects, sorted.
-        * second_half_bin (list): second half of Point objects, sorted.
-        * new_points (list): merged list of sorted Point objects.
-        * diffs_combined_mean: statistical assessment of capture frequency
-    
-    """
 
-    points_replace = []
+        * first_half_rows (np.ndarray): rows later than the end slate, in load order.
+        * second_half_rows (np.ndarray): rows earlier than the open slate, in load order.
+        * rows_replace (np.ndarray): rows between the slates, in load order.
 
-    first_half_bin = []
-    second_half_bin = []
+    """
 
-    first_half_bin.append(points[start_index])
+    rows = np.arange(len(ts))
+    start_ts, end_ts = ts[start_index], ts[end_index]
 
+    keep = (ts != start_ts) & (ts != end_ts)
+    early = keep & (ts < start_ts)
+    late = keep & ~early & (ts > end_ts)
 
-    #------------- sort definitive images -------------#
-    for p, point in enumerate(points):
-        if point.timestamp == points[start_index].timestamp or point.timestamp == points[end_index].timestamp:
-            continue
+    excluded = (len(ts) - 2) - np.count_nonzero(keep)
+    if excluded > 0:
+        print(f"Warning: {excluded} points were excluded from sorting")
 
-        if point.timestamp < points[start_index].timestamp:
-            second_half_bin.append(point)
-        elif point.timestamp > points[end_index].timestamp:
-            first_half_bin.append(point)
-        else:
-            points_replace.append(point)
+    return rows[late], rows[early], rows[keep & ~early & ~late]
 
-    total_sorted = len(points_replace) + len(first_half_bin) + len(second_half_bin)
-    expected_total = len(points) - 2  # subtract 2 for start/end slates
-    if total_sorted < expected_total:
-        print(f"Warning: {expected_total - total_sorted} points were excluded from sorting")
 
-    if len(first_half_bin) == 0:
-        # If no points are later than end slate, initialize first_half_bin
-        # with points that are closest to the end slate timestamp
-        first_half_bin = points_replace[-len(points_replace)//2:]
-        points_replace = points_replace[:-len(points_replace)//2]
+def _legacy_bins(ts, start_index, end_index):
+    """
+        Vectorized equivalent of the original greedy loop: the points
+        between the slates alternate between halves in load order.
+        See `sequence_bins` for arguments and return values.
+    """
 
-    if len(second_half_bin) == 0:
-        # If no points are earlier than start slate, initialize second_half_bin
-        # with points that are closest to the start slate timestamp
-        second_half_bin = points_replace[:len(points_replace)//2]
-        points_replace = points_replace[len(points_replace)//2:]
+    first_half_rows, second_half_rows, rows_replace = _definitive_split(ts, start_index, end_index)
 
+    if len(second_half_rows) == 0:
+        # If no points are earlier than start slate, initialize the second
+        # half with points that are closest to the start slate timestamp
+        second_half_rows = rows_replace[:len(rows_replace)//2]
+        rows_replace = rows_replace[len(rows_replace)//2:]
 
     #------------- build model for each -------------#
-    try:
-        diffs_first_half_mean = np.mean(np.diff(first_half_bin[1:]))
-        diffs_first_half_std = np.std(np.diff(first_half_bin[1:]))
-
-        diffs_second_half_mean = np.mean(np.diff(second_half_bin))
-        diffs_second_half_std = np.std(np.diff(second_half_bin))
-
-        diffs_combined_mean = np.mean(np.concatenate([np.diff(second_half_bin), np.diff(first_half_bin[1:])]))
-        diffs_combined_std = np.std(np.concatenate([np.diff(second_half_bin), np.diff(first_half_bin[1:])]))
-    except ZeroDivisionError:
-        diffs_first_half_mean = 180
-        diffs_first_half_std = 45
-        diffs_second_half_mean = 180
-        diffs_second_half_std = 45
-        diffs_combined_mean = 180
-        diffs_combined_std = 45
-    except IndexError:
-        diffs_first_half_mean = 180
-        diffs_first_half_std = 45
-        diffs_second_half_mean = 180
-        diffs_second_half_std = 45
-        diffs_combined_mean = 180
-        diffs_combined_std = 45
+    model = _legacy_cadence_model(ts, first_half_rows, second_half_rows)
 
     #------------- perform probability sort -------------#
+    pairs_fh = rows_replace[0::2]
+    pairs_sh = rows_replace[1::2]
 
-    ## set marker ##
-    fh_marker = 1
-    sh_marker = -1
+    fh = np.concatenate([[start_index], pairs_fh, first_half_rows]).astype(np.int64)
+    sh = np.concatenate([second_half_rows, pairs_sh, [end_index]]).astype(np.int64)
+    if len(np.unique(ts[sh])) != len(sh):
+        sh = np.array(
+            _legacy_second_half_order(ts, second_half_rows, pairs_fh, pairs_sh, start_index, model) + [end_index],
+            dtype=np.int64,
+        )
 
-    ## begin by iterating through every point chrono ##
-    SKIP = False
-    for p, point in enumerate(points_replace):
+    fh = fh[np.argsort(ts[fh], kind='stable')]
+    sh = sh[np.argsort(ts[sh], kind='stable')]
 
-        if SKIP: 
-            SKIP = False
-            continue
+    return fh, sh, model
+
+
+def _gap_stats(diffs, fallback):
+    """
+        Mean and standard deviation of capture gaps, ignoring gaps that
+        span missed captures (longer than 1.5 times the median).
+
+        **Args**:
+
+        * diffs (np.ndarray): gaps between consecutive captures of one stream.
+        * fallback (tuple): (mean, std) returned if fewer than two gaps remain.
+
+        **Returns**:
+
+        * stats (tuple): (mean, std), with the std floored at one second.
+
+    """
+
+    diffs = diffs[diffs <= 1.5 * np.median(diffs)] if len(diffs) else diffs
+    if len(diffs) < 2:
+        return fallback
+    return float(np.mean(diffs)), max(float(np.std(diffs)), 1.0)
+
+
+def _cadence_model(first_half_ts, second_half_ts):
+    """
+        Estimate the capture cadence of each half from sorted timestamps,
+        see `_gap_stats`. A half with fewer than two usable gaps
+        borrows the combined estimate, and `DEFAULT_CADENCE` is used
+        when nothing can be estimated.
+
+        **Args**:
 
-        ## point must either belong immediately 
-        ## after last point in first_half_bin 
-        ## or immediately after last point in
-        ## second half bin, excluding start/end
+        * first_half_ts (np.ndarray): sorted timestamps known to be in the first half.
+        * second_half_ts (np.ndarray): sorted timestamps known to be in the second half.
 
-        # probability of lying after LP in FHB 
-        sigma_prob_FH = (point - first_half_bin[fh_marker-1]-diffs_first_half_mean)/diffs_first_half_std
+        **Returns**:
+
+        * model (dict): `fh_mean`, `fh_std`, `sh_mean`, `sh_std`, `combined_mean`, `combined_std`
+
+    """
+
+    diffs_fh, diffs_sh = np.diff(first_half_ts), np.diff(second_half_ts)
+    diffs_combined = np.concatenate([diffs_sh, diffs_fh])
 
-        # probability of lying after LP in SHB
-        sigma_prob_SH = (point - second_half_bin[sh_marker]-diffs_second_half_mean)/diffs_second_half_std
+    combined = _gap_stats(diffs_combined, DEFAULT_CADENCE)
+    fh, sh = _gap_stats(diffs_fh, combined), _gap_stats(diffs_sh, combined)
+    return dict(
+        fh_mean=fh[0], fh_std=fh[1], sh_mean=sh[0], sh_std=sh[1],
+        combined_mean=combined[0], combined_std=combined[1],
+    )
 
-        print(point - first_half_bin[fh_marker-1], point - second_half_bin[sh_marker], sigma_prob_FH, sigma_prob_SH)
 
-        # lower sigma indicates higher probability 
-        if sigma_prob_FH < sigma_prob_SH:
-            first_half_bin.insert(fh_marker, point)
-            if p < len(points_replace)-1:
-                second_half_bin.insert(sh_marker, points_replace[p+1])
+def _viterbi_labels(ts, context_before, context_after, model, max_run):
+    """
+        Find the maximum-likelihood split of a run of interleaved captures
+        into two streams. Each stream is modelled as a chain whose gaps
+        are Gaussian with the stream's cadence; the state at each point is
+        its stream and the length of the current run of that stream, which
+        locates the previous capture of the other stream. A gap may also
+        span a few missed captures at a fixed penalty each. Runs longer than
+        `max_run` are not allowed, so time and memory are O(n * max_run).
+
+        **Args**:
+
+        * ts (np.ndarray): sorted timestamps of the interleaved captures.
+        * context_before (tuple): last timestamp of each stream before `ts` (nan if unknown).
+        * context_after (tuple): next timestamp of each stream after `ts` (nan if unknown).
+        * model (dict): cadence model, see `_cadence_model`.
+        * max_run (int): longest allowed run of a single stream.
+
+        **Returns**:
+
+        * labels (np.ndarray): 0 for the first half, 1 for the second half.
+        * confidence (np.ndarray): per-point confidence in its label, in [0.5, 1].
+
+    """
+
+    m, R = len(ts), max_run
+    ts = ts.astype(np.float64)
+    mean = np.array([model['fh_mean'], model['sh_mean']])
+    std = np.array([model['fh_std'], model['sh_std']])
+    before = np.asarray(context_before, dtype=np.float64)
+    after = np.asarray(context_after, dtype=np.float64)
+    run = np.arange(1, R + 1)
+
+    missed = np.arange(VITERBI_MAX_MISSED + 1)
+
+    def _cost(gap, label):
+        # a gap may span a few missed captures, each costing `VITERBI_MISSED_PENALTY`
+        gap, label = np.asarray(gap)[..., None], np.asarray(label)[..., None]
+        z = (gap - (missed + 1) * mean[label]) / std[label]
+        cost = (0.5 * z * z + missed * VITERBI_MISSED_PENALTY).min(axis=-1)
+        return np.where(np.isnan(cost), 0.0, cost)
+
+    def _last_other(k, label):
+        # last capture of `label` before k + 1, if the run ending at k belongs to the other stream
+        idx = np.asarray(k)[..., None] - run
+        return np.where(idx >= 0, ts[np.maximum(idx, 0)], before[label])
+
+    ## transition costs for every point, computed once ##
+    # same[k, l]: point k continues a run of stream l
+    # switch[k, l, r]: point k joins stream l after a run of length r + 1 of the other stream
+    k = np.arange(1, m)
+    same = np.zeros((m, 2))
+    same[1:] = _cost((ts[1:] - ts[:-1])[:, None], np.arange(2))
+    switch = np.zeros((m, 2, R), dtype=np.float32)
+    for label in (0, 1):
+        switch[1:, label] = _cost(ts[1:, None] - _last_other(k - 1, label), label)
+
+    #------------- forward pass -------------#
+    F = np.empty((m, 2, R), dtype=np.float32)
+    bp = np.zeros((m, 2), dtype=np.int16)
+    f = np.full((2, R), np.inf)
+    f[:, 0] = [_cost(ts[0] - before[0], 0), _cost(ts[0] - before[1], 1)]
+    F[0] = f - f.min()
+    for k in range(1, m):
+        prev = F[k-1]
+        f[:, 1:] = prev[:, :-1] + same[k][:, None]
+        c = prev[::-1] + switch[k]
+        bp[k] = c.argmin(axis=1)
+        f[:, 0] = c[(0, 1), bp[k]]
+        F[k] = f - f.min()
+
+    #------------- backward pass and decoding -------------#
+    # terminal cost: each stream continues into the first capture after the run
+    b = np.stack([
+        _cost(after[label] - ts[m-1], label) + _cost(after[1-label] - _last_other(m-1, 1-label), 1-label)
+        for label in (0, 1)
+    ])
+    total = F[m-1] + b
+    label, r = np.unravel_index(np.argmin(total), total.shape)
+
+    labels = np.empty(m, dtype=np.int8)
+    margins = np.empty(m)
+    b_prev = np.full((2, R), np.inf)
+    for k in range(m-1, -1, -1):
+        labels[k] = label
+        marginal = (F[k] + b).min(axis=1)
+        margins[k] = marginal[1-label] - marginal[label]
+        if k == 0:
+            break
+
+        # advance the backward costs from k to k-1
+        b_prev[:, :-1] = b[:, 1:] + same[k][:, None]
+        b_prev[:, -1] = np.inf
+        b_prev = np.minimum(b_prev, (b[:, :1] + switch[k])[::-1])
+        b = b_prev - b_prev.min()
+
+        if r > 0:
+            r -= 1
         else:
-            if p < len(points_replace)-1:
-                second_half_bin.append(points_replace[p+1])
-            first_half_bin.insert(fh_marker, point)
+            label, r = 1 - label, bp[k, label]
 
-        SKIP = True
-        fh_marker+=1
+    confidence = 1.0 / (1.0 + np.exp(-np.maximum(margins, 0)))
+    return labels, confidence
 
-    second_half_bin.append(points[end_index])
 
-    second_half_bin = sorted(second_half_bin, key=lambda x:x.timestamp)
-    first_half_bin = sorted(first_half_bin, key=lambda x:x.timestamp)
+def _viterbi_bins(ts, start_index, end_index, max_run=None):
+    """
+        Globally optimal two-stream split of the points between the
+        slates, see `_viterbi_labels`. See `sequence_bins` for arguments
+        and return values; the model additionally holds a per-point
+        `confidence` array (1 for points placed by the slates).
+    """
 
+    first_half_rows, second_half_rows, rows_replace = _definitive_split(ts, start_index, end_index)
+    # the slates sit on the far side of the overlap from these runs, so leave them out
+    model = _cadence_model(np.sort(ts[first_half_rows]), np.sort(ts[second_half_rows]))
+
+    confidence = np.ones(len(ts))
+    region = rows_replace[np.argsort(ts[rows_replace], kind='stable')]
+    if len(region):
+        early_ts = ts[second_half_rows]
+        late_ts = ts[first_half_rows]
+        labels, region_confidence = _viterbi_labels(
+            ts[region],
+            context_before=(ts[start_index], early_ts.max() if len(early_ts) else np.nan),
+            context_after=(late_ts.min() if len(late_ts) else np.nan, ts[end_index]),
+            model=model,
+            max_run=max_run or VITERBI_MAX_RUN,
+        )
+        confidence[region] = region_confidence
+    else:
+        labels = np.zeros(0, dtype=np.int8)
+
+    fh = np.concatenate([[start_index], region[labels == 0], first_half_rows]).astype(np.int64)
+    sh = np.concatenate([second_half_rows, region[labels == 1], [end_index]]).astype(np.int64)
+    fh = fh[np.argsort(ts[fh], kind='stable')]
+    sh = sh[np.argsort(ts[sh], kind='stable')]
+
+    model['confidence'] = confidence
+    return fh, sh, model
+
+
+def _fit_cadence(ts, cadence, max_missed):
+    """
+        Refine the capture interval from runs of consecutive captures in
+        load order. Within a run every capture lies a whole number of
+        intervals after the first, so one least-squares line per run,
+        all sharing their slope, gives the interval to a small fraction of
+        a second however long the route is. An average of the gaps would
+        be off by enough to drift the phase of a long route.
 
+        **Args**:
 
-    #------------- merge lists -------------#
-    def time_plus(time, timedelta):
-        start = dt.datetime(
-            2000, 1, 1,
-            hour=time.hour, minute=time.minute, second=time.second)
-        end = start + timedelta
-        end = dt.datetime(
-            2000, 1, 1,
-            hour=end.hour, minute=end.minute, second=end.second)
-        return end
+        * ts (np.ndarray): timestamps in load order.
+        * cadence (float): first estimate of the capture interval in seconds.
+        * max_missed (int): consecutive missed captures a gap of a run may span.
 
-    start_time = dt.time(6,1,0)
-    end_time = dt.time(7,6,0)
+        **Returns**:
 
-    bad_start_time = points[start_index].timestamp
+        * cadence (float): capture interval in seconds.
+        * jitter (float): standard deviation of the captures around their
+          runs' lines in seconds, floored at one second.
 
-    new_points = []
-    for point in first_half_bin:
-        pointcopy = copy.deepcopy(point)
+    """
 
-        time_elapsed_bad_start = pointcopy.timestamp - bad_start_time
-        pointcopy.timestamp = time_plus(start_time, time_elapsed_bad_start)
-        new_points.append(pointcopy)
+    if len(ts) < 3:
+        return cadence, 1.0
+    t = (ts - ts.min()).astype(np.float64)
+    diffs = np.diff(t)
+    steps = np.rint(diffs / cadence)
+    linked = (steps >= 1) & (steps <= max_missed + 1) & (np.abs(diffs - steps * cadence) <= SEGMENT_TOLERANCE * cadence)
+    run = np.concatenate([[0], np.cumsum(~linked)])
+    index = np.concatenate([[0], np.cumsum(np.where(linked, steps, 0))])
+
+    counts = np.bincount(run)
+    dt_ = t - (np.bincount(run, t) / counts)[run]
+    dm = index - (np.bincount(run, index) / counts)[run]
+    if not np.any(dm):
+        return cadence, 1.0
+    cadence = float(np.dot(dm, dt_) / np.dot(dm, dm))
+    residuals = dt_ - cadence * dm
+    jitter = np.sqrt(np.dot(residuals, residuals) / max(1, len(t) - len(counts) - 1))
+    return cadence, max(float(jitter), 1.0)
+
+
+def _phase_segments(ts, cadence, jitter):
+    """
+        Group sorted timestamps by their phase within the capture interval.
+        Captures of one clock segment share a phase up to their jitter, so
+        the segments are the peaks of the phase density, cut at the
+        valleys between peaks. Peaks whose valley does not lie
+        `SEGMENT_PEAK_SIGNIFICANCE` standard deviations of counting noise
+        below the lower of them are merged. O(n) in the number of points.
 
+        **Args**:
 
-    bad_start_time = second_half_bin[0].timestamp
-    sh_start_time = time_plus(new_points[-1].timestamp, dt.timedelta(seconds=6*diffs_combined_mean))
+        * ts (np.ndarray): sorted timestamps.
+        * cadence (float): capture interval in seconds, see `_fit_cadence`.
+        * jitter (float): capture jitter in seconds.
 
+        **Returns**:
 
-    for point in second_half_bin:
-        pointcopy = copy.deepcopy(point)
+        * labels (np.ndarray): phase group of each timestamp.
+        * phases (np.ndarray): mean phase of each group in seconds after `ts[0]`.
 
-        time_elapsed_bad_start = pointcopy.timestamp - bad_start_time
-        pointcopy.timestamp = time_plus(sh_start_time, time_elapsed_bad_start)
-        new_points.append(pointcopy)
+    """
 
-    write_points(new_points, output_path)
+    width = max(jitter / 2, 0.5)
+    n_bins = max(8, int(np.ceil(cadence / width)))
+    phase = ((ts - ts[0]) % cadence) / cadence
+    binned = np.minimum((phase * n_bins).astype(np.int64), n_bins - 1)
+
+    # circular convolution with a narrow Gaussian, normalized to counts per bin
+    distance = np.minimum(np.arange(n_bins), n_bins - np.arange(n_bins)) * cadence / n_bins
+    kernel = np.exp(-0.5 * (distance / (SEGMENT_SMOOTHING * jitter)) ** 2)
+    kernel /= kernel.sum()
+    counts = np.fft.rfft(np.bincount(binned, minlength=n_bins))
+    density = np.fft.irfft(counts * np.fft.rfft(kernel), n_bins)
+    # captures within one and two jitters, for testing sparse routes
+    scales = [density] + [
+        np.fft.irfft(counts * np.fft.rfft((distance <= reach * jitter).astype(np.float64)), n_bins)
+        for reach in (1, 2)
+    ]
+
+    def _span(left, right):
+        return np.arange(left, right + (n_bins if right <= left else 0)) % n_bins
+
+    def _valley(left, right):
+        span = _span(left, right)
+        return span[np.argmin(density[span])]
+
+    def _distinct(a, b):
+        # the valley must lie well below the lower peak, beyond its counting noise, at some scale
+        for values in scales:
+            low = min(values[a], values[b])
+            if low - values[_span(a, b)].min() > SEGMENT_PEAK_SIGNIFICANCE * np.sqrt(max(low, 1.0)):
+                return True
+        return False
+
+    ## merge peaks separated by shallow valleys, weakest first ##
+    peaks = list(np.flatnonzero((density > np.roll(density, 1)) & (density >= np.roll(density, -1))))
+    while len(peaks) > 1:
+        shallow = [
+            (min(density[a], density[b]), j)
+            for j, (a, b) in enumerate(zip(peaks, peaks[1:] + peaks[:1]))
+            if not _distinct(a, b)
+        ]
+        if not shallow:
+            break
+        _, j = min(shallow)
+        a, b = peaks[j], peaks[(j + 1) % len(peaks)]
+        peaks.remove(a if density[a] < density[b] else b)
+
+    ## every bin belongs to the peak between the valleys around it ##
+    group = np.zeros(n_bins, dtype=np.int64)
+    if len(peaks) > 1:
+        cuts = [_valley(a, b) for a, b in zip(peaks, peaks[1:] + peaks[:1])]
+        for j, (start, stop) in enumerate(zip(cuts[-1:] + cuts[:-1], cuts)):
+            span = np.arange(start + 1, stop + 1 + (n_bins if stop <= start else 0)) % n_bins
+            group[span] = j
+    labels = group[binned]
+    return labels, _group_phases(ts - ts[0], labels, cadence)
+
+
+def _group_phases(offset, labels, cadence):
+    """
+        Circular mean phase in seconds of each group of timestamp offsets.
+    """
 
-    print(f"END SLATE: {end_time}. Predicted from merge: {new_points[-1].timestamp}")
+    angle = np.exp(2j * np.pi * (offset % cadence) / cadence)
+    mean = np.bincount(labels, angle.real) + 1j * np.bincount(labels, angle.imag)
+    return (np.angle(mean) / (2 * np.pi) % 1) * cadence
 
-    return first_half_bin, second_half_bin, new_points, diffs_combined_mean
 
+def _split_merged(ts, labels, phases, cadence):
+    """
+        Split phase groups that hold more than one clock segment. One
+        segment takes a single capture per interval, so a group where more
+        than `SEGMENT_MERGED_SHARE` of the intervals, and at least
+        `SEGMENT_MIN_POINTS`, hold two or more captures merges segments
+        too close in phase for `_phase_segments` to tell apart; the first capture of each such interval seeds one group and
+        the last another, and the rest of the group joins the nearer of
+        the two in phase. Repeats until no group holds two captures in an
+        interval that often.
+
+        **Args**:
+
+        * ts (np.ndarray): sorted timestamps.
+        * labels (np.ndarray): phase group of each timestamp.
+        * phases (np.ndarray): phase of each group in seconds after `ts[0]`.
+        * cadence (float): capture interval in seconds.
 
+        **Returns**:
 
+        * labels (np.ndarray): phase group of each timestamp.
+        * phases (np.ndarray): phase of each group in seconds after `ts[0]`.
 
-def suggest_reordering(points, first_half_bin, second_half_bin, output_path, start_index, end_index, diffs_combined_mean):
+    """
 
+    offset = (ts - ts[0]).astype(np.float64)
+    labels, phases = labels.copy(), phases.astype(np.float64)
+    while True:
+        # intervals centred on each group's phase, far from its captures
+        period = np.floor((offset - phases[labels]) / cadence + 0.5).astype(np.int64)
+        order = np.lexsort((offset, period, labels))
+        same = (np.diff(labels[order]) == 0) & (np.diff(period[order]) == 0)
+        doubled = np.bincount(labels[order][1:][same], minlength=len(phases))
+        occupied = np.bincount(labels[order][1:][~same], minlength=len(phases)) + 1
+        share = np.where(doubled >= SEGMENT_MIN_POINTS, doubled / occupied, 0.0)
+        g = int(np.argmax(share))
+        if share[g] <= SEGMENT_MERGED_SHARE:
+            return labels, phases
+
+        rows = order[labels[order] == g]
+        starts = np.concatenate([[True], np.diff(period[rows]) != 0])
+        ends = np.concatenate([starts[1:], [True]])
+        first, last = rows[starts & ~ends], rows[ends & ~starts]
+        seeds = np.concatenate([first, last])
+        seed_phases = _group_phases(offset[seeds], np.repeat([0, 1], [len(first), len(last)]), cadence)
+
+        # phase distance of every row of the group to both seeds
+        dist = np.abs(offset[rows, None] - seed_phases[None, :]) % cadence
+        dist = np.minimum(dist, cadence - dist)
+        labels[rows] = np.where(dist[:, 1] < dist[:, 0], len(phases), g)
+        labels[first], labels[last] = g, len(phases)
+        phases = np.append(phases, 0.0)
+        phases[[g, -1]] = seed_phases
+
+
+def _match_periods(ts, labels, phases, cadence, jitter):
     """
-        Get list of indices of bad images, swap their bins, and reperform sort.
+        Reassign sorted timestamps to phase groups one capture interval at
+        a time, using that every running group takes one capture per
+        interval and captures and groups keep their phase order. A group
+        is running in an interval while it holds captures in at least half
+        the intervals of a `SEGMENT_ACTIVE_WINDOW` around it. A capture
+        costs its squared phase distance in jitters, plus
+        `VITERBI_MISSED_PENALTY` if its group is not running, and a
+        running group without a capture costs the same penalty. Each
+        capture goes to its cheapest group, and the few intervals where
+        that gives two captures to one group or a capture to a group that
+        is not running are solved exactly by `_match_interval`. A capture
+        that jittered into the phase of a stopped group, or of a neighbour
+        that already has its capture, so returns to its own group.
+
+        **Args**:
+
+        * ts (np.ndarray): sorted timestamps.
+        * labels (np.ndarray): phase group of each timestamp, see `_phase_segments`.
+        * phases (np.ndarray): phase of each group in seconds after `ts[0]`.
+        * cadence (float): capture interval in seconds.
+        * jitter (float): capture jitter in seconds.
+
+        **Returns**:
+
+        * labels (np.ndarray): phase group of each timestamp.
+
+    """
+
+    k = len(phases)
+    if k < 2:
+        return labels
+
+    # intervals start in the widest phase gap between groups, far from every group
+    ordered = np.sort(phases)
+    gaps = np.diff(np.concatenate([ordered, ordered[:1] + cadence]))
+    cut = ordered[np.argmax(gaps)] + gaps.max() / 2
+    offset = (ts - ts[0]).astype(np.float64) - cut
+    period = np.floor(offset / cadence).astype(np.int64)
+    within = offset - period * cadence
+    period -= period.min()
+    position = (phases - cut) % cadence
+    by_phase = np.argsort(position)
+    rank = np.argsort(by_phase)
+
+    n_periods = period.max() + 1
+    window = 2 * SEGMENT_ACTIVE_WINDOW + 1
+    distance = 0.5 * ((within[:, None] - position[None, :]) / jitter) ** 2
+    for _ in range(2):
+        hits = np.zeros((k, n_periods + window))
+        hits[labels, period + SEGMENT_ACTIVE_WINDOW + 1] = 1
+        total = np.cumsum(hits, axis=1)
+        running = (total[:, window:] - total[:, :-window]) * 2 >= window
+        cost = distance + VITERBI_MISSED_PENALTY * ~running[:, period].T
+
+        labels = np.argmin(cost, axis=1)
+        unsure = ~running[labels, period]
+        unsure[1:] |= (np.diff(period) == 0) & (np.diff(rank[labels]) <= 0)
+        intervals = np.unique(period[unsure])
+        bounds = np.searchsorted(period, np.stack([intervals, intervals + 1]))
+        for start, stop in bounds.T.tolist():
+            p = period[start]
+            matched = _match_interval(cost[start:stop][:, by_phase], running[by_phase, p])
+            labels[start:stop] = np.where(matched >= 0, by_phase[matched], labels[start:stop])
+    return labels
+
+
+def _match_interval(cost, running):
+    """
+        Order-preserving match of the captures of one interval to the
+        phase groups, see `_match_periods`, solved like an edit distance.
+        A capture left unmatched (e.g. one that crossed into the next
+        interval) costs twice `VITERBI_MISSED_PENALTY`.
+
+        **Args**:
+
+        * cost (np.ndarray): cost of each capture (rows) in each group (columns), both in phase order.
+        * running (np.ndarray): whether each group is running in the interval.
+
+        **Returns**:
+
+        * columns (np.ndarray): matched column of each capture, -1 if unmatched.
+
+    """
+
+    m, q = cost.shape
+    missed = VITERBI_MISSED_PENALTY * running
+    total = np.zeros((m + 1, q + 1))
+    total[0, 1:] = np.cumsum(missed)
+    total[1:, 0] = 2 * VITERBI_MISSED_PENALTY * np.arange(1, m + 1)
+    move = np.zeros((m + 1, q + 1), dtype=np.int8)
+    move[1:, 0] = 2
+    move[0, 1:] = 1
+    for i in range(1, m + 1):
+        for j in range(1, q + 1):
+            options = (
+                total[i - 1, j - 1] + cost[i - 1, j - 1],  # capture i in group j
+                total[i, j - 1] + missed[j - 1],  # group j without a capture
+                total[i - 1, j] + 2 * VITERBI_MISSED_PENALTY,  # capture i unmatched
+            )
+            move[i, j] = min(range(3), key=options.__getitem__)
+            total[i, j] = options[move[i, j]]
+
+    columns = np.full(m, -1)
+    i, j = m, q
+    while i > 0:
+        if move[i, j] == 0:
+            columns[i - 1] = j - 1
+            i, j = i - 1, j - 1
+        elif move[i, j] == 1:
+            j -= 1
+        else:
+            i -= 1
+    return columns
+
+
+def _split_runs(ts, labels, max_gap):
+    """
+        Split phase groups at gaps longer than `max_gap`, so segments that
+        share a phase but not a stretch of time are kept apart.
+
+        **Args**:
+
+        * ts (np.ndarray): sorted timestamps.
+        * labels (np.ndarray): phase group of each timestamp.
+        * max_gap (float): largest gap in seconds inside one segment.
+
+        **Returns**:
+
+        * labels (np.ndarray): segment id of each timestamp.
+
+    """
+
+    order = np.argsort(labels, kind='stable')
+    breaks = np.concatenate([[True], (np.diff(labels[order]) != 0) | (np.diff(ts[order]) > max_gap)])
+    runs = np.empty(len(ts), dtype=np.int64)
+    runs[order] = np.cumsum(breaks) - 1
+    return runs
+
+
+def _absorb_fragments(labels, min_points):
+    """
+        Reassign points of segments smaller than `min_points`, which are
+        frames that jittered out of their segment, to the segment of the
+        nearest point in load order.
+
+        **Args**:
+
+        * labels (np.ndarray): segment id of each point, in load order.
+        * min_points (int): smallest segment that is kept.
+
+        **Returns**:
+
+        * labels (np.ndarray): segment ids after absorbing, renumbered from 0.
+
+    """
+
+    counts = np.bincount(labels)
+    if counts.max() < min_points:
+        return np.zeros_like(labels)
+    kept = counts[labels] >= min_points
+    kept_rows = np.flatnonzero(kept)
+    rows = np.flatnonzero(~kept)
+
+    # nearest kept row on either side, preferring the earlier one on ties
+    after = np.clip(np.searchsorted(kept_rows, rows), 0, len(kept_rows) - 1)
+    before = np.clip(after - 1, 0, len(kept_rows) - 1)
+    nearest = np.where(
+        np.abs(kept_rows[before] - rows) <= np.abs(kept_rows[after] - rows),
+        kept_rows[before], kept_rows[after],
+    )
+
+    labels = labels.copy()
+    labels[rows] = labels[nearest]
+    return np.unique(labels, return_inverse=True)[1]
+
+
+def _chain_fragments(ts, labels, cadence, max_gap):
+    """
+        Join segments that continue one another in time, e.g. a clock
+        that jumped forward between two captures. Each segment, taken in
+        order of its first capture, continues the untaken segment that
+        ended last within `max_gap` before it; a heap of the segments that
+        have ended keeps this O(k log k).
+
+        **Args**:
+
+        * ts (np.ndarray): sorted timestamps.
+        * labels (np.ndarray): segment id of each timestamp.
+        * cadence (float): capture interval in seconds.
+        * max_gap (float): largest gap in seconds that can be bridged.
+
+        **Returns**:
+
+        * labels (np.ndarray): segment ids after chaining, renumbered from 0.
+
+    """
+
+    n_segments = labels.max() + 1
+    first = np.full(n_segments, np.iinfo(np.int64).max)
+    last = np.full(n_segments, np.iinfo(np.int64).min)
+    np.minimum.at(first, labels, ts)
+    np.maximum.at(last, labels, ts)
+
+    parent = np.arange(n_segments)
+    by_last = np.argsort(last, kind='stable').tolist()
+    ended = []  # (-last capture, segment) of segments that ended before the current one
+    cursor = 0
+    for b in np.argsort(first, kind='stable').tolist():
+        while cursor < len(by_last) and last[by_last[cursor]] < first[b] - cadence / 2:
+            heapq.heappush(ended, (-last[by_last[cursor]], by_last[cursor]))
+            cursor += 1
+        if ended and first[b] + ended[0][0] <= max_gap:
+            _, a = heapq.heappop(ended)
+            parent[b] = parent[a]
+        elif ended:
+            # later segments start later still, so nothing ended can be bridged any more
+            ended.clear()
+
+    return np.unique(parent[labels], return_inverse=True)[1]
+
+
+def _segment_bins(ts, start_index, end_index):
+    """
+        Split a route into k clock segments by the phase of their captures
+        within the cadence, see `_phase_segments` and `_split_merged`,
+        then split, absorb and chain the groups into segments. Segments are ordered with the open
+        slate's segment first, the end slate's segment last, and any others
+        by load order. Segments need to be further apart in phase than
+        about twice the capture jitter. See `sequence_bins` for arguments
+        and return values; the model additionally holds the ordered row
+        arrays under `segments`.
+    """
+
+    # consecutive files are consecutive captures except at the few segment
+    # boundaries, so load order gives the cadence for any k
+    load_diffs = np.diff(ts)
+    cadence, _ = _gap_stats(load_diffs[load_diffs > 0], DEFAULT_CADENCE)
+    cadence, jitter = _fit_cadence(ts, cadence, VITERBI_MAX_MISSED)
+    max_gap = (VITERBI_MAX_MISSED + 1) * cadence
+
+    order = np.argsort(ts, kind='stable')
+    sorted_ts = ts[order]
+    segment_of = np.empty(len(ts), dtype=np.int64)
+    labels, phases = _phase_segments(sorted_ts, cadence, jitter)
+    labels, phases = _split_merged(sorted_ts, labels, phases, cadence)
+    labels = _match_periods(sorted_ts, labels, phases, cadence, jitter)
+    labels = _split_runs(sorted_ts, labels, SEGMENT_SPLIT_GAP * cadence)
+    segment_of[order] = labels
+    labels = _absorb_fragments(segment_of, SEGMENT_MIN_POINTS)[order]
+    labels = _chain_fragments(sorted_ts, labels, cadence, max_gap)
+
+    segment_of[order] = labels
+    segments = [order[labels == k] for k in range(labels.max() + 1)]
+
+    def _rank(k):
+        if segment_of[start_index] == k:
+            return (0, 0)
+        if segment_of[end_index] == k:
+            return (2, 0)
+        return (1, segments[k].min())
+
+    segments = [segments[k] for k in sorted(range(len(segments)), key=_rank)]
+    print(f"Found {len(segments)} clock segment(s) of sizes {[len(segment) for segment in segments]}.")
+
+    inner = np.concatenate([np.diff(ts[segment]) for segment in segments])
+    combined = _gap_stats(inner, DEFAULT_CADENCE)
+    model = _cadence_model(ts[segments[0]], ts[segments[-1]])
+    model.update(combined_mean=combined[0], combined_std=combined[1], segments=segments)
+
+    fh = segments[0]
+    sh = np.concatenate(segments[1:]) if len(segments) > 1 else np.zeros(0, dtype=np.int64)
+    sh = sh[np.argsort(ts[sh], kind='stable')]
+    return fh, sh, model
+
+
+def sequence_bins(ts, start_index, end_index, mode='legacy'):
+    """
+        Split a route into its first and second half using only the
+        timestamp array.
+
+        * `legacy` reproduces the original greedy sequencer.
+        * `viterbi` finds the maximum-likelihood two-stream split over the
+          cadence model and reports a per-point confidence.
+        * `segments` tracks any number of interleaved clock segments; the
+          second half then holds every segment after the first.
+
+        **Args**:
+
+        * ts (np.ndarray): int64 timestamps in seconds, in load order.
+        * start_index (int): index of open slate.
+        * end_index (int): index of end slate.
+        * mode (str): one of `SEQUENCE_MODES`.
+
+        **Returns**:
+
+        * first_half_rows (np.ndarray): rows of the first half, sorted by timestamp.
+        * second_half_rows (np.ndarray): rows of the second half, sorted by timestamp.
+        * model (dict): cadence statistics of both halves.
+
+    """
+
+    engines = {
+        'legacy': _legacy_bins,
+        'viterbi': _viterbi_bins,
+        'segments': _segment_bins,
+    }
+    if mode not in engines:
+        raise ValueError(f"Unknown sequencing mode {mode!r}, expected one of {SEQUENCE_MODES}")
+
+    return engines[mode](np.asarray(ts, dtype=np.int64), start_index, end_index)
+
+
+def _retime_offsets(segments, open_timestamp, diffs_combined_mean):
+    """
+        Seconds `retime_segments` adds to the timestamps of each sorted
+        segment, as unwrapped seconds of day. Only depends on the first and
+        last timestamp of each segment.
+    """
+
+    if isinstance(open_timestamp, dt.datetime):
+        open_timestamp = to_seconds(open_timestamp)
+
+    gap = dt.timedelta(seconds=6*diffs_combined_mean) // dt.timedelta(seconds=1)
+    last = RETIME_START.hour*3600 + RETIME_START.minute*60 + RETIME_START.second
+    offsets = []
+    for j, segment in enumerate(segments):
+        if j == 0:
+            offset = last - open_timestamp
+        else:
+            offset = last + gap - (segment.timestamps[0] if len(segment) else 0)
+        offsets.append(int(offset))
+        if len(segment):
+            last = offset + segment.timestamps[-1]
+    return offsets
+
+
+def retime_segments(segments, open_timestamp, diffs_combined_mean):
+    """
+        Retime sorted segments and stitch them into one sequence. The first
+        segment is anchored so the open slate lands on `RETIME_START`; each
+        following segment starts six capture intervals after the last point
+        of the one before it. New timestamps are computed on the timestamp
+        arrays, the segments are stitched with a heap-based k-way merge on
+        the new times (O(n log k)), and the result shares every other
+        column with its inputs.
+
+        **Args**:
+
+        * segments (list[PointTable]): segments in route order, each sorted.
+        * open_timestamp (datetime/int): original timestamp of the open slate.
+        * diffs_combined_mean: statistical assessment of capture frequency
+
+        **Returns**:
+
+        * new_points (PointTable): merged, retimed points.
+
+    """
+
+    day = to_seconds(dt.datetime(2000, 1, 1))
+    offsets = _retime_offsets(segments, open_timestamp, diffs_combined_mean)
+    keys = [offset + segment.timestamps for offset, segment in zip(offsets, segments)]
+
+    #------------- merge lists -------------#
+    streams = [zip(new, itertools.repeat(j), range(len(new))) for j, new in enumerate(keys)]
+    order = [(j, pos) for _, j, pos in heapq.merge(*streams)]
+    offsets = np.cumsum([0] + [len(segment) for segment in segments])[:-1]
+    rows = np.array([offsets[j] + pos for j, pos in order], dtype=np.int64)
+
+    merged = PointTable.concat(segments).take(rows)
+    return merged.retimed(day + np.concatenate(keys)[rows] % 86400)
+
+
+def retime(first_half_bin, second_half_bin, open_timestamp, diffs_combined_mean):
+    """
+        Merge both sorted halves into one retimed sequence, see
+        `retime_segments`.
+
+        **Args**:
+
+        * first_half_bin (PointTable): first half, sorted.
+        * second_half_bin (PointTable): second half, sorted.
+        * open_timestamp (datetime/int): original timestamp of the open slate.
+        * diffs_combined_mean: statistical assessment of capture frequency
+
+        **Returns**:
+
+        * new_points (PointTable): merged, retimed points.
+
+    """
+
+    return retime_segments([first_half_bin, second_half_bin], open_timestamp, diffs_combined_mean)
+
+
+def sequence(points, start_index, end_index, mode='legacy'):
+
+    """
+        Sequence and retime points without writing any output, see
+        `statistical_sequence`.
+    
+        **Args**:
     
+        * points (PointTable/list): points to be sorted.
+        * start_index (int): index of open slate.
+        * end_index (int): index of end slate.
+        * mode (str): sequencing engine, one of `SEQUENCE_MODES`.
+    
+        **Returns**:
+    
+        * first_half_bin (PointTable): first half of points, sorted.
+        * second_half_bin (PointTable): second half of points, sorted.
+        * new_points (PointTable): merged, retimed points.
+        * model (dict): cadence model of the engine, see `sequence_bins`,
+          with the load rows of both halves in output order under `rows`.
+    
+    """
+
+    points = PointTable.from_points(points)
+    fh_rows, sh_rows, model = sequence_bins(points.timestamps, start_index, end_index, mode=mode)
+
+    first_half_bin = points.take(fh_rows)
+    second_half_bin = points.take(sh_rows)
+    model['rows'] = np.concatenate([fh_rows, sh_rows])
+
+    #------------- merge lists -------------#
+    if 'segments' in model:
+        segments = [points.take(rows) for rows in model['segments']]
+        new_points = retime_segments(segments, points.timestamps[start_index], model['combined_mean'])
+    else:
+        new_points = retime(first_half_bin, second_half_bin, points.timestamps[start_index], model['combined_mean'])
+
+    return first_half_bin, second_half_bin, new_points, model
+
+
+def statistical_sequence(points, start_index, end_index, output_path, mode='legacy', writer=None, sequenced=None):
+
+    """
+        Perform statistical sequencing sort of Point objects.
     
         **Args**:
     
-        * points (list): list of Point objects to be sorted.
-        * first_half_bin (list): first half of Point objects, previously sorted.
-        * second_half_bin (list): second half of Point objects, previously sorted.
-        * new_points (list): merged list of sorted Point objects.
+        * points (PointTable/list): points to be sorted.
         * start_index (int): index of open slate.
         * end_index (int): index of end slate.
         * output_path (str): directory to save sorted images.
-        * diffs_combined_mean: statistical assessment of capture frequency
+        * mode (str): sequencing engine, one of `SEQUENCE_MODES`.
+        * writer (callable): writes the output as `writer(new_points, output_path)`, defaults to `write_points`.
+        * sequenced (tuple): result of `sequence` for these points and `mode`, if already known.
     
         **Returns**:
     
-        * new_first_half_bin (list): first half of Point objects, newly sorted.
-        * new_second_half_bin (list): second half of Point objects, newly sorted.
-        * new_points (list): merged list of sorted Point objects.
+        * first_half_bin (PointTable): first half of points, sorted.
+        * second_half_bin (PointTable): second half of points, sorted.
+        * new_points (PointTable): merged, retimed points.
         * diffs_combined_mean: statistical assessment of capture frequency
     
     """
-     
-    
 
-    print("Which images are bad?")
-    bad_images = []
-    while 1:
-        num = input("Enter number, any other char will break >>> ")
-        try: 
-            num = int(num)
-        except ValueError:
-            break
-        bad_images.append(num)
+    if sequenced is None:
+        sequenced = sequence(points, start_index, end_index, mode=mode)
+    first_half_bin, second_half_bin, new_points, model = sequenced
+    diffs_combined_mean = model['combined_mean']
 
+    if 'confidence' in model:
+        confidence = model['confidence'][model['rows']]
+        uncertain = np.argsort(confidence, kind='stable')[:10]
+        uncertain = uncertain[confidence[uncertain] < 0.9]
+        if len(uncertain):
+            print("Least certain placements (output index: confidence):")
+            print(", ".join(f"{i}: {confidence[i]:.2f}" for i in sorted(uncertain)))
 
-    fh_badims, sh_badims = [], []
-    for idx in bad_images:
-        if idx > len(first_half_bin):
-            sh_badims.append(idx-len(first_half_bin))
-        else:
-            fh_badims.append(idx)
+    (writer or write_points)(new_points, output_path)
 
+    print(f"END SLATE: {RETIME_END}. Predicted from merge: {new_points[-1].timestamp}")
 
-    new_second_half_bin = copy.deepcopy(second_half_bin)
-    new_first_half_bin = copy.deepcopy(first_half_bin)
+    return first_half_bin, second_half_bin, new_points, diffs_combined_mean
 
-    for idx in sh_badims:
-        new_first_half_bin.append(new_second_half_bin[idx])
-    for idx in fh_badims:
-        new_second_half_bin.append(new_first_half_bin[idx])
 
 
-    for i in sorted(fh_badims, reverse=True):
-        del new_first_half_bin[i]
+def _insert_sorted(table, moved):
+    """
+        Insert rows into a sorted table without re-sorting it. Produces the
+        same order as a stable sort of `table` followed by `moved`.
+
+        **Args**:
 
-    for i in sorted(sh_badims, reverse=True):
-        del new_second_half_bin[i]
+        * table (PointTable): sorted table.
+        * moved (PointTable): rows to insert, in any order.
 
-         
+        **Returns**:
 
+        * merged (PointTable): sorted table holding the rows of both.
 
-    new_second_half_bin = sorted(new_second_half_bin, key=lambda x:x.timestamp)
-    new_first_half_bin = sorted(new_first_half_bin, key=lambda x:x.timestamp)
+    """
 
+    moved = moved.sort()
+    at = np.searchsorted(table.timestamps, moved.timestamps, side='right')
+    positions = np.empty(len(table) + len(moved), dtype=np.int64)
+    positions[np.arange(len(table)) + np.searchsorted(at, np.arange(len(table)), side='right')] = np.arange(len(table))
+    positions[at + np.arange(len(moved))] = len(table) + np.arange(len(moved))
+    return PointTable.concat([table, moved]).take(positions)
 
-    #------------- merge lists -------------#
-    def time_plus(time, timedelta):
-        start = dt.datetime(
-            2000, 1, 1,
-            hour=time.hour, minute=time.minute, second=time.second)
-        end = start + timedelta
-        end = dt.datetime(
-            2000, 1, 1,
-            hour=end.hour, minute=end.minute, second=end.second)
-        return end
 
-    start_time = dt.time(6,1,0)
-    end_time = dt.time(7,6,0)
+def move_between_bins(first_half_bin, second_half_bin, fh_moves, sh_moves):
+    """
+        Move rows between two sorted bins. Only the moved rows are sorted;
+        they are spliced into the other bin with a binary search, so the
+        result matches re-sorting both bins from scratch.
+
+        **Args**:
+
+        * first_half_bin (PointTable): first half of points, sorted.
+        * second_half_bin (PointTable): second half of points, sorted.
+        * fh_moves (np.ndarray): positions in the first half to move to the second.
+        * sh_moves (np.ndarray): positions in the second half to move to the first.
+
+        **Returns**:
+
+        * new_first_half_bin (PointTable): first half of points, sorted.
+        * new_second_half_bin (PointTable): second half of points, sorted.
+
+    """
+
+    fh_keep = np.ones(len(first_half_bin), dtype=bool)
+    fh_keep[fh_moves] = False
+    sh_keep = np.ones(len(second_half_bin), dtype=bool)
+    sh_keep[sh_moves] = False
+
+    new_first_half_bin = _insert_sorted(first_half_bin.take(np.flatnonzero(fh_keep)), second_half_bin.take(sh_moves))
+    new_second_half_bin = _insert_sorted(second_half_bin.take(np.flatnonzero(sh_keep)), first_half_bin.take(fh_moves))
+    return new_first_half_bin, new_second_half_bin
+
+
+def move_between_segments(segments, moves, cadence):
+    """
+        Move rows between k sorted clock segments. A moved row joins the
+        other segment whose captures around its timestamp fit it best on
+        the capture grid; a segment that already holds a capture in the
+        same interval, or whose nearest capture is more than
+        `VITERBI_MAX_MISSED` captures away, fits worst. With two segments
+        a row simply changes sides, as with `move_between_bins`.
+
+        **Args**:
+
+        * segments (list[PointTable]): segments in route order, each sorted.
+        * moves (list[np.ndarray]): positions to move out of each segment.
+        * cadence (float): capture interval in seconds.
 
-    bad_start_time = points[start_index].timestamp
+        **Returns**:
 
-    new_points = []
-    for point in new_first_half_bin:
-        pointcopy = copy.deepcopy(point)
+        * new_segments (list[PointTable]): segments after the move, each sorted.
+        * targets (list[np.ndarray]): segment each moved row of `moves` went to.
 
-        time_elapsed_bad_start = pointcopy.timestamp - bad_start_time
-        pointcopy.timestamp = time_plus(start_time, time_elapsed_bad_start)
-        new_points.append(pointcopy)
+    """
 
+    targets = []
+    for j, positions in enumerate(moves):
+        ts = segments[j].timestamps[positions]
+        fit = np.full((len(segments), len(ts)), np.inf)
+        for k, segment in enumerate(segments):
+            if k == j or not len(segment):
+                continue
+            at = np.searchsorted(segment.timestamps, ts)
+            gaps = np.stack([
+                np.abs(ts - segment.timestamps[np.maximum(at - 1, 0)]),
+                np.abs(segment.timestamps[np.minimum(at, len(segment) - 1)] - ts),
+            ]).min(axis=0).astype(np.float64)
+            deviation = np.abs(gaps - cadence * np.round(gaps / cadence))
+            clash = (gaps < cadence / 2) | (gaps > (VITERBI_MAX_MISSED + 1.5) * cadence)
+            fit[k] = np.where(clash, cadence, deviation)
+        targets.append(np.argmin(fit, axis=0) if len(segments) > 1 else np.zeros(len(ts), dtype=np.int64))
+
+    new_segments = []
+    for k, segment in enumerate(segments):
+        keep = np.ones(len(segment), dtype=bool)
+        keep[moves[k]] = False
+        incoming = [segments[j].take(moves[j][targets[j] == k]) for j in range(len(segments))]
+        new_segments.append(_insert_sorted(segment.take(np.flatnonzero(keep)), PointTable.concat([segment.take([])] + incoming)))
+    return new_segments, targets
+
+
+def _merge_rank(bins, offsets, stream, positions):
+    """
+        Position in the output of `retime_segments` of rows at `positions`
+        of bin `stream`, found with a binary search in every other bin.
+    """
+
+    keys = offsets[stream] + bins[stream].timestamps[positions]
+    rank = np.asarray(positions, dtype=np.int64).copy()
+    for other, table in enumerate(bins):
+        if other != stream:
+            # equal times keep the bin order of the heap merge
+            side = 'right' if other < stream else 'left'
+            rank += np.searchsorted(table.timestamps, keys - offsets[other], side=side)
+    return rank
+
+
+def _moved_positions(table, moved):
+    """
+        Positions of the rows of `moved` in the sorted `table` they were
+        inserted into.
+    """
 
-    bad_start_time = new_second_half_bin[0].timestamp
-    sh_start_time = time_plus(new_points[-1].timestamp, dt.timedelta(seconds=6*diffs_combined_mean))
+    positions = np.searchsorted(table.timestamps, moved.timestamps, side='left')
+    for i, jpg in enumerate(moved.jpg_idx):
+        # step over rows sharing the timestamp; the bins may not share a path pool
+        while table.paths[table.jpg_idx[positions[i]]] != moved.paths[jpg]:
+            positions[i] += 1
+    return positions
 
 
-    for point in new_second_half_bin:
-        pointcopy = copy.deepcopy(point)
+def retime_moves(new_points, bins, new_bins, moves, open_timestamp, diffs_combined_mean, targets=None):
+    """
+        Update a retimed sequence after `move_between_bins` or
+        `move_between_segments` without retiming the whole route. As long as every bin keeps its offset,
+        see `retime_segments`, a point that stays in its bin keeps its
+        time, so only the points between the old and new position of a
+        moved point change their index. Only those windows are merged
+        again and only the moved points are retimed.
+
+        **Args**:
+
+        * new_points (PointTable): sequence retimed from `bins`.
+        * bins (list[PointTable]): sorted bins before the move.
+        * new_bins (list[PointTable]): sorted bins after the move.
+        * moves (list[np.ndarray]): positions moved out of each bin.
+        * open_timestamp (datetime/int): original timestamp of the open slate.
+        * diffs_combined_mean: statistical assessment of capture frequency
+        * targets (list[np.ndarray]): bin each moved row went to; by default
+          the other of two bins.
+
+        **Returns**:
+
+        * new_points (PointTable): merged, retimed points, or None if a bin
+          changed its offset or `new_points` is not the merge of `bins`,
+          and the route needs a full `retime_segments`.
+        * windows (list[slice]): output positions whose point or time may
+          have changed.
+
+    """
 
-        time_elapsed_bad_start = pointcopy.timestamp - bad_start_time
-        pointcopy.timestamp = time_plus(sh_start_time, time_elapsed_bad_start)
-        new_points.append(pointcopy)
+    day = to_seconds(dt.datetime(2000, 1, 1))
+    offsets = _retime_offsets(bins, open_timestamp, diffs_combined_mean)
+    if _retime_offsets(new_bins, open_timestamp, diffs_combined_mean) != offsets:
+        return None, [slice(0, len(new_points))]
 
-    write_points(new_points, output_path)
+    ## the sequence must be the merge of the bins at the moved rows and the ends of each bin ##
+    if len(new_points) != sum(len(table) for table in bins):
+        return None, [slice(0, len(new_points))]
+    for j, table in enumerate(bins):
+        if not len(table):
+            continue
+        positions = np.unique(np.concatenate([moves[j], [0, len(table) - 1]]).astype(np.int64))
+        rank = _merge_rank(bins, offsets, j, positions)
+        times = day + (offsets[j] + table.timestamps[positions]) % 86400
+        paths = [new_points.paths[i] for i in new_points.jpg_idx[rank]]
+        if not np.array_equal(new_points.timestamps[rank], times) or paths != [table.paths[i] for i in table.jpg_idx[positions]]:
+            return None, [slice(0, len(new_points))]
+
+    old_rank, new_rank, new_keys = [], [], []
+    for j, positions in enumerate(moves):
+        if not len(positions):
+            continue
+        to = targets[j] if targets is not None else np.full(len(positions), 1 - j)
+        for k in np.unique(to):
+            moved = bins[j].take(positions[to == k])
+            old_rank.append(_merge_rank(bins, offsets, j, positions[to == k]))
+            new_rank.append(_merge_rank(new_bins, offsets, k, _moved_positions(new_bins[k], moved)))
+            new_keys.append(offsets[k] + moved.timestamps)
+    if not old_rank:
+        return new_points, []
+    old_rank, new_rank, new_keys = map(np.concatenate, (old_rank, new_rank, new_keys))
+
+    ## splice the moved points into the window of unmoved ones ##
+    start = int(min(old_rank.min(), new_rank.min()))
+    stop = int(max(old_rank.max(), new_rank.max())) + 1
+    stays = np.ones(stop - start, dtype=bool)
+    stays[old_rank - start] = False
+    window = np.empty(stop - start, dtype=np.int64)
+    free = np.ones(stop - start, dtype=bool)
+    free[new_rank - start] = False
+    window[free] = start + np.flatnonzero(stays)
+    window[new_rank - start] = old_rank
+
+    rows = np.arange(len(new_points))
+    rows[start:stop] = window
+    timestamps = new_points.timestamps[rows]
+    timestamps[new_rank] = day + new_keys % 86400
+
+    # indices only shift between the old and new position of a moved point
+    windows = []
+    for low, high in sorted(zip(np.minimum(old_rank, new_rank), np.maximum(old_rank, new_rank) + 1)):
+        if windows and low <= windows[-1].stop:
+            windows[-1] = slice(windows[-1].start, max(windows[-1].stop, int(high)))
+        else:
+            windows.append(slice(int(low), int(high)))
+    return new_points.take(rows).retimed(timestamps), windows
+
+
+def suggest_reordering(points, first_half_bin, second_half_bin, output_path, start_index, end_index, diffs_combined_mean, new_points=None, writer=None, segments=None):
+
+    """
+        Get list of indices of bad images, swap their bins, and reperform sort.
+        The bins are updated with `move_between_bins` and, if the current
+        sequence is given, it is updated with `retime_moves` and only the
+        output files whose index or timestamp changed are touched.
+
+        A `segments`-mode sort is corrected segment by segment instead, see
+        `move_between_segments`, and merged again with `retime_segments`;
+        the halves returned are then the first segment and the others
+        sorted together.
+    
+    
+        **Args**:
+    
+        * points (PointTable/list): points to be sorted.
+        * first_half_bin (PointTable/list): first half of points, previously sorted.
+        * second_half_bin (PointTable/list): second half of points, previously sorted.
+        * output_path (str): directory to save sorted images.
+        * start_index (int): index of open slate.
+        * end_index (int): index of end slate.
+        * diffs_combined_mean: statistical assessment of capture frequency
+        * new_points (PointTable/list): sequence currently written to `output_path`; if None the output is fully synced.
+        * writer (callable): if given, syncs the output as `writer(new_points, output_path)` instead.
+        * segments (list[PointTable]): clock segments of a `segments`-mode
+          sort in route order, see `sequence`; they replace the halves and
+          are updated in place.
+    
+        **Returns**:
+    
+        * new_first_half_bin (PointTable): first half of points, newly sorted.
+        * new_second_half_bin (PointTable): second half of points, newly sorted.
+        * new_points (PointTable): merged, retimed points.
+        * bad_images (list): indices of the images that were moved.
+    
+    """
+     
+    
+
+    print("Which images are bad?")
+    bad_images = []
+    while 1:
+        num = input("Enter number, any other char will break >>> ")
+        try: 
+            num = int(num)
+        except ValueError:
+            break
+        bad_images.append(num)
+
+    if segments is not None:
+        bins = [PointTable.from_points(segment) for segment in segments]
+    else:
+        bins = [PointTable.from_points(first_half_bin), PointTable.from_points(second_half_bin)]
+
+    # an image listed twice is still moved only once
+    bad_images = np.unique(np.asarray(bad_images, dtype=np.int64))
+    bounds = np.cumsum([0] + [len(table) for table in bins])
+    out_of_range = bad_images[(bad_images < 0) | (bad_images >= bounds[-1])]
+    if len(out_of_range):
+        warnings.warn(f"Ignoring indices outside the sequence (0-{bounds[-1] - 1}): {out_of_range.tolist()}")
+        bad_images = bad_images[(bad_images >= 0) & (bad_images < bounds[-1])]
+
+    # the sequence holds the bins one after the other
+    moves = [bad_images[(bad_images >= start) & (bad_images < stop)] - start for start, stop in zip(bounds, bounds[1:])]
+    if segments is not None:
+        new_bins, targets = move_between_segments(bins, moves, diffs_combined_mean)
+        segments[:] = new_bins
+    else:
+        new_bins, targets = list(move_between_bins(*bins, *moves)), None
+
+
+    #------------- merge lists -------------#
+    previous_points = new_points
+    open_timestamp = points[start_index].timestamp
+    windows = [slice(0, bounds[-1])]
+    new_points = None
+    if previous_points is not None:
+        new_points, windows = retime_moves(
+            PointTable.from_points(previous_points), bins, new_bins, moves,
+            open_timestamp, diffs_combined_mean, targets=targets,
+        )
+    if new_points is None:
+        new_points = retime_segments(new_bins, open_timestamp, diffs_combined_mean)
+
+    new_first_half_bin = new_bins[0]
+    new_second_half_bin = new_bins[1] if len(new_bins) == 2 else PointTable.concat([new_bins[0].take([])] + new_bins[1:]).sort()
+
+    if writer is not None:
+        writer(new_points, output_path)
+    elif previous_points is None:
+        write_points(new_points, output_path)
+    else:
+        changes = {'rename': [], 'write': [], 'remove': []}
+        for window in windows:
+            for key, value in output_changes(previous_points[window], new_points[window], start=window.start).items():
+                changes[key] += value
+        apply_changes(changes, output_path)
+
+    print(f"END SLATE: {RETIME_END}. Predicted from merge: {new_points[-1].timestamp}")
+
+    return new_first_half_bin, new_second_half_bin, new_points, bad_images.tolist()
+
+
+
+#------------- classes -------------#
+class OnlineSequencer:
+    """
+    Sequencer fed with points while a route is still being read, e.g.
+    from the `on_points` callback of `file_io.load_points`. Points must
+    arrive in load order, one at a time or in chunks. Running cadence
+    statistics are kept on arrival; a provisional two-bin assignment is
+    available as soon as the open slate has arrived, and the final
+    sequence once the end slate has.
+    """
 
-    print(f"END SLATE: {end_time}. Predicted from merge: {new_points[-1].timestamp}")
+    def __init__(self, mode: str = 'legacy'):
+        if mode not in SEQUENCE_MODES:
+            raise ValueError(f"Unknown sequencing mode {mode!r}, expected one of {SEQUENCE_MODES}")
+        self.mode = mode
+        """Sequencing engine, one of `SEQUENCE_MODES`."""
+        self.start_index = None
+        """Load index of the open slate, once it has arrived."""
+        self.end_index = None
+        """Load index of the end slate, once it has arrived."""
+        self._chunks = []
+        self._count = 0
+        self._last_ts = None
+        self._gaps = (0, 0.0, 0.0)  # count, mean, sum of squared deviations
+        self._provisional = None
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def complete(self) -> bool:
+        """
+        Whether both slates have arrived.
+        """
+
+        return self.start_index is not None and self.end_index is not None
+
+    @property
+    def points(self) -> PointTable:
+        """
+        Every point received so far, in load order.
+        """
+
+        if len(self._chunks) > 1:
+            self._chunks = [PointTable.concat(self._chunks)]
+        return self._chunks[0] if self._chunks else PointTable([], [], [], [], [], [])
+
+    @property
+    def cadence(self) -> tuple:
+        """
+        Running (mean, std) of the capture interval, from gaps between
+        consecutive points in load order; see `_gap_stats`.
+        """
+
+        count, mean, m2 = self._gaps
+        if count < 2:
+            return DEFAULT_CADENCE
+        return mean, max((m2 / count) ** 0.5, 1.0)
+
+    def add(self, points):
+        """
+            Receive the next point(s) of the route.
+
+            **Args**:
+
+            * points (Point/PointTable/list): next point or points in load order.
+
+            **Returns**:
+
+            * self (OnlineSequencer): for chaining.
+
+        """
+
+        chunk = PointTable.from_points([points] if isinstance(points, Point) else points)
+        if not len(chunk):
+            return self
+
+        for slate, attribute in (('open', 'start_index'), ('end', 'end_index')):
+            found = np.flatnonzero(chunk.slates == SLATES.index(slate))
+            if len(found):
+                setattr(self, attribute, self._count + int(found[-1]))
+
+        #------------- running cadence -------------#
+        ts = chunk.timestamps if self._last_ts is None else np.concatenate([[self._last_ts], chunk.timestamps])
+        diffs = np.diff(ts)
+        diffs = diffs[diffs > 0]
+        if len(diffs):
+            # same missed-capture cut as `_gap_stats`, against the chunk's own median
+            diffs = diffs[diffs <= 1.5 * np.median(diffs)]
+            count, mean, m2 = self._gaps
+            n, chunk_mean = len(diffs), float(np.mean(diffs))
+            delta = chunk_mean - mean
+            total = count + n
+            self._gaps = (
+                total,
+                mean + delta * n / total,
+                m2 + float(np.sum((diffs - chunk_mean) ** 2)) + delta**2 * count * n / total,
+            )
+
+        self._chunks.append(chunk)
+        self._count += len(chunk)
+        self._last_ts = int(chunk.timestamps[-1])
+        self._provisional = None
+        return self
+
+    def provisional(self):
+        """
+            Current best two-bin assignment. Until the end slate arrives,
+            the latest point stands in for it. The result is cached until
+            more points arrive.
+
+            **Args**:
+
+            * None
+
+            **Returns**:
+
+            * first_half_rows (np.ndarray): load indices assigned to the first half.
+            * second_half_rows (np.ndarray): load indices assigned to the second half.
+            * model (dict): cadence model, see `sequence_bins`.
+
+        """
+
+        if self.start_index is None:
+            raise ValueError("The open slate has not arrived yet")
+        if self._provisional is None:
+            end_index = self.end_index if self.end_index is not None else self._count - 1
+            with warnings.catch_warnings():
+                # warnings about the partial route are expected and repeat with every chunk
+                warnings.simplefilter('ignore')
+                self._provisional = sequence_bins(self.points.timestamps, self.start_index, end_index, mode=self.mode)
+        return self._provisional
+
+    def finalize(self):
+        """
+            Final sequence of the route, see `sequence`.
+
+            **Args**:
+
+            * None
+
+            **Returns**:
 
-    return new_first_half_bin, new_second_half_bin, new_points, bad_images
+            * first_half_bin (PointTable): first half of points, sorted.
+            * second_half_bin (PointTable): second half of points, sorted.
+            * new_points (PointTable): merged, retimed points.
+            * model (dict): cadence model of the engine.
+
+        """
+
+        if not self.complete:
+            raise ValueError("Both slates must arrive before the route can be finalized")
+        return sequence(self.points, self.start_index, self.end_index, mode=self.mode)
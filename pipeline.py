@@ -12,17 +12,24 @@ Notes
 #------------- IMPORTS -------------#
 import os
 import sys
+import time
 import dill
 import typing_filter
 import file_io
 import shutil
 import PandoRoll
-from file_io import reset_output_dir
-from orientation import statistical_sequence, suggest_reordering
+from file_io import prepare_output_dir
+from orientation import sequence, statistical_sequence, suggest_reordering, OnlineSequencer, SEQUENCE_MODES
+from point import PointTable
 
 
 #------------- GLOBAL SETTINGS -------------#
 RedirectorObject = None
+PROVISIONAL_REPORT_INTERVAL = 5.0
+"""Minimum seconds between provisional order reports while images load."""
+EXPORT_MODES = ('copy', 'rolled', 'deferred')
+"""'copy' writes plain JPG copies that PandoRoll rolls afterwards; 'rolled' writes only rolled JPGs, in one pass;
+'deferred' writes plain copies, PandoRoll only records sun offsets and 'Final export' writes the rolled JPGs."""
 
 
 #------------- CLASSES -------------#
@@ -66,9 +73,13 @@ class Redirector(object):
             'Input DNG',
             'Output dir',
             'Load images',
+            'Sequencing mode',
+            'Export mode',
+            'Copy mode',
             'Statistical sort',
             'PandoRoll',
             'Mark bad images',
+            'Final export',
         ]
         """List of short-hand option names for main menu."""
         self.descriptions: list = [
@@ -79,9 +90,13 @@ class Redirector(object):
             'Choose folder location of input DNGs.',
             'Choose folder location to output ordered images.',
             'Load all JPGs, link to corresponding DNG.',
+            'Choose the engine used by the statistical sort.',
+            'Choose how sorted JPGs are exported: copied, rolled in one pass, or rolled once at the final export.',
+            'Choose how files are placed in the output dir: copied, or hard-linked, reflinked or symlinked to the inputs.',
             'Perform initial sort of images using statistical inference.',
             'Roll JPGS so all images have sun centered.',
-            'Mark images in sort as incorrectly sequenced and re-order.'
+            'Mark images in sort as incorrectly sequenced and re-order.',
+            'Write rolled JPGs of the final sequence, applying recorded sun offsets.',
         ]
         """Descriptions for main menu items."""
         self.options_dict: dict = {
@@ -92,9 +107,13 @@ class Redirector(object):
             'Input DNG': self.__choose_input_fpath_dng,
             'Output dir': self.__choose_output_fpath_dir,
             'Load images': self.__load_images,
+            'Sequencing mode': self.__choose_sequence_mode,
+            'Export mode': self.__choose_export_mode,
+            'Copy mode': self.__choose_materialize_mode,
             'Statistical sort': self.__stat_sort,
             'PandoRoll': self.__center_sun,
             'Mark bad images': self.__mark_bad,
+            'Final export': self.__final_export,
         }
         """Switchboard; input from `self.options` converts to pipeline functionality"""
         self.settings = {
@@ -110,6 +129,11 @@ class Redirector(object):
             'bad_images': None,
             'final_list': None,
             'diffs_combined_mean': None,
+            'segments': None,
+            'sequenced': None,
+            'sequence_mode': 'legacy',
+            'export_mode': 'copy',
+            'materialize_mode': file_io.MATERIALIZE_MODE,
         }
         """Settings for current pipeline configuration; saved after each operation"""
 
@@ -156,6 +180,8 @@ class Redirector(object):
 
         with open(input_fpath, "rb") as f:
             self.settings = dill.load(f)
+        # older configurations predate the setting and keep the default
+        file_io.MATERIALIZE_MODE = self.settings.setdefault('materialize_mode', file_io.MATERIALIZE_MODE)
 
         self.loaded_config_file = input_fpath
         bcolors.success(f"Loaded {input_fpath}.")
@@ -298,9 +324,9 @@ class Redirector(object):
         """
         output_fpath = file_io.get_image_dir_fpath()
         self.settings['output_dir'] = output_fpath
-        reset_output_dir(output_fpath)
+        prepare_output_dir(output_fpath)
 
-        input(f"Created new directory at {output_fpath}. Press any key to continue.")
+        input(f"Using output directory {output_fpath}. Press any key to continue.")
         return output_fpath
 
     def __load_images(self):
@@ -318,12 +344,121 @@ class Redirector(object):
         """
          
         
-        loaded_object = file_io.load_points(self.settings['im_fpath_JPG'], self.settings['im_fpath_DNG'])
+        sequencer = OnlineSequencer(self.settings.get('sequence_mode', 'legacy'))
+        report = {'time': time.monotonic(), 'complete': False}
+
+        def _on_points(chunk):
+            ## sequence while the rest of the route is still being read ##
+            sequencer.add(chunk)
+            if sequencer.start_index is None:
+                return
+            slates_arrived = sequencer.complete and not report['complete']
+            if not slates_arrived and time.monotonic() - report['time'] < PROVISIONAL_REPORT_INTERVAL:
+                return
+            first_half_rows, second_half_rows, _ = sequencer.provisional()
+            mean, std = sequencer.cadence
+            print(f"\n{len(sequencer)} images read; provisional split {len(first_half_rows)}/{len(second_half_rows)}, "
+                  f"cadence {mean:.1f} +/- {std:.1f} s.")
+            report.update(time=time.monotonic(), complete=sequencer.complete)
+
+        loaded_object = file_io.load_points(self.settings['im_fpath_JPG'], self.settings['im_fpath_DNG'], on_points=_on_points)
         self.settings['start_index'] = loaded_object['start']
         self.settings['end_index'] = loaded_object['end']
         self.settings['points'] = loaded_object['points']
+
+        ## finish the sequence started while loading, for the statistical sort to reuse ##
+        self.settings['sequenced'] = None
+        if sequencer.complete and (sequencer.start_index, sequencer.end_index, len(sequencer)) == (
+                loaded_object['start'], loaded_object['end'], len(loaded_object['points'])):
+            self.settings['sequenced'] = (sequencer.mode, loaded_object['points'], sequencer.finalize())
         input("Loaded images. Press any key to continue.")
 
+    def __choose_sequence_mode(self):
+        """
+            Choose the sequencing engine used by the statistical sort.
+        
+            **Args**:
+        
+            * None
+        
+            **Returns**:
+        
+            * None
+        
+        """
+
+        for i, mode in enumerate(SEQUENCE_MODES):
+            print(f"{i}: {mode}")
+        try:
+            mode = SEQUENCE_MODES[int(input("Choose sequencing mode >>> "))]
+        except (ValueError, IndexError):
+            bcolors.failure("Invalid choice, keeping current sequencing mode.")
+            return
+
+        self.settings['sequence_mode'] = mode
+        bcolors.success(f"Sequencing mode set to {mode}.")
+
+    def __choose_export_mode(self):
+        """
+            Choose how sorted JPGs are written to the output directory.
+        
+            **Args**:
+        
+            * None
+        
+            **Returns**:
+        
+            * None
+        
+        """
+
+        for i, mode in enumerate(EXPORT_MODES):
+            print(f"{i}: {mode}")
+        try:
+            mode = EXPORT_MODES[int(input("Choose export mode >>> "))]
+        except (ValueError, IndexError):
+            bcolors.failure("Invalid choice, keeping current export mode.")
+            return
+
+        self.settings['export_mode'] = mode
+        bcolors.success(f"Export mode set to {mode}.")
+
+    def __choose_materialize_mode(self):
+        """
+            Choose how sorted files are placed in the output directory, see
+            `file_io.materialize`. Links save the time and space of a copy;
+            modes the filesystem does not support fall back to copying.
+        
+            **Args**:
+        
+            * None
+        
+            **Returns**:
+        
+            * None
+        
+        """
+
+        for i, mode in enumerate(file_io.MATERIALIZE_MODES):
+            print(f"{i}: {mode}")
+        try:
+            mode = file_io.MATERIALIZE_MODES[int(input("Choose copy mode >>> "))]
+        except (ValueError, IndexError):
+            bcolors.failure("Invalid choice, keeping current copy mode.")
+            return
+
+        self.settings['materialize_mode'] = file_io.MATERIALIZE_MODE = mode
+        bcolors.success(f"Copy mode set to {mode}.")
+
+    def __writer(self):
+        """
+            Output writer for the current export mode, or None for the default.
+        """
+
+        if self.settings.get('export_mode', 'copy') == 'rolled':
+            return PandoRoll.export_rolled
+        return None
+
     def __stat_sort(self):
         """
             Perform statistical sort of JPGs and apply transformation to DNGs.
@@ -339,8 +474,19 @@ class Redirector(object):
         """
          
         
-        first_half_bin, second_half_bin, new_points, diffs_combined_mean = statistical_sequence(self.settings['points'], self.settings['start_index'], self.settings['end_index'], self.settings['output_dir'])
-
+        points = PointTable.from_points(self.settings['points'])
+        mode = self.settings.get('sequence_mode', 'legacy')
+        cached = self.settings.get('sequenced')
+        if cached is not None and cached[0] == mode and cached[1] is self.settings['points']:
+            # sequenced when the route was loaded, and neither the route nor the mode changed since
+            sequenced = cached[2]
+        else:
+            sequenced = sequence(points, self.settings['start_index'], self.settings['end_index'], mode=mode)
+        first_half_bin, second_half_bin, new_points, diffs_combined_mean = statistical_sequence(points, self.settings['start_index'], self.settings['end_index'], self.settings['output_dir'], mode=mode, writer=self.__writer(), sequenced=sequenced)
+
+        # 'Mark bad images' corrects a segments-mode sort segment by segment
+        model = sequenced[3]
+        self.settings['segments'] = [points.take(rows) for rows in model['segments']] if 'segments' in model else None
         self.settings['fh_bin'] = first_half_bin
         self.settings['sh_bin'] = second_half_bin
         self.settings['final_list'] = new_points
@@ -361,7 +507,14 @@ class Redirector(object):
         """
          
         
-        PandoRoll.roll_folder_manual(directory=f"{self.settings['output_dir']}/jpgs/")
+        export_mode = self.settings.get('export_mode', 'copy')
+        if export_mode == 'rolled':
+            # the sort already exported rolled JPGs; this only catches up on changed images
+            PandoRoll.export_rolled(self.settings['final_list'], self.settings['output_dir'])
+        elif export_mode == 'deferred':
+            PandoRoll.record_offsets(directory=f"{self.settings['output_dir']}/jpgs")
+        else:
+            PandoRoll.roll_folder_manual(directory=f"{self.settings['output_dir']}/jpgs/")
 
 
     def __mark_bad(self):
@@ -387,7 +540,10 @@ class Redirector(object):
             self.settings['output_dir'],
             self.settings['start_index'],
             self.settings['end_index'],
-            self.settings['diffs_combined_mean']
+            self.settings['diffs_combined_mean'],
+            new_points=self.settings['final_list'],
+            writer=self.__writer(),
+            segments=self.settings.get('segments'),
         )
 
         self.settings['fh_bin'] = first_half_bin
@@ -396,6 +552,27 @@ class Redirector(object):
         self.settings['bad_images'] = bad_images
 
 
+    def __final_export(self):
+        """
+            Write the rolled JPGs of the final sequence in one pass. Sun
+            offsets recorded by PandoRoll are applied without detection,
+            and images already rolled under their final name are skipped.
+        
+            **Args**:
+        
+            * None
+        
+            **Returns**:
+        
+            * None
+        
+        """
+
+        PandoRoll.export_rolled(
+            self.settings['final_list'], self.settings['output_dir'],
+            copy_jpgs=self.settings.get('export_mode', 'copy') != 'rolled',
+        )
+
 
 
 #------------- FUNCTIONS -------------#
@@ -1,12 +1,108 @@
+import threading
+from collections import OrderedDict
 from pathlib import Path
-from datetime import datetime
+from datetime import datetime, timedelta
+import numpy as np
+from PIL import Image
+
+
+_EPOCH = datetime(1970, 1, 1)
+SLATES = (None, 'open', 'end')
+"""Slate values; a point's slate code is its index in this tuple."""
+IMAGE_CACHE_BUDGET = 512 * 2**20
+"""Bytes of decoded images kept by `IMAGE_CACHE`."""
+
+
+def to_seconds(timestamp: datetime) -> int:
+    """
+    Convert a timestamp to integer seconds since the Unix epoch.
+    """
+
+    return (timestamp - _EPOCH) // timedelta(seconds=1)
+
+
+def from_seconds(seconds) -> datetime:
+    """
+    Convert integer seconds since the Unix epoch back to a timestamp.
+    """
+
+    return _EPOCH + timedelta(seconds=int(seconds))
+
+
+def load_image(path: str, reduction: int = 1) -> np.ndarray:
+    """
+    Decode an image as an RGB array at `1/reduction` of its resolution.
+    JPGs are decoded at the reduced size directly (libjpeg's DCT scaling).
+    """
+
+    with Image.open(path) as im:
+        width, height = im.size
+        size = (max(1, width // reduction), max(1, height // reduction))
+        im.draft('RGB', size)
+        im = im.convert('RGB')
+        if im.size != size:
+            im = im.resize(size, Image.Resampling.BOX)
+        return np.asarray(im)
+
+
+class ImageCache:
+    """
+    Least-recently-used cache of decoded images, keyed by path and
+    reduction and bounded by the bytes it holds. Cached arrays are shared
+    between callers, so they are read-only.
+    """
+
+    def __init__(self, budget: int):
+        self.budget = budget
+        """Bytes of images kept before the least recently used are evicted."""
+        self.nbytes = 0
+        """Bytes of images currently held."""
+        self._images = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path: str, reduction: int = 1) -> np.ndarray:
+        """
+        Return an image from the cache, decoding it with `load_image` on a miss.
+        """
+
+        key = (path, reduction)
+        with self._lock:
+            if key in self._images:
+                self._images.move_to_end(key)
+                return self._images[key]
+
+        image = load_image(path, reduction)
+        image.setflags(write=False)
+        with self._lock:
+            if key not in self._images and image.nbytes <= self.budget:
+                self._images[key] = image
+                self.nbytes += image.nbytes
+                while self.nbytes > self.budget:
+                    _, evicted = self._images.popitem(last=False)
+                    self.nbytes -= evicted.nbytes
+        return image
+
+    def clear(self):
+        with self._lock:
+            self._images.clear()
+            self.nbytes = 0
+
+    def __len__(self):
+        return len(self._images)
+
+
+IMAGE_CACHE = ImageCache(IMAGE_CACHE_BUDGET)
+"""Process-wide cache behind `Point.im` and `Point.image`."""
+
 
 class Point:
     """
     Object for manipulating and sequencing images taken on PPS route.
     """
 
-    def __init__(self, timestamp: datetime, fpath: str, dng: str, slate: str | None, im = None):
+    __slots__ = ('timestamp', 'timestamp_old', 'fpath', 'dng', 'slate')
+
+    def __init__(self, timestamp: datetime, fpath: str, dng: str, slate: str | None):
         self.timestamp = timestamp
         """Timestamp corresponding to image."""
         self.timestamp_old = timestamp
@@ -17,8 +113,17 @@ class Point:
         """Folderpath to DNG version of image."""
         self.slate = slate
         """'open' or 'end' slate or None."""
-        self.im = im
-        """Image contents."""
+
+    def __getstate__(self):
+        return {name: getattr(self, name, None) for name in self.__slots__}
+
+    def __setstate__(self, state):
+        # configs saved before `__slots__` pickled a plain `__dict__`; an
+        # `im` stored by older configs is dropped, images are only cached
+        if isinstance(state, tuple):
+            state = {**(state[0] or {}), **state[1]}
+        for name in self.__slots__:
+            setattr(self, name, state.get(name))
 
     @property
     def tag(self):
@@ -27,6 +132,22 @@ class Point:
         """
         return Path(self.fpath).stem
 
+    def image(self, reduction: int = 1) -> np.ndarray:
+        """
+        Image contents as a read-only RGB array at `1/reduction` of full
+        resolution, decoded on first use and kept in `IMAGE_CACHE`. Never
+        stored on the point, so it is not pickled or copied with it.
+        """
+
+        return IMAGE_CACHE.get(self.fpath, reduction)
+
+    @property
+    def im(self):
+        """
+        Image contents at full resolution, see `image`.
+        """
+        return self.image()
+
     def __sub__(self, other):
         """
         Overwrite subtraction method to perform timestamp subtraction
@@ -38,3 +159,210 @@ class Point:
 
         diff = self.timestamp - other.timestamp
         return diff.seconds
+
+
+class PointView:
+    """
+    Lightweight view of one row of a `PointTable` that behaves like a
+    `Point`. Copying a view returns a detached `Point`.
+    """
+
+    __slots__ = ('table', 'row')
+
+    def __init__(self, table, row: int):
+        self.table = table
+        """Table holding the data."""
+        self.row = row
+        """Row of the point within `table`."""
+
+    @property
+    def timestamp(self):
+        return from_seconds(self.table.timestamps[self.row])
+
+    @timestamp.setter
+    def timestamp(self, value):
+        self.table.timestamps[self.row] = to_seconds(value)
+
+    @property
+    def timestamp_old(self):
+        return from_seconds(self.table.timestamps_old[self.row])
+
+    @property
+    def fpath(self):
+        return self.table.paths[self.table.jpg_idx[self.row]]
+
+    @property
+    def dng(self):
+        return self.table.paths[self.table.dng_idx[self.row]]
+
+    @property
+    def slate(self):
+        return SLATES[self.table.slates[self.row]]
+
+    tag = Point.tag
+    image = Point.image
+    im = Point.im
+
+    def __sub__(self, other):
+        if isinstance(other, PointView):
+            return int(self.table.timestamps[self.row] - other.table.timestamps[other.row]) % 86400
+        return (self.timestamp - other.timestamp).seconds
+
+    def to_point(self) -> Point:
+        """
+        Materialize the row as a standalone `Point`.
+        """
+
+        point = Point(self.timestamp_old, self.fpath, self.dng, self.slate)
+        point.timestamp = self.timestamp
+        return point
+
+    def __copy__(self):
+        return self.to_point()
+
+    def __deepcopy__(self, memo):
+        return self.to_point()
+
+    def __repr__(self):
+        return f"PointView({self.tag!r}, {self.timestamp}, slate={self.slate!r})"
+
+
+class PointTable:
+    """
+    Columnar storage for the points of a route. Timestamps are kept as
+    int64 seconds since the epoch, slates as codes into `SLATES`, and
+    paths as indices into a shared, interned path pool, so subsets and
+    retimed copies never duplicate strings.
+    """
+
+    def __init__(self, timestamps, timestamps_old, slates, jpg_idx, dng_idx, paths: list):
+        self.timestamps = np.asarray(timestamps, dtype=np.int64)
+        """Current timestamps, seconds since the epoch."""
+        self.timestamps_old = np.asarray(timestamps_old, dtype=np.int64)
+        """Original (corrupted) timestamps, seconds since the epoch."""
+        self.slates = np.asarray(slates, dtype=np.int8)
+        """Slate codes, indices into `SLATES`."""
+        self.jpg_idx = np.asarray(jpg_idx, dtype=np.int32)
+        """Index of each point's JPG path in `paths`."""
+        self.dng_idx = np.asarray(dng_idx, dtype=np.int32)
+        """Index of each point's DNG path in `paths`."""
+        self.paths = paths
+        """Interned path pool shared between derived tables."""
+
+    @classmethod
+    def from_records(cls, records):
+        """
+        Build a table from `(timestamp, fpath, dng, slate)` tuples.
+        """
+
+        paths, interned = [], {}
+
+        def _intern(path):
+            if path not in interned:
+                interned[path] = len(paths)
+                paths.append(path)
+            return interned[path]
+
+        timestamps, slates, jpg_idx, dng_idx = [], [], [], []
+        for timestamp, fpath, dng, slate in records:
+            timestamps.append(to_seconds(timestamp))
+            slates.append(SLATES.index(slate))
+            jpg_idx.append(_intern(fpath))
+            dng_idx.append(_intern(dng))
+
+        return cls(timestamps, timestamps, slates, jpg_idx, dng_idx, paths)
+
+    @classmethod
+    def from_points(cls, points):
+        """
+        Build a table from `Point` objects (or return `points` if it
+        already is a table).
+        """
+
+        if isinstance(points, cls):
+            return points
+        table = cls.from_records((p.timestamp, p.fpath, p.dng, p.slate) for p in points)
+        table.timestamps_old = np.array([to_seconds(p.timestamp_old) for p in points], dtype=np.int64)
+        return table
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            if key < 0:
+                key += len(self)
+            if not 0 <= key < len(self):
+                raise IndexError("PointTable index out of range")
+            return PointView(self, int(key))
+        return self.take(np.arange(len(self))[key])
+
+    def __iter__(self):
+        return (PointView(self, row) for row in range(len(self)))
+
+    def take(self, indices):
+        """
+        Return a new table with the given rows, sharing the path pool.
+        """
+
+        indices = np.asarray(indices, dtype=np.int64)
+        return PointTable(
+            self.timestamps[indices], self.timestamps_old[indices], self.slates[indices],
+            self.jpg_idx[indices], self.dng_idx[indices], self.paths,
+        )
+
+    @classmethod
+    def concat(cls, tables):
+        """
+        Stack tables row-wise. Tables sharing a path pool keep sharing
+        it; otherwise their paths are re-interned into a new pool.
+        """
+
+        tables = list(tables)
+        pools = {id(table.paths) for table in tables}
+        if len(pools) == 1:
+            paths = tables[0].paths
+            jpg_idx = np.concatenate([table.jpg_idx for table in tables])
+            dng_idx = np.concatenate([table.dng_idx for table in tables])
+        else:
+            paths, interned = [], {}
+            for table in tables:
+                for path in table.paths:
+                    if path not in interned:
+                        interned[path] = len(paths)
+                        paths.append(path)
+            remap = [np.array([interned[path] for path in table.paths], dtype=np.int32) for table in tables]
+            jpg_idx = np.concatenate([r[table.jpg_idx] for r, table in zip(remap, tables)])
+            dng_idx = np.concatenate([r[table.dng_idx] for r, table in zip(remap, tables)])
+
+        return cls(
+            np.concatenate([table.timestamps for table in tables]),
+            np.concatenate([table.timestamps_old for table in tables]),
+            np.concatenate([table.slates for table in tables]),
+            jpg_idx, dng_idx, paths,
+        )
+
+    def sort(self):
+        """
+        Return a copy of the table stably sorted by timestamp.
+        """
+
+        return self.take(np.argsort(self.timestamps, kind='stable'))
+
+    def retimed(self, timestamps):
+        """
+        Return a table with new timestamps that shares every other
+        column with this one.
+        """
+
+        return PointTable(
+            timestamps, self.timestamps_old, self.slates,
+            self.jpg_idx, self.dng_idx, self.paths,
+        )
+
+    def to_points(self) -> list:
+        """
+        Materialize the table as a list of standalone `Point` objects.
+        """
+
+        return [view.to_point() for view in self]
@@ -0,0 +1,217 @@
+"""
+====================================
+Filename:         route_index.py
+Author:           Joseph Farah
+Description:      Persistent on-disk index of route metadata.
+====================================
+Notes
+    - Stored as a SQLite file inside the JPG directory of a route.
+    - Rows are keyed by path and only trusted while the file's size
+      and mtime are unchanged, so reloading a route only reads
+      metadata for new or modified files.
+    - Sun positions found by `PandoRoll` are kept in a second table,
+      keyed by source image rather than path, so they survive the
+      renames of a re-sort.
+"""
+
+#------------- IMPORTS -------------#
+import sqlite3
+import warnings
+from datetime import datetime
+from pathlib import Path
+
+
+#------------- GLOBAL SETTINGS -------------#
+INDEX_FILENAME = '.pando_index.sqlite'
+"""Name of the index file created inside the route's JPG directory."""
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    timestamp TEXT,
+    slate TEXT,
+    pair TEXT
+)
+"""
+
+_SUN_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sun (
+    source TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    params TEXT NOT NULL,
+    x INTEGER,
+    y INTEGER,
+    width INTEGER,
+    height INTEGER,
+    shift INTEGER,
+    rolled_size INTEGER,
+    rolled_mtime_ns INTEGER
+)
+"""
+
+
+#------------- CLASSES -------------#
+class RouteIndex:
+    """
+    Cache of per-file metadata for a route: the extracted timestamp of
+    each DNG, and the slate classification and paired DNG of each JPG.
+    Also caches the sun position and roll offset of each rolled image.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        """Location of the SQLite database, or `:memory:`."""
+        self.conn = sqlite3.connect(db_path)
+        try:
+            self.conn.row_factory = sqlite3.Row
+            self.conn.execute(_SCHEMA)
+            self.conn.execute(_SUN_SCHEMA)
+            self.conn.commit()
+        except sqlite3.Error:
+            self.conn.close()
+            raise
+
+    @classmethod
+    def for_route(cls, jpg_dir: str):
+        """
+        Opens (or creates) the index stored next to a route. Falls back,
+        with a warning, to an in-memory index if the route directory is
+        read-only.
+
+        **Args**:
+            jpg_dir (str): folderpath to directory containing JPGs
+
+        **Returns**:
+            index (RouteIndex): opened index
+        """
+
+        try:
+            return cls(str(Path(jpg_dir) / INDEX_FILENAME))
+        except sqlite3.Error as e:
+            warnings.warn(f"Could not open the route index in {jpg_dir} ({e}); "
+                          "metadata will not be kept between runs")
+            return cls(':memory:')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    def fresh_entries(self, keys: dict) -> dict:
+        """
+        Looks up cached rows that are still valid.
+
+        **Args**:
+            keys (dict): maps path to its current `(size, mtime_ns)`
+
+        **Returns**:
+            entries (dict): maps path to its cached row, for every path
+            whose size and mtime match the cached values
+        """
+
+        entries = {}
+        for row in self.conn.execute("SELECT * FROM files"):
+            key = keys.get(row['path'])
+            if key is not None and key == (row['size'], row['mtime_ns']):
+                entries[row['path']] = row
+        return entries
+
+    def update(self, rows: list, keys: dict):
+        """
+        Replaces cached rows and drops rows for files that no longer exist.
+
+        **Args**:
+            rows (list[dict]): rows with `path` and any of `timestamp`, `slate`, `pair`
+            keys (dict): maps every current path of the route to its `(size, mtime_ns)`
+
+        **Returns**:
+            None
+        """
+
+        def _serialize(row):
+            timestamp = row.get('timestamp')
+            size, mtime_ns = keys[row['path']]
+            return (
+                row['path'], size, mtime_ns,
+                timestamp.isoformat() if timestamp is not None else None,
+                row.get('slate'), row.get('pair'),
+            )
+
+        try:
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)",
+                    [_serialize(row) for row in rows],
+                )
+                stale = [
+                    (row['path'],) for row in self.conn.execute("SELECT path FROM files")
+                    if row['path'] not in keys
+                ]
+                self.conn.executemany("DELETE FROM files WHERE path = ?", stale)
+        except sqlite3.Error:
+            # a read-only route still loads; it just won't be cached
+            pass
+
+    @staticmethod
+    def timestamp(row):
+        """
+        Returns the cached timestamp of a row, or None.
+        """
+
+        return datetime.fromisoformat(row['timestamp']) if row['timestamp'] else None
+
+    def fresh_sun(self, keys: dict, params: str) -> dict:
+        """
+        Looks up cached sun positions that are still valid.
+
+        **Args**:
+            keys (dict): maps source name to the image's current `(size, mtime_ns)`
+            params (str): detection settings the positions must have been found with
+
+        **Returns**:
+            entries (dict): maps source name to its cached row, for every
+            source whose size, mtime and detection settings match
+        """
+
+        entries = {}
+        for row in self.conn.execute("SELECT * FROM sun WHERE params = ?", (params,)):
+            key = keys.get(row['source'])
+            if key is not None and key == (row['size'], row['mtime_ns']):
+                entries[row['source']] = row
+        return entries
+
+    def update_sun(self, rows: list, keys: dict):
+        """
+        Replaces cached sun positions and drops those of images that no
+        longer exist.
+
+        **Args**:
+            rows (list[dict]): rows with every column of the `sun` table
+            keys (dict): maps every current source name to its `(size, mtime_ns)`
+
+        **Returns**:
+            None
+        """
+
+        columns = ('source', 'size', 'mtime_ns', 'params', 'x', 'y', 'width', 'height',
+                   'shift', 'rolled_size', 'rolled_mtime_ns')
+        try:
+            with self.conn:
+                self.conn.executemany(
+                    f"INSERT OR REPLACE INTO sun VALUES ({', '.join('?' * len(columns))})",
+                    [tuple(row[column] for column in columns) for row in rows],
+                )
+                stale = [
+                    (row['source'],) for row in self.conn.execute("SELECT source FROM sun")
+                    if row['source'] not in keys
+                ]
+                self.conn.executemany("DELETE FROM sun WHERE source = ?", stale)
+        except sqlite3.Error:
+            pass
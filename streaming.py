@@ -0,0 +1,386 @@
+"""
+====================================
+Filename:         streaming.py
+Author:           Joseph Farah
+Description:      Streaming read -> process -> write pipeline for per-image work.
+====================================
+Notes
+    - Reader threads prefetch and decode files, worker processes process
+      the frames and writer threads write the results. The stages are
+      connected by queues and bounded by a fixed number of slots, so disk
+      and CPU work overlap without the backlog growing.
+    - Frames reach the workers through a `multiprocessing.shared_memory`
+      ring of fixed-size slots (`FrameRing`). Only slot numbers and small
+      task tuples are pickled; a frame stays in its slot from decode to
+      write and workers may modify it in place. Readers can decode
+      straight into their slot, so a frame is never copied between stages.
+    - The items are split into one contiguous run per worker, and each
+      worker sees its run in input order, so it can carry state from one
+      item to the next (e.g. a `PandoRoll.SunTracker`). Readers take the
+      runs round-robin, so every worker is fed from the start.
+    - Workers send each result straight into their own pipe. A worker
+      that dies only fails the item it was processing; the items queued
+      behind it go to its replacement.
+    - A stream without a process stage (or without frames) runs readers
+      and writers only, e.g. prefetching files ahead of copies.
+"""
+
+#------------- IMPORTS -------------#
+import queue
+import shutil
+import threading
+import traceback
+import numpy as np
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from multiprocessing.connection import wait
+
+
+#------------- GLOBAL SETTINGS -------------#
+STREAM_READERS = 2
+"""Reader threads per stream."""
+STREAM_WRITERS = 2
+"""Writer threads per stream."""
+STREAM_POLL_INTERVAL = 0.5
+"""Seconds between checks for stopped streams and dead worker processes."""
+SHARED_MEMORY_DIR = '/dev/shm'
+"""Filesystem backing `multiprocessing.shared_memory` blocks, where there is one."""
+
+
+#------------- CLASSES -------------#
+class FrameRing:
+    """
+    Fixed-size slots in one shared memory block, for handing frames to
+    worker processes without pickling them. The creating process owns
+    the block and unlinks it on `close`; workers attach by name.
+    """
+
+    def __init__(self, slots: int, slot_bytes: int, name: str = None):
+        self.slots = slots
+        """Number of slots."""
+        self.slot_bytes = slot_bytes
+        """Capacity of each slot in bytes."""
+        self.owner = name is None
+        """Whether this process created (and will unlink) the block."""
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=max(1, slots * slot_bytes))
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def view(self, slot: int, shape: tuple, dtype) -> np.ndarray:
+        """
+        Array of `shape` and `dtype` backed by a slot.
+        """
+
+        dtype = np.dtype(dtype)
+        if int(np.prod(shape)) * dtype.itemsize > self.slot_bytes:
+            raise ValueError(f"Frame of shape {shape} does not fit a {self.slot_bytes}-byte slot")
+        return np.ndarray(shape, dtype, buffer=self.shm.buf, offset=slot * self.slot_bytes)
+
+    def close(self):
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+#------------- FUNCTIONS -------------#
+def shared_memory_free():
+    """
+    Free space for shared memory blocks in bytes, or None where it cannot
+    be determined. A block is only backed when it is written to, so a
+    `FrameRing` larger than this fails with SIGBUS rather than on creation.
+
+    **Args**:
+        None
+
+    **Returns**:
+        free (int): free bytes of `SHARED_MEMORY_DIR`, or None
+    """
+
+    try:
+        return shutil.disk_usage(SHARED_MEMORY_DIR).free
+    except OSError:
+        return None
+
+
+def _lane(ring_name, slots, slot_bytes, process, initializer, inbox, results, running, lane):
+    """
+    Worker process: process tasks from `inbox` in order until a None
+    arrives, sending `(index, result, error)` down the `results` pipe.
+    `running[lane]` holds the index of the task in progress, -1 between
+    tasks.
+    """
+
+    ring = FrameRing(slots, slot_bytes, name=ring_name) if ring_name else None
+    if initializer is not None:
+        initializer()
+    while True:
+        task = inbox.get()
+        if task is None:
+            break
+        index, slot, shape, dtype, item = task
+        running[lane] = index
+        frame = ring.view(slot, shape, dtype) if shape is not None else None
+        try:
+            result = (index, process(frame, item), None)
+        except Exception:
+            result = (index, None, traceback.format_exc())
+        del frame
+        # a pipe has no feeder thread: once sent, the result outlives this process
+        try:
+            results.send(result)
+        except Exception:
+            results.send((index, None, traceback.format_exc()))
+        running[lane] = -1
+    if ring is not None:
+        ring.close()
+    results.close()
+
+
+def _run_order(bounds):
+    """
+    Indices of the runs `[bounds[k], bounds[k + 1])` taken round-robin.
+    """
+
+    runs = [range(start, stop) for start, stop in zip(bounds, bounds[1:])]
+    for step in range(max((len(run) for run in runs), default=0)):
+        for run in runs:
+            if step < len(run):
+                yield run[step]
+
+
+def stream(items, read, write, process=None, readers: int = None, workers: int = 1, writers: int = None,
+           slots: int = None, slot_bytes: int = 0, initializer=None):
+    """
+    Run items through a read -> process -> write pipeline and yield each
+    item as it completes. A failure in any stage is reported for that
+    item and the rest of the stream carries on; a worker process that
+    dies fails the item it was processing and is replaced, and the items
+    queued for it are processed by its replacement.
+
+    **Args**:
+        items (list): items to process; each must be picklable if `process` is given
+        read (callable): `read(item, allocate) -> (frame, meta)` in a reader
+        thread; `allocate(shape, dtype)` returns the item's slot as an array
+        to decode into, and `frame` is that array, another array (copied
+        into the slot) or None
+        write (callable): `write(frame, item, meta, result) -> result` in a
+        writer thread, with `result` from `process` (None without it)
+        process (callable): optional; `process(frame, item) -> result` in a
+        worker process, a module-level function so it can be pickled; each
+        worker gets one contiguous run of the items, in order
+        readers (int): reader threads, defaults to `STREAM_READERS`
+        workers (int): worker processes
+        writers (int): writer threads, defaults to `STREAM_WRITERS`
+        slots (int): items in flight at once, defaults to two per thread and process
+        slot_bytes (int): size of a frame slot; 0 if no frames are passed
+        initializer (callable): optional; called in each worker process on start
+
+    **Yields**:
+        item, result, error: the item, the return value of `write` and the
+        formatted traceback of a failure (None on success)
+    """
+
+    items = list(items)
+    readers = readers or STREAM_READERS
+    writers = writers or STREAM_WRITERS
+    slots = slots or 2 * (readers + writers + (workers if process else 0))
+    ring = FrameRing(slots, slot_bytes) if slot_bytes else None
+
+    free = queue.Queue()
+    for slot in range(slots):
+        free.put(slot)
+    decoded, to_write, done = queue.Queue(), queue.Queue(), queue.Queue()
+    stop = threading.Event()
+    # one contiguous run of items per worker, read round-robin
+    bounds = [len(items) * lane // workers for lane in range(workers + 1)]
+    lane_of = np.repeat(np.arange(workers), np.diff(bounds))
+    cursor = ((index, items[index]) for index in _run_order(bounds))
+    cursor_lock = threading.Lock()
+    pending, in_flight = {}, {}
+
+    ## worker processes, one inbox and one result pipe each ##
+    context = mp.get_context()
+    running = context.RawArray('q', workers) if process is not None else None
+    lanes, inboxes, results, outstanding = [], [], [], []
+    lane_lock = threading.Lock()
+    wake, wake_up = context.Pipe(duplex=False)
+
+    def _start_lane(lane):
+        inbox = context.Queue()
+        receiver, sender = context.Pipe(duplex=False)
+        running[lane] = -1
+        process_ = context.Process(
+            target=_lane, daemon=True,
+            args=(ring.name if ring else None, slots, slot_bytes, process, initializer, inbox, sender, running, lane),
+        )
+        process_.start()
+        sender.close()
+        if lane < len(lanes):
+            lanes[lane], inboxes[lane], results[lane] = process_, inbox, receiver
+        else:
+            lanes.append(process_)
+            inboxes.append(inbox)
+            results.append(receiver)
+            outstanding.append(set())
+
+    def _send(lane, index):
+        slot, shape, dtype, _ = in_flight[index]
+        outstanding[lane].add(index)
+        inboxes[lane].put((index, slot, shape, dtype, items[index]))
+
+    if process is not None:
+        for lane in range(workers):
+            _start_lane(lane)
+
+    def _reader():
+        while not stop.is_set():
+            ## take a slot and the next item together, so slots are handed out in item order ##
+            with cursor_lock:
+                try:
+                    slot = free.get(timeout=STREAM_POLL_INTERVAL)
+                except queue.Empty:
+                    continue
+                entry = next(cursor, None)
+            if entry is None:
+                free.put(slot)
+                return
+            index, item = entry
+
+            def _allocate(shape, dtype):
+                if ring is None:
+                    raise ValueError("the stream has no frame slots")
+                return ring.view(slot, shape, dtype)
+
+            try:
+                frame, meta = read(item, _allocate)
+                shape = dtype = None
+                if frame is not None:
+                    view = _allocate(frame.shape, frame.dtype)
+                    if not np.may_share_memory(view, frame):
+                        view[...] = frame
+                    shape, dtype = frame.shape, frame.dtype.str
+                    del view
+                del frame
+                decoded.put((index, slot, shape, dtype, meta, None))
+            except Exception:
+                decoded.put((index, slot, None, None, None, traceback.format_exc()))
+
+    def _dispatcher():
+        ## release each run's items to its worker in input order ##
+        next_index = bounds[:-1]
+        released = 0
+        while released < len(items) and not stop.is_set():
+            try:
+                entry = decoded.get(timeout=STREAM_POLL_INTERVAL)
+            except queue.Empty:
+                continue
+            pending[entry[0]] = entry
+            lane = lane_of[entry[0]]
+            while next_index[lane] in pending:
+                index, slot, shape, dtype, meta, error = pending.pop(next_index[lane])
+                next_index[lane] += 1
+                released += 1
+                in_flight[index] = (slot, shape, dtype, meta)
+                if error is not None or process is None:
+                    to_write.put((index, None, error))
+                    continue
+                with lane_lock:
+                    _send(lane, index)
+
+    def _receive(lane):
+        ## forward the results a worker has sent to the writers ##
+        while True:
+            try:
+                if not results[lane].poll():
+                    return
+                index, result, error = results[lane].recv()
+            except (EOFError, OSError):
+                return
+            outstanding[lane].discard(index)
+            to_write.put((index, result, error))
+
+    def _replace(lane):
+        ## fail the item a dead worker was processing and requeue the rest ##
+        _receive(lane)
+        dead, lost = lanes[lane], sorted(outstanding[lane])
+        # a worker that died between items is blamed on the next one, so a
+        # worker that cannot start still lets the stream finish
+        crashed = running[lane] if running[lane] in outstanding[lane] else (lost[0] if lost else None)
+        inboxes[lane].cancel_join_thread()
+        inboxes[lane].close()
+        results[lane].close()
+        outstanding[lane] = set()
+        _start_lane(lane)
+        for index in lost:
+            if index == crashed:
+                to_write.put((index, None, f"Worker process exited with code {dead.exitcode}"))
+            else:
+                _send(lane, index)
+
+    def _collector():
+        ## forward worker results to the writers; replace workers that died ##
+        while not stop.is_set():
+            # only this thread replaces workers, so the lists can be read unlocked
+            watched = results + [process_.sentinel for process_ in lanes] + [wake]
+            ready = set(wait(watched, timeout=STREAM_POLL_INTERVAL))
+            if wake in ready:
+                return
+            with lane_lock:
+                for lane, process_ in enumerate(lanes):
+                    if results[lane] in ready:
+                        _receive(lane)
+                    if not process_.is_alive():
+                        _replace(lane)
+
+    def _writer():
+        while True:
+            entry = to_write.get()
+            if entry is None:
+                return
+            index, result, error = entry
+            slot, shape, dtype, meta = in_flight.pop(index)
+            frame = None
+            if error is None:
+                frame = ring.view(slot, shape, dtype) if shape is not None else None
+                try:
+                    result = write(frame, items[index], meta, result)
+                except Exception:
+                    error = traceback.format_exc()
+                del frame
+            free.put(slot)
+            done.put((items[index], result, error))
+
+    threads = [threading.Thread(target=_reader, daemon=True) for _ in range(readers)]
+    threads += [threading.Thread(target=_writer, daemon=True) for _ in range(writers)]
+    threads.append(threading.Thread(target=_dispatcher, daemon=True))
+    if process is not None:
+        threads.append(threading.Thread(target=_collector, daemon=True))
+    for thread in threads:
+        thread.start()
+
+    try:
+        for _ in range(len(items)):
+            yield done.get()
+    finally:
+        stop.set()
+        for _ in range(writers):
+            to_write.put(None)
+        wake_up.send(None)
+        for thread in threads:
+            thread.join()
+        ## only stop the workers once the collector can no longer replace them ##
+        for inbox in inboxes:
+            inbox.put(None)
+        for process_ in lanes:
+            process_.join(timeout=STREAM_POLL_INTERVAL)
+            if process_.is_alive():
+                process_.terminate()
+        for connection in results + [wake, wake_up]:
+            connection.close()
+        if ring is not None:
+            ring.close()
@@ -0,0 +1,92 @@
+"""
+    Tests of the `segments` sequencing engine on synthetic routes from
+    `bench_sequencing`.
+"""
+
+import io
+import contextlib
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import orientation
+from bench_sequencing import synthetic_route, score
+from point import PointTable
+
+
+def _sequence(n, segments, jitter, seed=0):
+    route = synthetic_route(n, jitter=jitter, segments=segments, seed=seed)
+    table = PointTable.from_points(route['points'])
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = orientation.sequence(table, route['start'], route['end'], mode='segments')
+    return route, table, result
+
+
+@pytest.mark.parametrize('segments', [3, 4])
+def test_segments_at_high_jitter(segments):
+    route, table, (first_half_bin, _, new_points, model) = _sequence(10000, segments, jitter=10.0)
+
+    assert len(model['segments']) == segments
+    scores = score(route, table, first_half_bin, new_points)
+    assert scores['bin_errors'] < 0.01 * len(table)
+    assert scores['order_errors'] < 0.02 * len(table)
+
+
+@pytest.mark.parametrize('segments', [3, 4])
+def test_segments_on_short_routes(segments):
+    for seed in range(5):
+        route, table, (first_half_bin, _, new_points, model) = _sequence(100, segments, jitter=5.0, seed=seed)
+        assert len(model['segments']) == segments
+        assert score(route, table, first_half_bin, new_points)['exact']
+
+
+def _mark_bad(monkeypatch, table, route, bins, new_points, model, indices, segments=None):
+    answers = iter([str(i) for i in indices] + ['q'])
+    monkeypatch.setattr('builtins.input', lambda prompt='': next(answers))
+    written = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = orientation.suggest_reordering(
+            table, *bins, None, route['start'], route['end'], model['combined_mean'],
+            new_points=new_points, writer=lambda points, path: written.append(points), segments=segments,
+        )
+    assert len(written) == 1 and written[0] is result[2]
+    return result
+
+
+@pytest.mark.parametrize('segments', [3, 4])
+def test_mark_bad_on_segments(monkeypatch, segments):
+    route, table, (first_half_bin, second_half_bin, new_points, model) = _sequence(3000, segments, jitter=10.0)
+    assert np.all(np.diff(second_half_bin.timestamps) >= 0)
+    before = score(route, table, first_half_bin, new_points)['order_errors']
+
+    ## mark one image of the second segment, then mark it again to undo ##
+    clock = [table.take(rows) for rows in model['segments']]
+    index = len(clock[0]) + len(clock[1]) // 2
+    path = new_points[index].fpath
+    fh, sh, retimed, bad = _mark_bad(monkeypatch, table, route, (first_half_bin, second_half_bin), new_points, model, [index], clock)
+
+    assert bad == [index]
+    assert len(fh) + len(sh) == len(retimed) == len(table) == sum(len(segment) for segment in clock)
+    # one misplaced image breaks at most a few neighbouring pairs
+    assert score(route, table, fh, retimed)['order_errors'] <= before + 3
+
+    index = [point.fpath for point in retimed].index(path)
+    fh, sh, restored, _ = _mark_bad(monkeypatch, table, route, (fh, sh), retimed, model, [index], clock)
+    assert score(route, table, fh, restored)['order_errors'] == before
+    assert [point.fpath for point in restored] == [point.fpath for point in new_points]
+
+
+def test_mark_bad_on_two_bins(monkeypatch):
+    route, table, (first_half_bin, second_half_bin, new_points, model) = _sequence(300, 2, jitter=10.0)
+
+    indices = [3, len(first_half_bin) + 5]
+    fh, sh, retimed, bad = _mark_bad(monkeypatch, table, route, (first_half_bin, second_half_bin), new_points, model, indices)
+
+    assert bad == indices
+    assert (len(fh), len(sh)) == (len(first_half_bin), len(second_half_bin))
+    assert np.all(np.diff(fh.timestamps) >= 0) and np.all(np.diff(sh.timestamps) >= 0)
+    assert np.all(np.diff(retimed.timestamps) >= 0)
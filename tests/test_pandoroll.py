@@ -0,0 +1,39 @@
+"""
+    Tests of `PandoRoll.SunTracker` on synthetic frames.
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import PandoRoll
+
+
+WIDTH, HEIGHT = 960, 480
+
+
+def _frame(rng, x, y, peak):
+    # a Gaussian sun over a bright, noisy sky
+    yy, xx = np.mgrid[0:HEIGHT, 0:WIDTH]
+    dx = np.minimum(np.abs(xx - x), WIDTH - np.abs(xx - x))
+    sun = np.exp(-(dx**2 + (yy - y) ** 2) / (2 * 20**2)) * (peak - 80)
+    return np.clip(70 + rng.random((HEIGHT, WIDTH)) * 20 + sun, 0, 255).astype(np.uint8)
+
+
+def test_tracker_recovers_after_dimming():
+    rng = np.random.default_rng(1)
+    tracker = PandoRoll.SunTracker()
+    searched = []
+    for i in range(40):
+        x, y = (100 + 20 * i) % WIDTH, 150 + 2 * i
+        before = tracker.searched
+        location = tracker.locate(_frame(rng, x, y, 255 if i < 10 else 110), radius=51)
+        searched.append(tracker.searched > before)
+        # within half the width of the sun
+        assert abs(location[0] - x) <= 10 and abs(location[1] - y) <= 10
+
+    # the first frame and the first dimmed frame need a full search, then tracking resumes
+    assert np.flatnonzero(searched).tolist() == [0, 10]